@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib import admin
+from django.utils import timezone
 
 from . import models
 
@@ -19,7 +20,7 @@ class ServerAdmin(admin.ModelAdmin):
 
     @staticmethod
     def approve_authors(self, request, queryset):
-        queryset.update(is_approved=True)
+        queryset.update(is_approved=True, modified=timezone.now())
 
         # Override get_actions to replace the 'delete_selected' action
 
@@ -39,9 +40,40 @@ class ServerAdmin(admin.ModelAdmin):
             obj.user.delete()
 
 
+class NodeAdmin(admin.ModelAdmin):
+    list_display = ["host", "enabled", "circuit", "error_rate", "latency_ms"]
+    list_filter = ["enabled"]
+    actions = ["reset_circuits"]
+
+    # breaker state lives in the process serving the admin page, see api.federation
+
+    @admin.display(description="circuit")
+    def circuit(self, node):
+        breaker = node.client.breaker.snapshot()
+        if breaker["state"] == "open":
+            return f"open (retry in {breaker['retry_after']:.0f}s)"
+        return breaker["state"]
+
+    @admin.display(description="error rate")
+    def error_rate(self, node):
+        return node.client.breaker.snapshot()["error_rate"]
+
+    @admin.display(description="latency (ms)")
+    def latency_ms(self, node):
+        return node.client.breaker.snapshot()["latency_ms"]
+
+    @admin.action(description="Close the circuits of the selected nodes")
+    def reset_circuits(self, request, queryset):
+        for node in queryset:
+            node.client.breaker.reset()
+
+
 admin.site.register(models.Author, ServerAdmin)
 admin.site.register(models.Comment)
+admin.site.register(models.Friendship)
 admin.site.register(models.Like)
-admin.site.register(models.Node)
+admin.site.register(models.Node, NodeAdmin)
 admin.site.register(models.Notification)
+admin.site.register(models.InboxActivity)
+admin.site.register(models.OutboxItem)
 admin.site.register(models.Post)
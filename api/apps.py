@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from .remote_cache import ensure_cache_table
+        from .search import ensure_index
+
+        post_migrate.connect(ensure_index, sender=self)
+        post_migrate.connect(ensure_cache_table, sender=self)
@@ -0,0 +1,78 @@
+"""
+Conditional GET support.
+
+Validators (a weak ETag and Last-Modified) are derived from the `modified` timestamps of the rows a
+response is built from, so that If-None-Match / If-Modified-Since requests for unchanged resources are
+answered with 304 before anything is serialized. A page of a list is validated from the rows of the
+page, which are fetched anyway, so that rows entering or leaving the page change its ETag.
+
+Note that QuerySet.update() and bulk_update() do not bump `modified` by themselves.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from typing import NamedTuple
+
+from django.db.models import Model
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: datetime | None
+
+
+def _validators(request, parts: list, last_modified: datetime | None) -> Validators:
+    # the representation depends on the URL (pagination) and the negotiated format
+    parts = [request.get_full_path(), request.headers.get("Accept", ""), *parts]
+    digest = hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+    return Validators(f'W/"{digest}"', last_modified)
+
+
+def _row_parts(rows: list[Model]) -> list[str]:
+    return [f"{type(row).__name__}:{row.pk}:{row.modified.isoformat()}" for row in rows]
+
+
+def object_validators(request, *objects: Model) -> Validators:
+    """
+    Validators for a response built from these rows, e.g. a post and its author.
+    """
+    return _validators(request, _row_parts(list(objects)), max(obj.modified for obj in objects))
+
+
+def page_validators(request, rows, related: tuple[str, ...] = ()) -> Validators:
+    """
+    Validators for a page built from these rows (in order) and the rows they refer to through the
+    `related` foreign keys, e.g. a page of posts and their authors. Pages only get an ETag: a row
+    leaving the page does not make anything newer, so Last-Modified could not reflect it.
+    """
+    rows = list(rows)
+    rows += [getattr(row, field) for row in list(rows) for field in related]
+    return _validators(request, _row_parts(rows), None)
+
+
+def not_modified(request, validators: Validators) -> HttpResponse | None:
+    """
+    The 304 (or 412) response when the request's preconditions say the client's copy is current.
+    """
+    last_modified = validators.last_modified
+    response = get_conditional_response(
+        request,
+        etag=validators.etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        with_validators(response, validators)
+    return response
+
+
+def with_validators(response, validators: Validators):
+    response["ETag"] = validators.etag
+    if validators.last_modified is not None:
+        response["Last-Modified"] = http_date(validators.last_modified.timestamp())
+    patch_vary_headers(response, ("Accept", "Authorization"))
+    return response
@@ -0,0 +1,26 @@
+"""
+Turns failures to reach another node into gateway errors rather than 500s.
+"""
+
+import math
+
+import requests
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from .federation import BulkheadFullError, CircuitOpenError
+
+
+def exception_handler(exc, context):
+    if isinstance(exc, (CircuitOpenError, BulkheadFullError)):
+        return Response(
+            {"error": f"Remote node temporarily unavailable: {exc}"},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+        )
+    elif isinstance(exc, requests.Timeout):
+        return Response({"error": f"Remote node timed out: {exc}"}, status=status.HTTP_504_GATEWAY_TIMEOUT)
+    elif isinstance(exc, requests.RequestException):
+        return Response({"error": f"Unable to reach remote node: {exc}"}, status=status.HTTP_502_BAD_GATEWAY)
+    return drf_exception_handler(exc, context)
@@ -0,0 +1,137 @@
+"""
+Read-only, plain-dict serialization for hot GET paths.
+
+These functions produce exactly the same output as AuthorSerializer, PostSerializer, CommentSerializer
+and LikeSerializer, without going through DRF's per-field machinery. The serializers remain the source
+of truth (and handle writes); any change to them must be mirrored here, which the parity tests enforce.
+"""
+
+from __future__ import annotations
+
+from django.utils import timezone
+
+from web_dev_noobs_be.settings import SRV_URL
+from .models import Author, Comment, Like, Post
+
+LOCAL_HOST = SRV_URL + "/"
+AUTHORS_URL = f"{SRV_URL}/api/authors/"
+
+CONTENT_TYPES = {content_type.value: content_type.to_display() for content_type in Post.ContentType}
+VISIBILITIES = {visibility.value: visibility.label for visibility in Post.Visibility}
+
+
+def _datetime(value) -> str | None:
+    # mirrors rest_framework.fields.DateTimeField.to_representation with the default ISO 8601 format
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+def _str(value) -> str | None:
+    return None if value is None else str(value)
+
+
+def author_to_dict(author: Author) -> dict:
+    node = author.node
+    if node is not None:
+        host = node.host
+        display_name = author.remote_name
+    else:
+        host = LOCAL_HOST
+        display_name = author.user.username
+    author_id = f"{host}api/authors/{author.id.hex}"
+    return {
+        "type": "author",
+        "id": author_id,
+        "host": host,
+        "displayName": display_name,
+        "url": author_id,
+        "github": _str(author.github),
+        "profileImage": _str(author.profile_image),
+    }
+
+
+def post_to_dict(post: Post) -> dict:
+    post_id = f"{AUTHORS_URL}{post.author_id.hex}/posts/{post.uuid.hex}"
+    return {
+        "type": "post",
+        "title": _str(post.title),
+        "id": post_id,
+        "source": post.source if post.source != "" else post_id,
+        "origin": post.origin if post.origin != "" else post_id,
+        "description": _str(post.description),
+        "contentType": CONTENT_TYPES[post.content_type],
+        "content": _str(post.wire_content()),
+        "image": post.image_url(),
+        "author": author_to_dict(post.author),
+        "count": post.comment_count,
+        "likeCount": post.like_count,
+        "commentCount": post.comment_count,
+        "comments": f"{post_id}/comments",
+        "published": _datetime(post.published),
+        "visibility": VISIBILITIES[post.visibility],
+    }
+
+
+def comment_to_dict(comment: Comment) -> dict:
+    return {
+        "type": "comment",
+        "author": author_to_dict(comment.author),
+        "comment": _str(comment.comment),
+        "contentType": _str(comment.content_type),
+        "published": _datetime(comment.published),
+        "id": f"{AUTHORS_URL}{comment.author_id.hex}/posts/{comment.post_id.hex}/comments/{comment.uuid.hex}",
+        "likeCount": comment.like_count,
+    }
+
+
+def like_to_dict(like: Like, object_url: str | None) -> dict:
+    return {
+        "summary": like.summary(),
+        "type": "Like",
+        "author": author_to_dict(like.author),
+        "object": object_url,
+    }
+
+
+def likes_to_dicts(likes) -> list[dict]:
+    """
+    Effects: DB (one query per liked object type)
+    """
+    likes = list(likes)
+    object_urls = Like.object_urls(likes)
+    return [like_to_dict(like, object_urls[like.pk]) for like in likes]
+
+
+def notifications_to_dicts(notifications) -> list[dict]:
+    """
+    The items of an inbox: stored payloads as they are, references hydrated with the posts, comments and
+    likes they refer to. References to deleted objects are left out.
+    Effects: DB (one query per referenced object type, plus those of likes_to_dicts)
+    """
+    notifications = list(notifications)
+    wanted = {"post": set(), "comment": set(), "like": set()}
+    for notification in notifications:
+        if notification.data is None and notification.object_type in wanted:
+            wanted[notification.object_type].add(notification.object_id)
+
+    related = ("author__user", "author__node")
+    objects = {
+        "post": {post.uuid: post_to_dict(post)
+                 for post in Post.objects.filter(uuid__in=wanted["post"]).select_related(*related)},
+        "comment": {comment.uuid: comment_to_dict(comment)
+                    for comment in Comment.objects.filter(uuid__in=wanted["comment"]).select_related(*related)},
+    }
+    likes = list(Like.objects.filter(id__in=wanted["like"]).select_related(*related))
+    objects["like"] = {like.id: item for like, item in zip(likes, likes_to_dicts(likes))}
+
+    items = []
+    for notification in notifications:
+        if notification.data is not None:
+            items.append(notification.data)
+        elif notification.object_id in objects.get(notification.object_type, {}):
+            items.append(objects[notification.object_type][notification.object_id])
+    return items
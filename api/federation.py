@@ -0,0 +1,378 @@
+"""
+HTTP clients for talking to other nodes.
+
+Every node gets its own pooled keep-alive session with connect/read timeouts, bounded retries with
+exponential backoff and compressed responses, so that a slow peer can never hold a worker forever.
+Fan-outs to many nodes run concurrently through `gather_calls`, whose deadline also bounds the timeouts
+of the requests its calls make, so that calls which missed it do not keep their threads busy.
+
+Each node client also has a circuit breaker and a bulkhead: once too many recent calls to a node
+failed or were slow, calls fail fast with CircuitOpenError until a cooldown has passed and a trial
+call succeeds, and at most FEDERATION_NODE_INFLIGHT requests to a node are in flight at once.
+Both errors are `requests` exceptions, so existing error handling covers them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """
+    The node failed too often recently, so it was not contacted.
+    """
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"circuit to {host} is open")
+        self.retry_after = retry_after
+
+
+class BulkheadFullError(requests.ConnectionError):
+    """
+    Too many requests to the node are already in flight.
+    """
+
+    retry_after = 1
+
+
+class CircuitBreaker:
+    """
+    Health of a single node, from the outcomes of its last FEDERATION_BREAKER_WINDOW calls.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, host: str | None):
+        self.host = host
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.outcomes = deque(maxlen=settings.FEDERATION_BREAKER_WINDOW)
+            self.opened_at = None
+            self.trial_running = False
+            self.latency = None
+
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self.opened_at >= settings.FEDERATION_BREAKER_COOLDOWN
+
+    def available(self) -> bool:
+        """
+        Whether a call would currently be let through, without claiming the half-open trial call.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                return self._cooled_down()
+            return self.state == self.CLOSED or not self.trial_running
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and self._cooled_down():
+                self.state = self.HALF_OPEN
+                self.trial_running = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record(self, ok: bool, elapsed: float):
+        ok = ok and elapsed < settings.FEDERATION_SLOW_CALL
+        with self._lock:
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            if self.state == self.HALF_OPEN:
+                self.trial_running = False
+                if ok:
+                    self.state = self.CLOSED
+                    self.outcomes.clear()
+                else:
+                    self._open()
+                return
+
+            self.outcomes.append(ok)
+            failures = self.outcomes.count(False)
+            if (len(self.outcomes) >= settings.FEDERATION_BREAKER_MIN_CALLS
+                    and failures / len(self.outcomes) >= settings.FEDERATION_BREAKER_THRESHOLD):
+                self._open()
+
+    def _open(self):
+        if self.state != self.OPEN:
+            logger.warning(f"opening the circuit to {self.host}")
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0
+            return max(0.0, settings.FEDERATION_BREAKER_COOLDOWN - (time.monotonic() - self.opened_at))
+
+    def snapshot(self) -> dict:
+        retry_after = self.retry_after()
+        with self._lock:
+            calls = len(self.outcomes)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "error_rate": round(self.outcomes.count(False) / calls, 2) if calls else None,
+                "latency_ms": round(1000 * self.latency, 2) if self.latency is not None else None,
+                "retry_after": round(retry_after, 2),
+            }
+
+
+class NodeClient:
+    """
+    A pooled session for a single node (or for ad-hoc URLs, when `host` is None).
+    """
+
+    def __init__(self, host: str | None = None):
+        self.host = host
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip, deflate"
+
+        retries = Retry(
+            total=settings.FEDERATION_RETRIES,
+            backoff_factor=settings.FEDERATION_BACKOFF,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.FEDERATION_POOL_SIZE,
+            pool_block=False,
+            max_retries=retries,
+        )
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        # requests under a deadline (see gather_calls) have no time left for retries
+        self.deadline_session = requests.Session()
+        self.deadline_session.headers["Accept-Encoding"] = "gzip, deflate"
+        self.deadline_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.FEDERATION_POOL_SIZE,
+                                            pool_block=False, max_retries=0)
+        self.deadline_session.mount("http://", self.deadline_adapter)
+        self.deadline_session.mount("https://", self.deadline_adapter)
+
+        self.breaker = CircuitBreaker(host)
+        self._inflight = threading.BoundedSemaphore(settings.FEDERATION_NODE_INFLIGHT)
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", (settings.FEDERATION_CONNECT_TIMEOUT, settings.FEDERATION_READ_TIMEOUT))
+        session = self.session
+        remaining = remaining_time()
+        if remaining is not None:
+            if remaining <= 0:
+                raise requests.Timeout(f"deadline passed before the request to {self.host or url}")
+            kwargs["timeout"] = _capped(kwargs["timeout"], remaining)
+            session = self.deadline_session
+        if not self._inflight.acquire(timeout=settings.FEDERATION_BULKHEAD_WAIT):
+            raise BulkheadFullError(f"too many requests in flight to {self.host or url}")
+        # ad-hoc URLs (host None) do not share a health, so they are not guarded by the breaker
+        if self.host is not None and not self.breaker.allow():
+            self._inflight.release()
+            raise CircuitOpenError(self.host, self.breaker.retry_after())
+
+        ok = False
+        start = time.monotonic()
+        try:
+            response = session.request(method, url, **kwargs)
+            ok = response.status_code < 500
+            return response
+        except requests.RequestException:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            self._inflight.release()
+            elapsed = time.monotonic() - start
+            if self.host is not None:
+                self.breaker.record(ok, elapsed)
+            with self._lock:
+                self.requests += 1
+                self.total_time += elapsed
+
+    def get(self, url: str, params=None, **kwargs) -> requests.Response:
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url: str, data=None, json=None, **kwargs) -> requests.Response:
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def put(self, url: str, data=None, **kwargs) -> requests.Response:
+        return self.request("PUT", url, data=data, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def stats(self) -> dict:
+        pools = []
+        for manager in (self.adapter.poolmanager, self.deadline_adapter.poolmanager):
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                pools.append({
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "connections": pool.num_connections,
+                    "requests": pool.num_requests,
+                    "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                })
+        with self._lock:
+            return {
+                "host": self.host,
+                "requests": self.requests,
+                "errors": self.errors,
+                "avg_ms": round(1000 * self.total_time / self.requests, 2) if self.requests else None,
+                "pools": pools,
+                "breaker": self.breaker.snapshot(),
+            }
+
+    def close(self):
+        self.session.close()
+        self.deadline_session.close()
+
+
+_clients: dict[str | None, NodeClient] = {}
+_clients_lock = threading.Lock()
+
+
+def client_for(host: str | None = None) -> NodeClient:
+    """
+    The shared client for a node host, or for URLs that do not belong to a known node.
+    """
+    client = _clients.get(host)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(host)
+            if client is None:
+                client = _clients[host] = NodeClient(host)
+    return client
+
+
+def pool_stats() -> list[dict]:
+    return [client.stats() for client in list(_clients.values())]
+
+
+def reset_clients():
+    """
+    Close every pooled connection, e.g. after node settings change.
+    """
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+_executor = ThreadPoolExecutor(max_workers=settings.FEDERATION_MAX_WORKERS, thread_name_prefix="federation")
+_deadline = threading.local()
+
+
+def remaining_time() -> float | None:
+    """
+    Seconds left until the deadline of the `gather_calls` the current thread runs a call for, or None.
+    """
+    until = getattr(_deadline, "until", None)
+    return None if until is None else until - time.monotonic()
+
+
+def _capped(timeout, remaining: float):
+    # timeouts are seconds or (connect, read) pairs
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def _in_worker(call: Callable[[], T]) -> Callable[[], T]:
+    # calls use the database (and a database cache) from pool threads, which Django's request cycle never
+    # cleans up after, so close their connections once expired or broken like it would
+    def run():
+        close_old_connections()
+        try:
+            return call()
+        finally:
+            close_old_connections()
+    return run
+
+
+def _until(call: Callable[[], T], until: float) -> Callable[[], T]:
+    def run():
+        _deadline.until = until
+        try:
+            return call()
+        finally:
+            _deadline.until = None
+    return run
+
+
+async def _gather(jobs: list[tuple[str | None, Callable[[], T]]], per_node: int, deadline: float) -> list[T | None]:
+    loop = asyncio.get_running_loop()
+    semaphores: dict[str | None, asyncio.Semaphore] = {}
+    until = time.monotonic() + deadline
+
+    async def run(host, call):
+        semaphore = semaphores.setdefault(host, asyncio.Semaphore(per_node))
+        async with semaphore:
+            return await loop.run_in_executor(_executor, _in_worker(_until(call, until)))
+
+    tasks = [asyncio.ensure_future(run(host, call)) for host, call in jobs]
+    done, pending = await asyncio.wait(tasks, timeout=deadline)
+    for task in pending:
+        task.cancel()
+
+    results = []
+    for (host, _), task in zip(jobs, tasks):
+        if task not in done:
+            logger.warning(f"federation call to {host} missed the {deadline}s deadline")
+            results.append(None)
+        elif task.exception() is not None:
+            logger.warning(f"federation call to {host} failed: {task.exception()!r}")
+            results.append(None)
+        else:
+            results.append(task.result())
+    return results
+
+
+def run_in_background(call: Callable[[], T]) -> Future:
+    """
+    Run a blocking call on the federation worker pool without waiting for it.
+    """
+    return _executor.submit(_in_worker(call))
+
+
+def gather_calls(jobs: list[tuple[str | None, Callable[[], T]]], deadline: float | None = None) -> list[T | None]:
+    """
+    Run blocking federation calls concurrently and return their results in order.
+    Each job is a (node host, callable) pair; at most FEDERATION_NODE_CONCURRENCY calls run against the
+    same host at once, and everything must finish within `deadline` seconds (FEDERATION_FANOUT_DEADLINE
+    by default). Calls that fail or miss the deadline produce None. The requests the calls make through
+    node clients time out at the deadline, or fail right away once it has passed.
+    """
+    if not jobs:
+        return []
+    if deadline is None:
+        deadline = settings.FEDERATION_FANOUT_DEADLINE
+    return asyncio.run(_gather(jobs, settings.FEDERATION_NODE_CONCURRENCY, deadline))
@@ -0,0 +1,39 @@
+"""
+Query builders for post feeds.
+
+Visibility rules are expressed as SQL filters so that a page of a feed is
+produced by a single bounded query, no matter how many posts exist.
+"""
+
+from __future__ import annotations
+
+from django.db.models import Q, QuerySet
+
+from .models import Author, Friendship, Post
+
+
+def visible_posts(viewer: Author | None) -> QuerySet[Post]:
+    """
+    All posts the viewer may see in the global feed: public posts, friends-only posts of friends and
+    every post of their own. Anonymous viewers (None) only see public posts.
+    """
+
+    posts = Post.objects.select_related("author__user", "author__node")
+    if viewer is None:
+        return posts.filter(visibility=Post.Visibility.PUBLIC)
+
+    return posts.filter(
+        Q(visibility=Post.Visibility.PUBLIC)
+        | Q(author=viewer)
+        | (Q(visibility=Post.Visibility.FRIENDS) & Friendship.friends_filter(viewer))
+    )
+
+
+def feed_page(viewer: Author | None, page: int, size: int) -> list[Post]:
+    """
+    A single 1-indexed page of the viewer's feed, newest first.
+    Effects: DB (one query)
+    """
+
+    offset = (page - 1) * size
+    return list(visible_posts(viewer).order_by("-published", "-uuid")[offset:offset + size])
@@ -0,0 +1,321 @@
+"""
+Content-addressed storage for the images of image posts.
+
+Image bytes are stored once under their SHA-256 digest, so identical images are stored once and a
+stored image never changes. Posts only keep the digest (`Post.image_hash`); the base64 wire format is
+produced from the stored image when a post is serialized.
+
+The durable copy is a StoredImage row. IMAGE_STORE_DIR only caches images on the local disk, which
+may be ephemeral and is not shared between processes on different machines (e.g. Heroku dynos): a
+missing file is written again from the database on first use.
+
+Resized variants (`image_variant`) are generated on demand into IMAGE_VARIANT_DIR, for the widths in
+IMAGE_VARIANT_WIDTHS only. That directory is a cache: it is kept under IMAGE_VARIANT_MAX_BYTES by
+evicting the least recently served variants. Each process counts the bytes it writes and only scans the
+directory when its count goes over the limit; eviction then leaves VARIANT_HEADROOM of the limit free,
+for what other processes write before they scan again. Variants need Pillow; without it the original
+is served.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotFound, HttpResponseNotModified
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# share of IMAGE_VARIANT_MAX_BYTES left free by an eviction
+VARIANT_HEADROOM = 0.1
+
+
+class ImageMissing(FileNotFoundError):
+    """
+    Neither the database nor the local disk has the image.
+    """
+
+
+def image_path(digest: str) -> Path:
+    return Path(settings.IMAGE_STORE_DIR) / digest[:2] / digest
+
+
+def _stored_images():
+    # looked up lazily, api.models imports this module
+    return apps.get_model("api", "StoredImage").objects
+
+
+def _write_atomically(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # write to a temporary file first so that a half-written image is never served
+    fd, tmp = tempfile.mkstemp(dir=path.parent)
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def store_image(data: bytes) -> str:
+    """
+    Store image bytes, returning their digest.
+    Effects: DB and filesystem (only when the image is not stored yet)
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    stored = _stored_images()
+    if not stored.filter(digest=digest).exists():
+        stored.bulk_create([stored.model(digest=digest, data=data)], ignore_conflicts=True)
+    path = image_path(digest)
+    if not path.exists():
+        _write_atomically(path, data)
+    return digest
+
+
+def local_image(digest: str) -> Path:
+    """
+    The file of a stored image on the local disk, written from the database if it is not there.
+    Effects: DB and filesystem (only when the file is missing)
+    """
+    path = image_path(digest)
+    if path.exists():
+        return path
+    data = _stored_images().filter(digest=digest).values_list("data", flat=True).first()
+    if data is None:
+        raise ImageMissing(digest)
+    _write_atomically(path, bytes(data))
+    return path
+
+
+def load_image(digest: str) -> bytes:
+    """
+    Effects: DB and filesystem (only when the file is missing)
+    """
+    return local_image(digest).read_bytes()
+
+
+_base64_cache: OrderedDict[str, str] = OrderedDict()
+_base64_lock = threading.Lock()
+
+
+def image_base64(digest: str) -> str:
+    """
+    The base64 encoding of a stored image. Stored images never change, so the most recently used
+    encodings are cached by digest, up to IMAGE_BASE64_CACHE_BYTES per process.
+    Effects: DB and filesystem (only when the file is missing)
+    """
+    with _base64_lock:
+        if digest in _base64_cache:
+            _base64_cache.move_to_end(digest)
+            return _base64_cache[digest]
+
+    encoded = base64.b64encode(load_image(digest)).decode()
+    limit = settings.IMAGE_BASE64_CACHE_BYTES
+    if len(encoded) <= limit:
+        with _base64_lock:
+            _base64_cache[digest] = encoded
+            total = sum(map(len, _base64_cache.values()))
+            while total > limit:
+                _, evicted = _base64_cache.popitem(last=False)
+                total -= len(evicted)
+    return encoded
+
+
+def variant_path(digest: str, width: int) -> Path:
+    return Path(settings.IMAGE_VARIANT_DIR) / digest[:2] / f"{digest}-{width}"
+
+
+def variant_width(requested: int) -> int:
+    """
+    The smallest configured variant width that is at least `requested` (or the largest one).
+    """
+    widths = sorted(settings.IMAGE_VARIANT_WIDTHS)
+    return next((width for width in widths if width >= requested), widths[-1])
+
+
+def _resize(data: bytes, width: int) -> bytes:
+    with Image.open(io.BytesIO(data)) as image:
+        if image.width <= width:
+            # cached as is, so that it is not decoded again on every request
+            return data
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width, image.height), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        if image_format == "JPEG":
+            image.convert("RGB").save(out, "JPEG", quality=settings.IMAGE_VARIANT_QUALITY, optimize=True)
+        else:
+            image.save(out, image_format, optimize=True)
+        return out.getvalue()
+
+
+_evict_lock = threading.Lock()
+# the size of IMAGE_VARIANT_DIR as of the last scan plus what this process wrote since, None before a scan
+_variant_bytes: int | None = None
+
+
+def evict_variants():
+    """
+    Delete the least recently served variants until they fit in IMAGE_VARIANT_MAX_BYTES, minus the
+    headroom.
+    Effects: filesystem
+    """
+    global _variant_bytes
+    with _evict_lock:
+        files = []
+        for path in Path(settings.IMAGE_VARIANT_DIR).glob("*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        if total > settings.IMAGE_VARIANT_MAX_BYTES:
+            target = settings.IMAGE_VARIANT_MAX_BYTES * (1 - VARIANT_HEADROOM)
+            for _, size, path in sorted(files):
+                if total <= target:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+        _variant_bytes = total
+
+
+def _variant_written(size: int):
+    """
+    Count a new variant, evicting when the directory may have gone over its limit.
+    Effects: filesystem (when evicting)
+    """
+    global _variant_bytes
+    with _evict_lock:
+        if _variant_bytes is not None:
+            _variant_bytes += size
+        scan = _variant_bytes is None or _variant_bytes > settings.IMAGE_VARIANT_MAX_BYTES
+    if scan:
+        evict_variants()
+
+
+def image_variant(digest: str, width: int) -> Path | None:
+    """
+    The file of the stored image resized to `width` (one of IMAGE_VARIANT_WIDTHS), generating it if
+    needed. None when the original should be served instead: it cannot be decoded, or Pillow is not
+    installed.
+    Effects: filesystem
+    """
+    if Image is None:
+        return None
+    path = variant_path(digest, width)
+    if path.exists():
+        # the modification time orders variants for eviction
+        os.utime(path)
+        return path
+
+    try:
+        data = _resize(load_image(digest), width)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    _write_atomically(path, data)
+    _variant_written(len(data))
+    return path if path.exists() else None
+
+
+class _LimitedFile:
+    """
+    The `length` bytes of a file starting at `offset`, for streaming a byte range.
+    """
+
+    def __init__(self, f, offset: int, length: int, chunk_size: int = 64 * 1024):
+        self.f = f
+        self.remaining = length
+        self.chunk_size = chunk_size
+        f.seek(offset)
+
+    def __iter__(self):
+        while self.remaining > 0:
+            chunk = self.f.read(min(self.chunk_size, self.remaining))
+            if not chunk:
+                break
+            self.remaining -= len(chunk)
+            yield chunk
+
+    def close(self):
+        self.f.close()
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    The (first, last) byte positions of a single-range Range header, or None if it is unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # suffix range: the last N bytes
+        first, last = max(0, size - int(last)), size - 1
+    else:
+        first, last = int(first), min(int(last), size - 1) if last else size - 1
+    if first > last or first >= size:
+        return None
+    return first, last
+
+
+def serve_image(request, digest: str, content_type: str, immutable: bool = False,
+                width: int | None = None) -> HttpResponse:
+    """
+    Stream a stored image (or its variant for `width`) with a strong ETag, honouring If-None-Match
+    and single byte ranges. Immutable caching is only allowed when the URL itself pins the digest.
+    """
+    path = image_variant(digest, width) if width is not None else None
+    if path is not None:
+        etag = f'"{digest}-{width}"'
+    else:
+        try:
+            path = local_image(digest)
+        except ImageMissing:
+            return HttpResponseNotFound("Image not found")
+        etag = f'"{digest}"'
+    cache_control = IMMUTABLE if immutable else REVALIDATE
+
+    if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        response["Cache-Control"] = cache_control
+        return response
+
+    size = path.stat().st_size
+    byte_range = None
+    range_header = request.headers.get("Range")
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    f = open(path, "rb")
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        first, last = byte_range
+        response = FileResponse(_LimitedFile(f, first, last - first + 1), status=206, content_type=content_type)
+        response["Content-Length"] = str(last - first + 1)
+        response["Content-Range"] = f"bytes {first}-{last}/{size}"
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    response["Accept-Ranges"] = "bytes"
+    return response
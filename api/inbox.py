@@ -0,0 +1,298 @@
+"""
+Bulk ingestion of inbox activities delivered by peer nodes.
+
+`ingest` handles many activities, possibly for many local recipients, the way InboxView.post handles a
+single one: remote senders get their posts, comments and likes mirrored, and every recipient gets a
+notification. The authors, posts and existing rows the activities refer to are resolved with one query
+each, and all rows are written with bulk_create in a single transaction. Every activity gets its own
+result, so a malformed one does not fail the rest of the batch. Activities with an id that were already
+received (see InboxActivity) are answered as replays without being handled again.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+from uuid import UUID
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import Author, Comment, InboxActivity, Like, Notification, Post, TimelineEntry
+from .remote_cache import invalidate_remote_post_listings, invalidate_remote_profiles, invalidate_remote_threads
+
+VALID_TYPES = ("post", "like", "comment", "follow")
+
+
+def _last_segment(url: str) -> str:
+    return url.rstrip("/").split("/")[-1]
+
+
+def _parse_uuid(value: str) -> UUID | None:
+    try:
+        return UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _comment_post_id(comment_url: str) -> UUID | None:
+    parts = comment_url.rstrip("/").split("/")
+    try:
+        return _parse_uuid(parts[parts.index("posts") + 1])
+    except (ValueError, IndexError):
+        return None
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, error: str):
+        super().__init__(error)
+        self.status = status
+        self.error = error
+
+
+@dataclass
+class _Batch:
+    """
+    Everything the activities of a batch refer to, loaded in bulk.
+    """
+
+    recipients: dict[UUID, Author]
+    senders: dict[str, list[Author]]
+    posts: dict[UUID, Post]
+    post_keys: set[tuple]
+    comment_keys: set[tuple]
+    like_keys: set[tuple]
+    # (recipient id, node id, digest) of the activities received before, to their record
+    received: dict[tuple, InboxActivity]
+
+    new_activities: list[InboxActivity] = field(default_factory=list)
+    expired_activities: list[InboxActivity] = field(default_factory=list)
+    new_posts: list[Post] = field(default_factory=list)
+    new_comments: list[Comment] = field(default_factory=list)
+    new_likes: list[Like] = field(default_factory=list)
+    notifications: list[Notification] = field(default_factory=list)
+    # cached remote data the activities made stale, invalidated once the batch is written
+    stale_profiles: dict[UUID, Author] = field(default_factory=dict)
+    stale_posts: dict[UUID, Author] = field(default_factory=dict)
+    stale_threads: set[str] = field(default_factory=set)
+
+    def sender(self, activity: dict) -> Author:
+        url = activity["author"]["id"]
+        key = _last_segment(url)
+        candidates = self.senders.get(key)
+        if not candidates:
+            raise Rejected(404, f"Author not found with either id or extern_id matching: {key}")
+        # extern ids are only unique per node, prefer the author of the node the URL belongs to
+        return next((author for author in candidates if author.node and url.startswith(author.node.host)),
+                    candidates[0])
+
+    def replay(self, recipient: Author, node_id: int | None, activity: dict) -> bool:
+        """
+        Whether the activity was received before (possibly earlier in this batch).
+        """
+        activity_id = InboxActivity.activity_id_of(activity)
+        if activity_id is None:
+            return False
+        seen = self.received.get((recipient.id, node_id, InboxActivity.digest_of(activity_id)))
+        return seen is not None and seen.received_at >= InboxActivity.expired_before()
+
+    def receive(self, recipient: Author, node_id: int | None, activity: dict):
+        """
+        Stage the record of a handled activity, replacing an expired one.
+        """
+        activity_id = InboxActivity.activity_id_of(activity)
+        if activity_id is None:
+            return
+        key = (recipient.id, node_id, InboxActivity.digest_of(activity_id))
+        if key in self.received:
+            self.expired_activities.append(self.received[key])
+        self.received[key] = InboxActivity(recipient=recipient, node_id=node_id, digest=key[2],
+                                           activity_id=activity_id)
+        self.new_activities.append(self.received[key])
+
+
+def _load(entries: list[tuple[int, str, dict, UUID]]) -> _Batch:
+    """
+    Effects: DB (one query per kind of referenced row)
+    """
+    recipients = Author.objects.filter(id__in={recipient for _, _, _, recipient in entries}, node=None)
+
+    sender_keys, comment_posts, post_extern_ids, comment_extern_ids, like_object_ids = set(), set(), set(), set(), set()
+    digests = set()
+    for _, kind, activity, _ in entries:
+        activity_id = InboxActivity.activity_id_of(activity)
+        if activity_id is not None:
+            digests.add(InboxActivity.digest_of(activity_id))
+        if kind == "follow":
+            continue
+        try:
+            sender_keys.add(_last_segment(activity["author"]["id"]))
+            if kind == "post":
+                post_extern_ids.add(_last_segment(activity["id"]))
+            elif kind == "comment":
+                comment_posts.add(_comment_post_id(activity["id"]))
+                comment_extern_ids.add(_last_segment(activity["id"]))
+            elif kind == "like":
+                like_object_ids.add(_last_segment(activity["object"]))
+        except (KeyError, TypeError, AttributeError):
+            # reported when the activity itself is handled
+            continue
+
+    # like InboxView.post, a sender is looked up by id first and by extern id otherwise
+    sender_ids = {uuid for uuid in map(_parse_uuid, sender_keys) if uuid is not None}
+    by_id, by_extern_id = {}, {}
+    for author in Author.objects.filter(Q(id__in=sender_ids) | Q(extern_id__in=sender_keys)).select_related("node"):
+        by_id[author.id] = author
+        by_extern_id.setdefault(author.extern_id, []).append(author)
+    senders = {}
+    for key in sender_keys:
+        author_id = _parse_uuid(key)
+        senders[key] = [by_id[author_id]] if author_id in by_id else by_extern_id.get(key, [])
+
+    recipients = {author.id: author for author in recipients.select_related("user")}
+    received = InboxActivity.objects.filter(recipient__in=recipients.keys(), digest__in=digests)
+    return _Batch(
+        recipients=recipients,
+        senders=senders,
+        posts=Post.objects.in_bulk(comment_posts - {None}),
+        post_keys=set(Post.objects.filter(extern_id__in=post_extern_ids).values_list("extern_id", "author__node_id")),
+        comment_keys=set(Comment.objects.filter(extern_id__in=comment_extern_ids).values_list(
+            "extern_id", "author_id", "post_id")),
+        like_keys=set(Like.objects.filter(object_id__in=like_object_ids).values_list(
+            "object_id", "object_type", "author_id")),
+        received={(record.recipient_id, record.node_id, record.digest): record for record in received},
+    )
+
+
+def _handle(batch: _Batch, kind: str, activity: dict, recipient: Author) -> dict:
+    """
+    Stage the rows for one activity, returning its result.
+    """
+    sender = batch.sender(activity) if kind != "follow" else None
+    if batch.replay(recipient, sender.node_id if sender else None, activity):
+        return {"status": 200, "replay": True}
+
+    if sender is not None:
+        if sender.remote:
+            batch.stale_profiles[sender.pk] = sender
+            if kind == "post":
+                batch.stale_posts[sender.pk] = sender
+                extern_id = _last_segment(activity["id"])
+                # extern ids are only unique per node
+                if (extern_id, sender.node_id) in batch.post_keys:
+                    raise Rejected(409, "Post already exists")
+                content_type = Post.ContentType.from_display(activity["contentType"])
+                if content_type is None:
+                    raise Rejected(400, f"Unknown content type {activity['contentType']}")
+                batch.new_posts.append(Post(
+                    title=activity["title"],
+                    description=activity["description"],
+                    content=activity["content"],
+                    content_type=content_type.value,
+                    visibility=Post.Visibility[activity["visibility"].upper()].value,
+                    author=sender,
+                    extern_id=extern_id,
+                ))
+                batch.post_keys.add((extern_id, sender.node_id))
+
+            elif kind == "comment":
+                batch.stale_threads.add(activity.get("id"))
+                post = batch.posts.get(_comment_post_id(activity["id"]))
+                if post is None:
+                    raise Rejected(404, "Post not found")
+                key = (_last_segment(activity["id"]), sender.id, post.uuid)
+                if key not in batch.comment_keys:
+                    batch.new_comments.append(Comment(comment=activity["comment"],
+                                                      content_type=activity["contentType"], author=sender,
+                                                      post=post, extern_id=key[0]))
+                    batch.comment_keys.add(key)
+
+            elif kind == "like":
+                batch.stale_threads.add(activity.get("object"))
+                object_type = "post" if activity["summary"].split(" ")[-1] == "post" else "comment"
+                key = (_last_segment(activity["object"]), object_type, sender.id)
+                if key not in batch.like_keys:
+                    batch.like_keys.add(key)
+                    batch.new_likes.append(Like(object_id=key[0], object_type=object_type, author=sender))
+
+    batch.receive(recipient, sender.node_id if sender else None, activity)
+    activity["type"] = kind
+    # the payloads of peers are stored as delivered, see Notification
+    batch.notifications.append(Notification(recipient=recipient, type=kind, data=activity))
+    return {"status": 200}
+
+
+def _write(batch: _Batch):
+    """
+    Effects: DB, filesystem (images of new image posts), cache
+    """
+    for post in batch.new_posts:
+        post.store_image_content()
+
+    with transaction.atomic():
+        # a concurrent delivery of one of the activities fails the unique index here, see ingest
+        InboxActivity.objects.filter(pk__in=[record.pk for record in batch.expired_activities]).delete()
+        InboxActivity.objects.bulk_create(batch.new_activities)
+        Post.objects.bulk_create(batch.new_posts)
+        Comment.objects.bulk_create(batch.new_comments)
+        Like.objects.bulk_create(batch.new_likes)
+        Notification.objects.bulk_create(batch.notifications)
+
+        # bulk_create bypasses save(), so the counters are maintained here, once per object
+        for post_id, count in Counter(comment.post_id for comment in batch.new_comments).items():
+            Comment.adjust_comment_count(post_id, count)
+        for (object_type, object_id), count in Counter(
+                (like.object_type, like.object_id) for like in batch.new_likes).items():
+            Like.adjust_like_count(object_type, object_id, count)
+
+        for post in batch.new_posts:
+            TimelineEntry.fan_out(post)
+
+    invalidate_remote_profiles(batch.stale_profiles.values())
+    invalidate_remote_post_listings(batch.stale_posts.values())
+    invalidate_remote_threads(batch.stale_threads)
+
+
+def ingest(entries: list, retry: bool = True) -> list[dict]:
+    """
+    Handle `{"recipient": <author id or URL>, "activity": {...}}` entries, returning for each one its
+    status (as InboxView.post would answer it) and, for failures, an error.
+    Effects: DB, cache
+    """
+    results: list[dict | None] = [None] * len(entries)
+    parsed = []
+    for index, entry in enumerate(entries):
+        try:
+            activity = entry["activity"]
+            kind = activity["type"].lower()
+            recipient = _parse_uuid(_last_segment(str(entry["recipient"])))
+        except (KeyError, TypeError, AttributeError):
+            results[index] = {"status": 400, "error": "Expected a recipient and an activity with a type"}
+            continue
+        if kind not in VALID_TYPES:
+            results[index] = {"status": 406, "error": "The type can only be post, comment, Like, or Follow"}
+        elif recipient is None:
+            results[index] = {"status": 404, "error": "Recipient not found"}
+        else:
+            parsed.append((index, kind, activity, recipient))
+
+    batch = _load(parsed)
+    for index, kind, activity, recipient_id in parsed:
+        recipient = batch.recipients.get(recipient_id)
+        try:
+            if recipient is None:
+                raise Rejected(404, "Recipient not found")
+            results[index] = _handle(batch, kind, activity, recipient)
+        except Rejected as e:
+            results[index] = {"status": e.status, "error": e.error}
+        except (KeyError, TypeError, AttributeError, ValueError) as e:
+            results[index] = {"status": 400, "error": f"Malformed {kind} activity: {e!r}"}
+
+    try:
+        _write(batch)
+    except IntegrityError:
+        if not retry:
+            raise
+        # some activity was received concurrently, it is a replay once loaded again
+        return ingest(entries, retry=False)
+    return results
@@ -0,0 +1,35 @@
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.fast_serializers import post_to_dict
+from api.models import Author, Post
+from api.serializers import PostSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare PostSerializer with the plain-dict fast path on an in-memory feed page."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=100, help="posts per page")
+        parser.add_argument("--repeat", type=int, default=50, help="pages to serialize per run")
+
+    def handle(self, *args, **options):
+        # unsaved objects, so that only serialization is measured
+        author = Author(user=User(username="benchmark"), github="https://github.com/benchmark")
+        now = timezone.now()
+        posts = [
+            Post(author=author, title=f"post {i}", description="description", content="content " * 20,
+                 content_type=Post.ContentType.MARKDOWN, visibility=Post.Visibility.PUBLIC, published=now)
+            for i in range(options["posts"])
+        ]
+
+        drf = min(timeit.repeat(lambda: PostSerializer(posts, many=True).data, number=options["repeat"], repeat=3))
+        fast = min(timeit.repeat(lambda: [post_to_dict(post) for post in posts], number=options["repeat"], repeat=3))
+
+        per_page = 1000 / options["repeat"]
+        self.stdout.write(f"PostSerializer: {drf * per_page:.2f} ms/page")
+        self.stdout.write(f"post_to_dict:   {fast * per_page:.2f} ms/page")
+        self.stdout.write(self.style.SUCCESS(f"speedup: {drf / fast:.1f}x"))
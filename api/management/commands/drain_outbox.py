@@ -0,0 +1,24 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Deliver the queued activities of the outbox to the remote inboxes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="keep delivering every OUTBOX_POLL_INTERVAL seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            for host, counts in drain().items():
+                self.stdout.write(
+                    f"{host}: {counts['delivered']} delivered, {counts['failed']} failed, "
+                    f"{counts['retrying']} to retry"
+                )
+            if not options["loop"]:
+                break
+            time.sleep(settings.OUTBOX_POLL_INTERVAL)
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.image_store import Image, image_variant
+from api.models import Post
+
+
+class Command(BaseCommand):
+    help = "Generate the resized variants of every stored image post, so that none is resized on request."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--width", type=int, action="append", default=None,
+                            help="only generate this width (default: every IMAGE_VARIANT_WIDTHS)")
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError("Pillow is required to resize images")
+
+        widths = options["width"] or settings.IMAGE_VARIANT_WIDTHS
+        unknown = set(widths) - set(settings.IMAGE_VARIANT_WIDTHS)
+        if unknown:
+            raise CommandError(f"Widths not in IMAGE_VARIANT_WIDTHS: {sorted(unknown)}")
+
+        digests = Post.objects.exclude(image_hash="").values_list("image_hash", flat=True).distinct()
+        generated = failed = 0
+        for digest in digests.iterator():
+            for width in widths:
+                if image_variant(digest, width) is None:
+                    failed += 1
+                else:
+                    generated += 1
+        self.stdout.write(f"{generated} variants ready, {failed} images could not be resized")
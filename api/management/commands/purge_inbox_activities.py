@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.models import InboxActivity
+
+
+class Command(BaseCommand):
+    help = "Delete the records of inbox activities older than INBOX_DEDUP_RETENTION."
+
+    def handle(self, *args, **options):
+        deleted = InboxActivity.purge()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} inbox activity records"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Friendship
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized friendship index from the follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = Friendship.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} friendship rows"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Author, TimelineEntry
+
+
+class Command(BaseCommand):
+    help = "Rebuild the home timeline of every local author from the follow graph."
+
+    def handle(self, *args, **options):
+        authors = Author.objects.filter(node=None)
+        for author in authors.iterator():
+            TimelineEntry.refresh(author)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {authors.count()} timelines"))
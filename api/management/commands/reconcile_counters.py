@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Comment, Like
+
+
+class Command(BaseCommand):
+    help = "Recompute the like and comment counters of posts and comments from the likes and comments."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        comments = Comment.reconcile_counts(batch_size=options["batch_size"])
+        likes = Like.reconcile_counts(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Fixed {comments} comment counters and {likes} like counters"))
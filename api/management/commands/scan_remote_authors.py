@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.models import Node
+from api.remote_authors import scan_remote_authors
+
+
+class Command(BaseCommand):
+    help = "Crawl every enabled node's author list and upsert the remote authors found."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--node", action="append", default=None, help="only scan the node with this host")
+
+    def handle(self, *args, **options):
+        nodes = Node.objects.filter(enabled=True)
+        if options["node"]:
+            nodes = nodes.filter(host__in=options["node"])
+
+        for result in scan_remote_authors(list(nodes), page_size=options["page_size"]):
+            if result["ok"]:
+                self.stdout.write(
+                    f"{result['node']}: {result['authors']} authors ({result['created']} new, "
+                    f"{result['updated']} renamed) fetched in {result['fetch_seconds']}s, "
+                    f"upserted in {result['upsert_seconds']}s"
+                )
+            else:
+                self.stdout.write(self.style.ERROR(f"{result['node']}: unreachable"))
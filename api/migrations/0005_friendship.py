@@ -0,0 +1,41 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def populate_friendships(apps, schema_editor):
+    Author = apps.get_model('api', 'Author')
+    Friendship = apps.get_model('api', 'Friendship')
+    follow = Author.following.through
+    mutual = follow.objects.filter(
+        Exists(follow.objects.filter(from_author=OuterRef('to_author'), to_author=OuterRef('from_author')))
+    ).values_list('from_author_id', 'to_author_id')
+    Friendship.objects.bulk_create(
+        [Friendship(author_id=author_id, friend_id=friend_id) for author_id, friend_id in mutual],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_alter_comment_content_type_alter_post_content_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships', to='api.author')),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.author')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.UniqueConstraint(fields=('author', 'friend'), name='unique_friendship'),
+        ),
+        migrations.RunPython(populate_friendships, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Q
+
+
+def populate_timelines(apps, schema_editor):
+    # the rules of TimelineEntry.visible_to and Friendship.friends_filter, on the historical models
+    Author = apps.get_model('api', 'Author')
+    Friendship = apps.get_model('api', 'Friendship')
+    Post = apps.get_model('api', 'Post')
+    TimelineEntry = apps.get_model('api', 'TimelineEntry')
+    follow = Author.following.through
+    for owner_id in Author.objects.filter(node=None).values_list('pk', flat=True):
+        friends = Q(Exists(Friendship.objects.filter(author_id=owner_id, friend=OuterRef('author')))) | (
+            Q(author__node__isnull=False)
+            & Q(Exists(follow.objects.filter(from_author=OuterRef('author'), to_author_id=owner_id)))
+        )
+        visible = Q(author_id=owner_id) | (
+            Q(Exists(follow.objects.filter(from_author_id=owner_id, to_author=OuterRef('author'))))
+            & (Q(visibility='p') | (Q(visibility='f') & friends))
+        )
+        posts = Post.objects.filter(visible).order_by('-published', '-uuid').values_list('pk', 'published')
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(owner_id=owner_id, post_id=post_id, published=published)
+             for post_id, published in posts[:settings.TIMELINE_MAX_ENTRIES]],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_friendship'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published', models.DateTimeField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='api.author')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-published', '-post'], name='timeline_owner_published')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('owner', 'post'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(populate_timelines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:37
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024)),
+                ('body', models.JSONField()),
+                ('status', models.CharField(choices=[('p', 'pending'), ('d', 'delivered'), ('f', 'failed')], default='p', max_length=1)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('delivered_at', models.DateTimeField(blank=True, null=True)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='api.node')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'node', 'id'], name='outbox_pending_by_node')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.2 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_outboxitem'),
+    ]
+
+    operations = [
+        # images are moved out of `content` in 0015_stored_image, once they have a durable copy
+        migrations.AddField(
+            model_name='post',
+            name='image_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:40
+
+from collections import Counter
+from uuid import UUID
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    Like = apps.get_model('api', 'Like')
+
+    likes = {'post': Counter(), 'comment': Counter()}
+    for object_type, object_id in Like.objects.values_list('object_type', 'object_id').iterator(chunk_size=500):
+        try:
+            object_uuid = UUID(object_id)
+        except (TypeError, ValueError):
+            continue
+        if object_type in likes:
+            likes[object_type][object_uuid] += 1
+    comments = dict(Comment.objects.values('post').annotate(n=Count('uuid')).values_list('post', 'n'))
+
+    posts = list(Post.objects.only('uuid'))
+    for post in posts:
+        post.comment_count = comments.get(post.uuid, 0)
+        post.like_count = likes['post'][post.uuid]
+    Post.objects.bulk_update(posts, ['comment_count', 'like_count'], batch_size=500)
+
+    rows = list(Comment.objects.only('uuid'))
+    for comment in rows:
+        comment.like_count = likes['comment'][comment.uuid]
+    Comment.objects.bulk_update(rows, ['like_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_modified_timestamps'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='post',
+            old_name='count',
+            new_name='comment_count',
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:10
+
+from collections import Counter
+from uuid import UUID
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_remote_authors(apps, schema_editor):
+    Author = apps.get_model('api', 'Author')
+    Follow = Author.following.through
+    duplicated = (Author.objects.filter(extern_id__isnull=False, node__isnull=False)
+                  .values('extern_id', 'node').annotate(n=Count('id')).filter(n__gt=1))
+    for key in duplicated:
+        keep, *extra = Author.objects.filter(extern_id=key['extern_id'], node=key['node']).order_by('id')
+        extra_ids = {author.id for author in extra}
+        for model, field in [('Post', 'author'), ('Comment', 'author'), ('Like', 'author'),
+                             ('Notification', 'recipient')]:
+            apps.get_model('api', model).objects.filter(**{f'{field}_id__in': extra_ids}).update(**{field: keep})
+
+        def merged(author_id):
+            return keep.id if author_id in extra_ids else author_id
+
+        follows = Follow.objects.filter(models.Q(from_author_id__in=extra_ids) | models.Q(to_author_id__in=extra_ids))
+        Follow.objects.bulk_create([
+            Follow(from_author_id=merged(row.from_author_id), to_author_id=merged(row.to_author_id))
+            for row in follows if merged(row.from_author_id) != merged(row.to_author_id)
+        ], ignore_conflicts=True)
+        # friendships and timeline entries of the duplicates go with them; both can be rebuilt
+        Author.objects.filter(id__in=extra_ids).delete()
+
+
+def delete_duplicate_likes(apps, schema_editor):
+    Like = apps.get_model('api', 'Like')
+    duplicated = (Like.objects.values('object_id', 'object_type', 'author')
+                  .annotate(n=Count('id')).filter(n__gt=1))
+    deleted = 0
+    for key in duplicated:
+        likes = Like.objects.filter(object_id=key['object_id'], object_type=key['object_type'], author=key['author'])
+        keep = likes.order_by('published', 'id').first()
+        deleted += likes.exclude(id=keep.id).delete()[0]
+    if not deleted:
+        return
+
+    # the like counters included the duplicates
+    counts = Counter()
+    for object_type, object_id in Like.objects.values_list('object_type', 'object_id').iterator(chunk_size=500):
+        try:
+            counts[object_type, UUID(object_id)] += 1
+        except (TypeError, ValueError):
+            continue
+    for object_type, model in [('post', 'Post'), ('comment', 'Comment')]:
+        rows = list(apps.get_model('api', model).objects.only('uuid'))
+        for row in rows:
+            row.like_count = counts[object_type, row.uuid]
+        apps.get_model('api', model).objects.bulk_update(rows, ['like_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_like_comment_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-published', '-uuid'], name='comment_post_published'),
+        ),
+        migrations.AddIndex(
+            model_name='like',
+            index=models.Index(fields=['author', '-published', '-id'], name='like_author_published'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-created_at', '-uuid'], name='notification_recipient_created'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'visibility', '-published', '-uuid'], name='post_author_visibility'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['visibility', '-published', '-uuid'], name='post_visibility_published'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('extern_id__isnull', False)), fields=['extern_id'], name='post_extern_id'),
+        ),
+        migrations.RunPython(merge_duplicate_remote_authors, migrations.RunPython.noop),
+        migrations.RunPython(delete_duplicate_likes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='author',
+            constraint=models.UniqueConstraint(fields=('extern_id', 'node'), name='unique_remote_author'),
+        ),
+        migrations.AddConstraint(
+            model_name='like',
+            constraint=models.UniqueConstraint(fields=('object_id', 'object_type', 'author'), name='unique_like'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:30
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import Case, CharField, F, Value, When
+
+# the definitions of api.search as of this migration, see 0016_search_skip_base64 for the current ones
+POST_BODY = "coalesce({row}.description, '') || ' ' || CASE WHEN {row}.content_type IN ('p', 'j') THEN '' " \
+            "ELSE {row}.content END"
+
+SQLITE_SCHEMA = [
+    "CREATE TABLE search_key (rowid INTEGER PRIMARY KEY, kind TEXT NOT NULL, object_id CHAR(32) NOT NULL, "
+    "UNIQUE (object_id, kind))",
+    "CREATE VIRTUAL TABLE search_fts USING fts5(title, body, tokenize = 'porter unicode61 remove_diacritics 2')",
+    f"""CREATE TRIGGER search_post_insert AFTER INSERT ON api_post BEGIN
+        INSERT INTO search_key (kind, object_id) VALUES ('post', new.uuid);
+        INSERT INTO search_fts (rowid, title, body) VALUES (last_insert_rowid(), new.title, {POST_BODY.format(row="new")});
+    END""",
+    f"""CREATE TRIGGER search_post_update AFTER UPDATE OF title, description, content, content_type ON api_post BEGIN
+        UPDATE search_fts SET title = new.title, body = {POST_BODY.format(row="new")}
+        WHERE rowid = (SELECT rowid FROM search_key WHERE object_id = new.uuid AND kind = 'post');
+    END""",
+    """CREATE TRIGGER search_post_delete AFTER DELETE ON api_post BEGIN
+        DELETE FROM search_fts WHERE rowid = (SELECT rowid FROM search_key WHERE object_id = old.uuid AND kind = 'post');
+        DELETE FROM search_key WHERE object_id = old.uuid AND kind = 'post';
+    END""",
+    """CREATE TRIGGER search_comment_insert AFTER INSERT ON api_comment BEGIN
+        INSERT INTO search_key (kind, object_id) VALUES ('comment', new.uuid);
+        INSERT INTO search_fts (rowid, title, body) VALUES (last_insert_rowid(), '', new.comment);
+    END""",
+    """CREATE TRIGGER search_comment_update AFTER UPDATE OF comment ON api_comment BEGIN
+        UPDATE search_fts SET body = new.comment
+        WHERE rowid = (SELECT rowid FROM search_key WHERE object_id = new.uuid AND kind = 'comment');
+    END""",
+    """CREATE TRIGGER search_comment_delete AFTER DELETE ON api_comment BEGIN
+        DELETE FROM search_fts
+        WHERE rowid = (SELECT rowid FROM search_key WHERE object_id = old.uuid AND kind = 'comment');
+        DELETE FROM search_key WHERE object_id = old.uuid AND kind = 'comment';
+    END""",
+]
+
+SQLITE_POPULATE = [
+    "INSERT INTO search_key (kind, object_id) SELECT 'post', uuid FROM api_post",
+    f"""INSERT INTO search_fts (rowid, title, body)
+        SELECT k.rowid, p.title, {POST_BODY.format(row="p")}
+        FROM api_post p JOIN search_key k ON k.object_id = p.uuid AND k.kind = 'post'""",
+    "INSERT INTO search_key (kind, object_id) SELECT 'comment', uuid FROM api_comment",
+    """INSERT INTO search_fts (rowid, title, body)
+        SELECT k.rowid, '', c.comment FROM api_comment c JOIN search_key k ON k.object_id = c.uuid AND k.kind = 'comment'""",
+    "INSERT INTO search_fts (search_fts) VALUES ('optimize')",
+]
+
+SQLITE_DROP = [
+    *(f"DROP TRIGGER IF EXISTS search_{kind}_{event}"
+      for kind in ("comment", "post") for event in ("delete", "insert", "update")),
+    "DROP TABLE IF EXISTS search_fts",
+    "DROP TABLE IF EXISTS search_key",
+]
+
+
+def postgres_indexes(apps):
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    body = Case(When(content_type__in=('p', 'j'), then=Value('')), default=F('content'), output_field=CharField())
+    post_vector = (SearchVector('title', weight='A', config=settings.SEARCH_CONFIG)
+                   + SearchVector('description', body, weight='B', config=settings.SEARCH_CONFIG))
+    return [
+        (Post, GinIndex(post_vector, name='post_search')),
+        (Comment, GinIndex(SearchVector('comment', config=settings.SEARCH_CONFIG), name='comment_search')),
+    ]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_SCHEMA + SQLITE_POPULATE:
+            schema_editor.execute(statement)
+    elif schema_editor.connection.vendor == 'postgresql':
+        for model, index in postgres_indexes(apps):
+            schema_editor.add_index(model, index)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in SQLITE_DROP:
+            schema_editor.execute(statement)
+    elif schema_editor.connection.vendor == 'postgresql':
+        for model, index in postgres_indexes(apps):
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
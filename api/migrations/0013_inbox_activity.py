@@ -0,0 +1,37 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:25
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64)),
+                ('activity_id', models.TextField()),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('node', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.node')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.author')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['received_at'], name='inbox_activity_received')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='inboxactivity',
+            constraint=models.UniqueConstraint(fields=('recipient', 'node', 'digest'), name='unique_inbox_activity'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxactivity',
+            constraint=models.UniqueConstraint(condition=models.Q(('node__isnull', True)), fields=('recipient', 'digest'), name='unique_local_inbox_activity'),
+        ),
+    ]
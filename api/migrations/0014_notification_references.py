@@ -0,0 +1,215 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:28
+
+from uuid import UUID
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+CONTENT_TYPES = {'t': 'text/plain', 'm': 'text/markdown', 'b': 'application/base64', 'p': 'image/png;base64',
+                 'j': 'image/jpeg;base64'}
+VISIBILITIES = {'p': 'PUBLIC', 'f': 'FRIENDS', 'u': 'UNLISTED'}
+
+
+def _segment(url):
+    return url.rstrip('/').split('/')[-1] if isinstance(url, str) else None
+
+
+def _uuid(value):
+    try:
+        return UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def _local(model, ids):
+    """
+    The rows of `model` with these ids whose author is local, by id.
+    """
+    ids = {uuid for uuid in map(_uuid, ids) if uuid is not None}
+    return {row['pk']: row for row in model.objects.filter(pk__in=ids, author__node__isnull=True).values(
+        'pk', 'author_id')}
+
+
+def _compact(apps, notifications):
+    """
+    Refer to the posts, comments and likes of local authors. The payloads of remote activities are kept:
+    the local mirror of a remote object does not have the id, origin and author id of the original.
+    """
+    Comment = apps.get_model('api', 'Comment')
+    Like = apps.get_model('api', 'Like')
+    Post = apps.get_model('api', 'Post')
+
+    keys = {'post': set(), 'comment': set(), 'author': set(), 'object': set()}
+    for notification in notifications:
+        data, kind = notification.data, notification.type.lower()
+        if not isinstance(data, dict):
+            continue
+        if kind in ('post', 'comment'):
+            keys[kind].add(_segment(data.get('id')))
+        elif kind == 'like' and isinstance(data.get('author'), dict):
+            keys['author'].add(_uuid(_segment(data['author'].get('id'))))
+            keys['object'].add(_segment(data.get('object')))
+
+    posts = _local(Post, keys['post'])
+    comments = _local(Comment, keys['comment'])
+    likes = {(like['object_id'], like['author_id']): like for like in Like.objects.filter(
+        author__in=keys['author'] - {None}, author__node__isnull=True, object_id__in=keys['object'] - {None},
+    ).values('pk', 'object_id', 'author_id')}
+
+    compacted = []
+    for notification in notifications:
+        data, kind = notification.data, notification.type.lower()
+        if not isinstance(data, dict):
+            continue
+        row = None
+        if kind in ('post', 'comment'):
+            row = (posts if kind == 'post' else comments).get(_uuid(_segment(data.get('id'))))
+        elif kind == 'like' and isinstance(data.get('author'), dict):
+            row = likes.get((_segment(data.get('object')), _uuid(_segment(data['author'].get('id')))))
+        if row is None:
+            continue
+        notification.data = None
+        notification.object_type = kind
+        notification.object_id = row['pk']
+        notification.actor_id = row['author_id']
+        compacted.append(notification)
+    return compacted
+
+
+def compact_notifications(apps, schema_editor):
+    """
+    Replace the payloads of notifications about posts, comments and likes of local authors with references.
+    """
+    Notification = apps.get_model('api', 'Notification')
+    queryset = Notification.objects.exclude(type__iexact='follow').order_by('pk')
+    last = None
+    while True:
+        chunk = list((queryset.filter(pk__gt=last) if last else queryset)[:500])
+        if not chunk:
+            break
+        last = chunk[-1].pk
+        Notification.objects.bulk_update(_compact(apps, chunk), ['data', 'object_type', 'object_id', 'actor'])
+
+
+def _datetime(value):
+    value = timezone.localtime(value).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _payloads(apps, notifications):
+    """
+    The payloads of references, as the serializers wrote them before this migration. References are to
+    objects of local authors only.
+    """
+    Comment = apps.get_model('api', 'Comment')
+    Like = apps.get_model('api', 'Like')
+    Post = apps.get_model('api', 'Post')
+    authors_url = f'{settings.SRV_URL}/api/authors/'
+
+    def author(author):
+        author_id = f'{authors_url}{author.id.hex}'
+        return {'type': 'author', 'id': author_id, 'host': f'{settings.SRV_URL}/',
+                'displayName': author.user.username, 'url': author_id, 'github': author.github,
+                'profileImage': author.profile_image}
+
+    def post(post):
+        post_id = f'{authors_url}{post.author_id.hex}/posts/{post.uuid.hex}'
+        return {'type': 'post', 'title': post.title, 'id': post_id, 'source': post.source or post_id,
+                'origin': post.origin or post_id, 'description': post.description,
+                'contentType': CONTENT_TYPES[post.content_type], 'content': post.content,
+                'author': author(post.author), 'count': post.comment_count, 'likeCount': post.like_count,
+                'commentCount': post.comment_count, 'comments': f'{post_id}/comments',
+                'published': _datetime(post.published), 'visibility': VISIBILITIES[post.visibility]}
+
+    def comment(comment):
+        return {'type': 'comment', 'author': author(comment.author), 'comment': comment.comment,
+                'contentType': comment.content_type, 'published': _datetime(comment.published),
+                'id': f'{authors_url}{comment.author_id.hex}/posts/{comment.post_id.hex}/comments/{comment.uuid.hex}',
+                'likeCount': comment.like_count}
+
+    def like(like, objects):
+        target = objects.get(like.object_type, {}).get(_uuid(like.object_id))
+        if like.object_type == 'post' and target is not None:
+            url = f'{authors_url}{target.author_id}/posts/{like.object_id}'
+        elif like.object_type == 'comment' and target is not None:
+            url = f'{authors_url}{target.author_id}/posts/{target.post_id}/comments/{like.object_id}'
+        else:
+            url = None
+        return {'summary': f'{like.author.user.username} Likes your {like.object_type}', 'type': 'Like',
+                'author': author(like.author), 'object': url}
+
+    wanted = {'post': set(), 'comment': set(), 'like': set()}
+    for notification in notifications:
+        wanted[notification.object_type].add(notification.object_id)
+    likes = list(Like.objects.filter(id__in=wanted['like']).select_related('author__user'))
+    liked = {'post': set(), 'comment': set()}
+    for row in likes:
+        if row.object_type in liked and _uuid(row.object_id) is not None:
+            liked[row.object_type].add(_uuid(row.object_id))
+    objects = {
+        'post': Post.objects.filter(uuid__in=wanted['post'] | liked['post']).select_related('author__user').in_bulk(),
+        'comment': Comment.objects.filter(uuid__in=wanted['comment'] | liked['comment']).select_related(
+            'author__user').in_bulk(),
+    }
+    payloads = {('like', row.id): like(row, objects) for row in likes}
+    for object_type, serialize in (('post', post), ('comment', comment)):
+        payloads.update({(object_type, pk): serialize(objects[object_type][pk])
+                         for pk in wanted[object_type] if pk in objects[object_type]})
+    return payloads
+
+
+def expand_notifications(apps, schema_editor):
+    """
+    Store the payloads of references again. References to deleted objects were left out of the inbox and
+    are deleted.
+    """
+    Notification = apps.get_model('api', 'Notification')
+    queryset = Notification.objects.filter(data__isnull=True).order_by('pk')
+    last = None
+    while True:
+        chunk = list((queryset.filter(pk__gt=last) if last else queryset)[:500])
+        if not chunk:
+            break
+        last = chunk[-1].pk
+        payloads = _payloads(apps, chunk)
+        expanded = []
+        for notification in chunk:
+            notification.data = payloads.get((notification.object_type, notification.object_id))
+            if notification.data is not None:
+                expanded.append(notification)
+        Notification.objects.bulk_update(expanded, ['data'])
+        Notification.objects.filter(pk__in=[notification.pk for notification in chunk
+                                            if notification.data is None]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_inbox_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='actor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.author'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='object_id',
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='object_type',
+            field=models.CharField(blank=True, choices=[('post', 'post'), ('comment', 'comment'), ('like', 'like')], max_length=20, null=True),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='data',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(compact_notifications, expand_notifications),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:40
+
+import base64
+import binascii
+import hashlib
+
+from django.db import migrations, models
+
+IMAGE_TYPES = ('p', 'j')
+
+
+def _store(StoredImage, data):
+    digest = hashlib.sha256(data).hexdigest()
+    if not StoredImage.objects.filter(digest=digest).exists():
+        StoredImage.objects.create(digest=digest, data=data)
+    return digest
+
+
+def store_images(apps, schema_editor):
+    """
+    Copy the images of image posts into StoredImage, and only then drop them from `content`.
+    """
+    Post = apps.get_model('api', 'Post')
+    StoredImage = apps.get_model('api', 'StoredImage')
+
+    posts = Post.objects.filter(content_type__in=IMAGE_TYPES).exclude(content='').only('uuid', 'content')
+    for post in posts.iterator(chunk_size=100):
+        try:
+            data = base64.b64decode(post.content, validate=True)
+        except (binascii.Error, ValueError):
+            continue
+        Post.objects.filter(pk=post.pk).update(image_hash=_store(StoredImage, data), content='')
+
+
+def restore_images(apps, schema_editor):
+    Post = apps.get_model('api', 'Post')
+    StoredImage = apps.get_model('api', 'StoredImage')
+    for post in Post.objects.exclude(image_hash='').only('uuid', 'image_hash').iterator(chunk_size=100):
+        data = StoredImage.objects.filter(digest=post.image_hash).values_list('data', flat=True).first()
+        if data is not None:
+            Post.objects.filter(pk=post.pk).update(content=base64.b64encode(bytes(data)).decode(), image_hash='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_notification_references'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('digest', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(store_images, restore_images),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:50
+
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import Case, CharField, F, Value, When
+
+# the content of base64 posts ('b') is no longer indexed, like that of image posts
+OLD_TYPES = ('p', 'j')
+NEW_TYPES = ('p', 'j', 'b')
+
+
+def post_body(row, types):
+    excluded = ', '.join(f"'{content_type}'" for content_type in types)
+    return f"coalesce({row}.description, '') || ' ' || CASE WHEN {row}.content_type IN ({excluded}) THEN '' " \
+           f"ELSE {row}.content END"
+
+
+def sqlite_statements(types):
+    return [
+        "DROP TRIGGER IF EXISTS search_post_insert",
+        "DROP TRIGGER IF EXISTS search_post_update",
+        f"""CREATE TRIGGER search_post_insert AFTER INSERT ON api_post BEGIN
+            INSERT INTO search_key (kind, object_id) VALUES ('post', new.uuid);
+            INSERT INTO search_fts (rowid, title, body) VALUES (last_insert_rowid(), new.title, {post_body("new", types)});
+        END""",
+        f"""CREATE TRIGGER search_post_update AFTER UPDATE OF title, description, content, content_type ON api_post BEGIN
+            UPDATE search_fts SET title = new.title, body = {post_body("new", types)}
+            WHERE rowid = (SELECT rowid FROM search_key WHERE object_id = new.uuid AND kind = 'post');
+        END""",
+        f"""UPDATE search_fts SET body = (
+            SELECT {post_body("p", types)} FROM api_post p JOIN search_key k ON k.object_id = p.uuid AND k.kind = 'post'
+            WHERE k.rowid = search_fts.rowid)
+        WHERE rowid IN (SELECT k.rowid FROM search_key k JOIN api_post p ON k.object_id = p.uuid AND k.kind = 'post'
+                        WHERE p.content_type = 'b')""",
+    ]
+
+
+def postgres_post_index(apps, types):
+    body = Case(When(content_type__in=types, then=Value('')), default=F('content'), output_field=CharField())
+    vector = (SearchVector('title', weight='A', config=settings.SEARCH_CONFIG)
+              + SearchVector('description', body, weight='B', config=settings.SEARCH_CONFIG))
+    return apps.get_model('api', 'Post'), GinIndex(vector, name='post_search')
+
+
+def switch(old_types, new_types):
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'sqlite':
+            for statement in sqlite_statements(new_types):
+                schema_editor.execute(statement)
+        elif schema_editor.connection.vendor == 'postgresql':
+            schema_editor.remove_index(*postgres_post_index(apps, old_types))
+            schema_editor.add_index(*postgres_post_index(apps, new_types))
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_stored_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(switch(OLD_TYPES, NEW_TYPES), switch(NEW_TYPES, OLD_TYPES)),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_search_skip_base64'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxitem',
+            name='claimed_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,8 +1,14 @@
 from .author import Author
 from .comment import Comment
+from .friendship import Friendship
+from .inbox_activity import InboxActivity
 from .like import Like
 from .notification import Notification
+from .outbox import OutboxItem
 from .post import Post
 from .node import Node
+from .stored_image import StoredImage
+from .timeline import TimelineEntry
 
-__all__ = ["Author",  "Comment", "Like", "Node", "Notification", "Post"]
+__all__ = ["Author",  "Comment", "Friendship", "InboxActivity", "Like", "Node", "Notification", "OutboxItem", "Post",
+           "StoredImage", "TimelineEntry"]
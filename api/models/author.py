@@ -4,9 +4,8 @@ import urllib.parse
 import uuid
 from typing import NewType
 
-import requests
 from django.contrib.auth.models import User, AnonymousUser
-from django.db import models
+from django.db import models, transaction
 
 from web_dev_noobs_be.settings import SRV_URL
 from .node import Node
@@ -34,9 +33,17 @@ class Author(models.Model):
 
     # an author is unable to be used until approved
     is_approved = models.BooleanField(default=False)
+    # bumped on every save, used to answer conditional GETs (see api.conditional)
+    modified = models.DateTimeField(auto_now=True)
 
     following = models.ManyToManyField("self", symmetrical=False, related_name="followers", blank=True)
 
+    class Meta:
+        constraints = [
+            # also serves lookups by extern_id alone
+            models.UniqueConstraint(fields=["extern_id", "node"], name="unique_remote_author"),
+        ]
+
     @property
     def remote(self) -> bool:
         return self.node is not None
@@ -64,7 +71,7 @@ class Author(models.Model):
         if other_author.remote:
             return self.is_followed_by(other_author.id)  # because we can assume requests are accepted
         else:
-            return self.is_following(other_author.id) and self.is_followed_by(other_author.id)
+            return self.friendships.filter(friend=other_author).exists()
 
     def __str__(self) -> str:
         if self.remote:
@@ -77,7 +84,15 @@ class Author(models.Model):
         Make this author follow the other user.
         Effects: DB.
         """
-        self.following.add(other_user)
+        from .friendship import Friendship
+        from .timeline import TimelineEntry
+
+        with transaction.atomic():
+            self.following.add(other_user)
+            if other_user.following.filter(id=self.id).exists():
+                Friendship.link(self, other_user)
+            TimelineEntry.refresh(self, other_user)
+            TimelineEntry.refresh(other_user, self)
 
 
     def is_following(self, other_id: AuthorID) -> bool:
@@ -91,7 +106,7 @@ class Author(models.Model):
         if author.remote:
             self_id = f"{SRV_URL}/api/authors/{self.id}"
             p_encoded = urllib.parse.quote(self_id)
-            r = requests.get(author.node.make_url(f"author/{author.extern_id}/followers/{p_encoded}"))
+            r = author.node.r_get(f"author/{author.extern_id}/followers/{p_encoded}")
             return r.status_code == 200
         else:
             return self.following.filter(id=other_id).exists()
@@ -100,17 +115,27 @@ class Author(models.Model):
         return self.followers.filter(id=other_id).exists()
 
     def remove_follower(self, sender: Author):
-        self.followers.remove(sender)
+        from .friendship import Friendship
+        from .timeline import TimelineEntry
+
+        with transaction.atomic():
+            self.followers.remove(sender)
+            Friendship.unlink(self, sender)
+            TimelineEntry.refresh(self, sender)
+            TimelineEntry.refresh(sender, self)
 
     def unfollow(self, other_user: Author):
-    
-        self.following.remove(other_user)
+        from .friendship import Friendship
+        from .timeline import TimelineEntry
+
+        with transaction.atomic():
+            self.following.remove(other_user)
+            Friendship.unlink(self, other_user)
+            TimelineEntry.refresh(self, other_user)
+            TimelineEntry.refresh(other_user, self)
 
     def get_friends(self):
         """
         Returns a QuerySet of Authors who are mutual followers (i.e., friends).
         """
-        following_ids = self.following.values_list('id', flat=True)
-        followers_ids = self.followers.values_list('id', flat=True)
-        friends_ids = set(following_ids).intersection(set(followers_ids))
-        return Author.objects.filter(id__in=friends_ids)
\ No newline at end of file
+        return Author.objects.filter(friendships__friend=self)
\ No newline at end of file
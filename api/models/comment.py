@@ -1,6 +1,10 @@
 import uuid
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 from .author import Author
 from .node import Node
@@ -24,7 +28,53 @@ class Comment(models.Model):
         max_length=100, choices=Post.ContentType.choices, default=Post.ContentType.PLAIN
     )
     published = models.DateTimeField(auto_now_add=True)
+    # bumped on every save, used to answer conditional GETs (see api.conditional)
+    modified = models.DateTimeField(auto_now=True)
+    # maintained by Like when it is saved or deleted
+    like_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["post", "-published", "-uuid"], name="comment_post_published"),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Comment.adjust_comment_count(self.post_id, 1)
+
+    @staticmethod
+    def adjust_comment_count(post_id, delta: int):
+        """
+        Effects: DB
+        """
+        Post.objects.filter(uuid=post_id).update(comment_count=F("comment_count") + delta, modified=timezone.now())
+
+    @staticmethod
+    def reconcile_counts(batch_size: int = 500) -> int:
+        """
+        Recompute `Post.comment_count` from the comments, returning the number of posts that were off.
+        Effects: DB
+        """
+        counts = dict(Comment.objects.values("post").annotate(n=Count("uuid")).values_list("post", "n"))
+        now = timezone.now()
+        fixed = []
+        for post in Post.objects.only("uuid", "comment_count").iterator(chunk_size=batch_size):
+            if post.comment_count != counts.get(post.uuid, 0):
+                post.comment_count = counts.get(post.uuid, 0)
+                post.modified = now
+                fixed.append(post)
+        Post.objects.bulk_update(fixed, ["comment_count", "modified"], batch_size=batch_size)
+        return len(fixed)
 
     def __str__(self):
         username = self.author.user.username if self.author.user else self.author.remote_name
         return f"Comment {self.uuid.hex} [by {username}]"
+
+
+@receiver(post_delete, sender=Comment)
+def _comment_deleted(sender, instance: Comment, **kwargs):
+    # runs inside the transaction of the delete, including cascades from deleted authors
+    Comment.adjust_comment_count(instance.post_id, -1)
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
+
+from .author import Author
+
+
+class Friendship(models.Model):
+    """
+    A materialized mutual follow between two authors.
+    Every friendship is stored in both directions so that friend checks and listings are a single
+    indexed lookup on `author`.
+    """
+
+    author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name="friendships")
+    friend = models.ForeignKey(Author, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["author", "friend"], name="unique_friendship"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.author} <-> {self.friend}"
+
+    @staticmethod
+    def friends_filter(viewer: Author, author_field: str = "author") -> models.Q:
+        """
+        Matches rows whose author is a friend of the viewer, using the same rules as Author.is_friend:
+        remote authors only need to follow the viewer, local authors must follow mutually.
+        """
+        follow = Author.following.through
+        friendship = Friendship.objects.filter(author=viewer, friend=OuterRef(author_field))
+        follows_viewer = follow.objects.filter(from_author=OuterRef(author_field), to_author=viewer)
+        return models.Q(Exists(friendship)) | (
+            models.Q(**{f"{author_field}__node__isnull": False}) & models.Q(Exists(follows_viewer))
+        )
+
+    @staticmethod
+    def link(first: Author, second: Author):
+        """
+        Record that both authors follow each other.
+        Effects: DB
+        """
+        Friendship.objects.bulk_create(
+            [Friendship(author=first, friend=second), Friendship(author=second, friend=first)],
+            ignore_conflicts=True,
+        )
+
+    @staticmethod
+    def unlink(first: Author, second: Author):
+        """
+        Forget the friendship between both authors, if any.
+        Effects: DB
+        """
+        Friendship.objects.filter(
+            models.Q(author=first, friend=second) | models.Q(author=second, friend=first)
+        ).delete()
+
+    @staticmethod
+    def rebuild(batch_size: int = 1000) -> int:
+        """
+        Recompute every friendship from the follow graph, returning the number of rows written.
+        Effects: DB
+        """
+        follow = Author.following.through
+        mutual = follow.objects.filter(
+            Exists(follow.objects.filter(from_author=OuterRef("to_author"), to_author=OuterRef("from_author")))
+        ).values_list("from_author_id", "to_author_id")
+
+        count = 0
+        with transaction.atomic():
+            Friendship.objects.all().delete()
+            batch = []
+            for author_id, friend_id in mutual.iterator(chunk_size=batch_size):
+                batch.append(Friendship(author_id=author_id, friend_id=friend_id))
+                if len(batch) >= batch_size:
+                    count += len(Friendship.objects.bulk_create(batch))
+                    batch = []
+            count += len(Friendship.objects.bulk_create(batch))
+        return count
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+
+from .author import Author
+from .node import Node
+
+
+class InboxActivity(models.Model):
+    """
+    An activity delivered to the inbox of a local author, recorded so that replays (e.g. retries of a
+    peer whose delivery timed out) are recognized with a single unique-index lookup. Only activities with
+    an id are recorded, see `activity_id_of`. Records older than INBOX_DEDUP_RETENTION no longer count as seen.
+    """
+
+    recipient = models.ForeignKey(Author, on_delete=models.CASCADE, related_name="+")
+    # the node of the sender, None for activities of local authors
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    # SHA-256 of the activity id, so that the unique index has a fixed width
+    digest = models.CharField(max_length=64)
+    activity_id = models.TextField()
+    received_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["recipient", "node", "digest"], name="unique_inbox_activity"),
+            models.UniqueConstraint(fields=["recipient", "digest"], condition=models.Q(node__isnull=True),
+                                    name="unique_local_inbox_activity"),
+        ]
+        indexes = [
+            models.Index(fields=["received_at"], name="inbox_activity_received"),
+        ]
+
+    def __str__(self):
+        return f"{self.activity_id} -> {self.recipient}"
+
+    @staticmethod
+    def activity_id_of(activity: dict) -> str | None:
+        """
+        The id the peer gave an activity, if any. Likes and follows usually have none, and are not
+        deduplicated: a follow sent again after the follower was removed looks just like a replay of
+        the first one, and must get through.
+        """
+        return str(activity["id"]) if activity.get("id") else None
+
+    @staticmethod
+    def digest_of(activity_id: str) -> str:
+        return hashlib.sha256(activity_id.encode()).hexdigest()
+
+    @staticmethod
+    def expired_before():
+        return timezone.now() - timedelta(seconds=settings.INBOX_DEDUP_RETENTION)
+
+    @staticmethod
+    def record(recipient: Author, node: Node | None, activity: dict) -> bool:
+        """
+        Record the delivery of an activity, returning False if it is a replay. Run it in the transaction
+        that handles the activity: a concurrent delivery of the same activity then waits on the unique
+        index and is seen as a replay once this one commits. Activities without an id are never replays.
+        Effects: DB
+        """
+        activity_id = InboxActivity.activity_id_of(activity)
+        if activity_id is None:
+            return True
+        digest = InboxActivity.digest_of(activity_id)
+        try:
+            with transaction.atomic():
+                InboxActivity.objects.create(recipient=recipient, node=node, digest=digest, activity_id=activity_id)
+            return True
+        except IntegrityError:
+            seen = InboxActivity.objects.filter(recipient=recipient, node=node, digest=digest)
+            return seen.filter(received_at__lt=InboxActivity.expired_before()).update(received_at=timezone.now()) > 0
+
+    @staticmethod
+    def purge() -> int:
+        """
+        Delete the records that no longer count as seen, returning how many were deleted.
+        Effects: DB
+        """
+        return InboxActivity.objects.filter(received_at__lt=InboxActivity.expired_before()).delete()[0]
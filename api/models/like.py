@@ -1,6 +1,14 @@
+from __future__ import annotations
+
 import uuid
+from collections import Counter
+from uuid import UUID
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
 
 from .author import Author
 from .comment import Comment
@@ -8,6 +16,15 @@ from .post import Post
 from web_dev_noobs_be.settings import SRV_URL
 
 
+def _parse_uuid(object_id: str | UUID | None) -> UUID | None:
+    if object_id is None:
+        return None
+    try:
+        return UUID(str(object_id))
+    except ValueError:
+        return None
+
+
 class Like(models.Model):
     TYPE_CHOICES = (
         ("post", "post"),
@@ -20,10 +37,66 @@ class Like(models.Model):
     object_id = models.CharField(max_length=36, null=True)
     published = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # also serves the likes of an object
+            models.UniqueConstraint(fields=["object_id", "object_type", "author"], name="unique_like"),
+        ]
+        indexes = [
+            models.Index(fields=["author", "-published", "-id"], name="like_author_published"),
+        ]
+
     @property
     def type(self):
         return "Like"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Like.adjust_like_count(self.object_type, self.object_id, 1)
+
+    @staticmethod
+    def adjust_like_count(object_type: str | None, object_id: str | UUID | None, delta: int):
+        """
+        Add `delta` to the like counter of the liked post or comment, if it is one of ours.
+        Effects: DB
+        """
+        object_uuid = _parse_uuid(object_id)
+        if object_uuid is None:
+            return
+        model = {"post": Post, "comment": Comment}.get(object_type)
+        if model is not None:
+            model.objects.filter(uuid=object_uuid).update(like_count=F("like_count") + delta, modified=timezone.now())
+
+    @staticmethod
+    def reconcile_counts(batch_size: int = 500) -> int:
+        """
+        Recompute `like_count` of every post and comment from the likes, returning the number of rows
+        that were off. Object ids are parsed in Python since likes store them both with and without hyphens.
+        Effects: DB
+        """
+        counts = {"post": Counter(), "comment": Counter()}
+        for object_type, object_id in Like.objects.values_list("object_type", "object_id").iterator(
+                chunk_size=batch_size):
+            object_uuid = _parse_uuid(object_id)
+            if object_type in counts and object_uuid is not None:
+                counts[object_type][object_uuid] += 1
+
+        now = timezone.now()
+        fixed = 0
+        for object_type, model in (("post", Post), ("comment", Comment)):
+            rows = []
+            for row in model.objects.only("uuid", "like_count").iterator(chunk_size=batch_size):
+                if row.like_count != counts[object_type][row.uuid]:
+                    row.like_count = counts[object_type][row.uuid]
+                    row.modified = now
+                    rows.append(row)
+            model.objects.bulk_update(rows, ["like_count", "modified"], batch_size=batch_size)
+            fixed += len(rows)
+        return fixed
+
     def summary(self):
         if self.author.remote:
             return f"{self.author.remote_name} Likes your {self.object_type}"
@@ -46,3 +119,40 @@ class Like(models.Model):
                 return f"{SRV_URL}/api/authors/{author_id}/posts/{post_id}/comments/{self.object_id}"
             except Comment.DoesNotExist:
                 return None
+
+    @staticmethod
+    def object_urls(likes: list[Like]) -> dict[uuid.UUID, str | None]:
+        """
+        The same URLs as Like.object_url for many likes at once, keyed by like id.
+        Effects: DB (one query per object type)
+        """
+        wanted = {"post": set(), "comment": set()}
+        for like in likes:
+            object_uuid = _parse_uuid(like.object_id)
+            if like.object_type in wanted and object_uuid is not None:
+                wanted[like.object_type].add(object_uuid)
+
+        posts = dict(Post.objects.filter(uuid__in=wanted["post"]).values_list("uuid", "author_id"))
+        comments = {
+            comment_uuid: (author_id, post_id)
+            for comment_uuid, author_id, post_id in Comment.objects.filter(uuid__in=wanted["comment"]).values_list(
+                "uuid", "author_id", "post_id")
+        }
+
+        urls = {}
+        for like in likes:
+            object_uuid = _parse_uuid(like.object_id)
+            url = None
+            if like.object_type == "post" and object_uuid in posts:
+                url = f"{SRV_URL}/api/authors/{posts[object_uuid]}/posts/{like.object_id}"
+            elif like.object_type == "comment" and object_uuid in comments:
+                author_id, post_id = comments[object_uuid]
+                url = f"{SRV_URL}/api/authors/{author_id}/posts/{post_id}/comments/{like.object_id}"
+            urls[like.pk] = url
+        return urls
+
+
+@receiver(post_delete, sender=Like)
+def _like_deleted(sender, instance: Like, **kwargs):
+    # runs inside the transaction of the delete, including cascades from deleted authors
+    Like.adjust_like_count(instance.object_type, instance.object_id, -1)
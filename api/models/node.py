@@ -1,13 +1,13 @@
-import logging
 import uuid
 
-import requests
 from django.contrib.auth.models import User
 from django.db import models
 from django.db.models import ForeignKey
 from requests import Response
 from requests.auth import HTTPBasicAuth
 
+from api.federation import NodeClient, client_for
+
 
 class Node(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -23,18 +23,22 @@ class Node(models.Model):
         else:
             return f"{self.host}{postfix}"
 
+    @property
+    def client(self) -> NodeClient:
+        return client_for(self.host)
+
     def r_get(self, postfix: str, *args, **kwargs) -> Response:
-        return requests.get(self.make_url(postfix), auth=(self.our_username, self.our_password), *args, **kwargs)
+        return self.client.get(self.make_url(postfix), auth=(self.our_username, self.our_password), *args, **kwargs)
 
     def r_post(self, postfix: str, auth=None, *args, **kwargs) -> Response:
     # If auth is provided, add it to the request
         if auth:
-            return requests.post(self.make_url(postfix), auth=HTTPBasicAuth(*auth), *args, **kwargs)
+            return self.client.post(self.make_url(postfix), auth=HTTPBasicAuth(*auth), *args, **kwargs)
         else:
-            return requests.post(self.make_url(postfix), *args, **kwargs)
+            return self.client.post(self.make_url(postfix), *args, **kwargs)
 
     def r_put(self, postfix: str, *args, **kwargs) -> Response:
-        return requests.put(self.make_url(postfix), *args, **kwargs)
+        return self.client.put(self.make_url(postfix), *args, **kwargs)
 
     def r_delete(self, postfix: str, *args, **kwargs) -> Response:
-        return requests.delete(self.make_url(postfix), *args, **kwargs)
+        return self.client.delete(self.make_url(postfix), *args, **kwargs)
@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import uuid
 
 from django.db import models
@@ -6,11 +8,50 @@ from .author import Author
 
 
 class Notification(models.Model):
+    """
+    Notifications of posts, comments and likes of local authors refer to them (see `reference`) and are
+    hydrated when the inbox is read. The payloads of remote activities are stored as delivered: the local
+    mirror of a remote object does not have the id, origin and author id of the original. So are those of
+    other activities, e.g. follows.
+    """
+
+    OBJECT_TYPES = (
+        ("post", "post"),
+        ("comment", "comment"),
+        ("like", "like"),
+    )
+
     recipient = models.ForeignKey(
         Author, on_delete=models.CASCADE, related_name="notifications"
     )
     uuid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     type = models.CharField(max_length=100)
-    data = models.JSONField()
+    # the raw payload, None for references
+    data = models.JSONField(null=True, blank=True)
+    object_type = models.CharField(max_length=20, choices=OBJECT_TYPES, null=True, blank=True)
+    object_id = models.UUIDField(null=True, blank=True)
+    actor = models.ForeignKey(Author, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["recipient", "-created_at", "-uuid"], name="notification_recipient_created"),
+        ]
+
+    @staticmethod
+    def reference(recipient: Author, type: str, target) -> Notification:
+        """
+        An unsaved notification referring to a post, comment or like of a local author.
+        """
+        return Notification(recipient=recipient, type=type, object_type=target._meta.model_name,
+                            object_id=target.pk, actor_id=target.author_id)
+
+    @staticmethod
+    def of(recipient: Author, type: str, data, target=None) -> Notification:
+        """
+        An unsaved notification referring to `target` if there is one, storing `data` otherwise.
+        """
+        if target is not None:
+            return Notification.reference(recipient, type, target)
+        return Notification(recipient=recipient, type=type, data=data)
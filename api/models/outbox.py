@@ -0,0 +1,38 @@
+from django.db import models
+from django.utils import timezone
+
+from .node import Node
+
+
+class OutboxItem(models.Model):
+    """
+    An activity waiting to be delivered to the inbox of an author on another node.
+    Items of a node are delivered in id order, see api.outbox.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "p", "pending"
+        DELIVERED = "d", "delivered"
+        FAILED = "f", "failed"
+
+    node = models.ForeignKey(Node, on_delete=models.CASCADE, related_name="outbox")
+    path = models.CharField(max_length=1024)
+    body = models.JSONField()
+
+    status = models.CharField(choices=Status.choices, max_length=1, default=Status.PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    # set while a process is delivering the item, so that no other process sends it at the same time
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "node", "id"], name="outbox_pending_by_node"),
+        ]
+
+    def __str__(self):
+        return f"{self.get_status_display()} {self.node.host}{self.path} [{self.attempts} attempts]"
@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+import base64
+import binascii
+import logging
 import uuid
 
 from django.db import models
 
+from api.image_store import ImageMissing, image_base64, store_image
+from web_dev_noobs_be.settings import SRV_URL
 from .author import Author
 
+logger = logging.getLogger(__name__)
+
 
 class Post(models.Model):
     """
@@ -78,15 +85,71 @@ class Post(models.Model):
 
     content_type = models.CharField(choices=ContentType.choices, max_length=1)
     content = models.TextField()
+    # SHA-256 of the image of an image post, whose bytes are in a StoredImage instead of `content`
+    image_hash = models.CharField(max_length=64, blank=True)
 
     author = models.ForeignKey(Author, on_delete=models.CASCADE, related_name="posts")
 
-    count = models.IntegerField(default=0)
+    # maintained by Comment and Like when they are saved or deleted (see `manage.py reconcile_counters`)
+    comment_count = models.IntegerField(default=0)
+    like_count = models.IntegerField(default=0)
     comments = models.URLField(blank=True)
 
     published = models.DateTimeField(auto_now_add=True)
+    # bumped on every save, used to answer conditional GETs (see api.conditional)
+    modified = models.DateTimeField(auto_now=True)
     visibility = models.CharField(choices=Visibility.choices, max_length=1)
 
+    class Meta:
+        indexes = [
+            # an author's posts and the global feed, newest first
+            models.Index(fields=["author", "visibility", "-published", "-uuid"], name="post_author_visibility"),
+            models.Index(fields=["visibility", "-published", "-uuid"], name="post_visibility_published"),
+            models.Index(fields=["extern_id"], condition=models.Q(extern_id__isnull=False), name="post_extern_id"),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.store_image_content()
+        super().save(*args, **kwargs)
+
+    def store_image_content(self):
+        """
+        Move the base64 content of an image post into the image store, as done on every save.
+        Needed before bulk_create, which does not call save().
+        Effects: filesystem
+        """
+        if self.is_image() and self.content:
+            try:
+                self.image_hash = store_image(base64.b64decode(self.content, validate=True))
+                self.content = ""
+            except (binascii.Error, ValueError):
+                # not valid base64, keep it as it was sent
+                self.image_hash = ""
+        elif not self.is_image():
+            self.image_hash = ""
+
+    def wire_content(self) -> str:
+        """
+        The content as sent to clients and other nodes: stored images are base64 encoded again.
+        """
+        if self.image_hash and self.is_image():
+            try:
+                return image_base64(self.image_hash)
+            except ImageMissing:
+                # a listing must not fail because of one post
+                logger.error("Image %s of post %s is missing", self.image_hash, self.pk)
+                return ""
+        return self.content
+
+    def image_url(self) -> str | None:
+        """
+        The URL of the stored image of an image post, pinned to its digest so that it may be cached as
+        immutable. `&w=<width>` selects a resized variant.
+        """
+        if not (self.image_hash and self.is_image()):
+            return None
+        return f"{SRV_URL}/api/authors/{self.author_id.hex}/posts/{self.uuid.hex}/image?v={self.image_hash}"
+
     def __str__(self):
         username = self.author.user.username if self.author.user else 'Remote Author'
         return f"Post {self.uuid.hex} [by {username}]" 
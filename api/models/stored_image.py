@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class StoredImage(models.Model):
+    """
+    The bytes of an image post, keyed by their SHA-256 digest (`Post.image_hash`). This is the durable
+    copy: the files in IMAGE_STORE_DIR only cache it on the local disk, see api.image_store.
+    """
+
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.digest
@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import RowNumber
+
+from .author import Author
+from .friendship import Friendship
+from .post import Post
+
+
+class TimelineEntry(models.Model):
+    """
+    A post in the home timeline of a local author.
+    Timelines are written when a post is created (fan-out on write) and refreshed when follows change,
+    so reading a home feed is a single range scan over (owner, published).
+    """
+
+    owner = models.ForeignKey(Author, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+
+    # copied from the post so that the timeline can be ordered without a join
+    published = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "post"], name="unique_timeline_entry"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "-published", "-post"], name="timeline_owner_published"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.owner} <- {self.post}"
+
+    @staticmethod
+    def visible_to(owner: Author) -> Q:
+        """
+        Matches posts that belong in the owner's home timeline: all of their own posts, plus public and
+        (for friends) friends-only posts of authors they follow.
+        """
+        follows = Author.following.through.objects.filter(from_author=owner, to_author=OuterRef("author"))
+        return Q(author=owner) | (
+            Q(Exists(follows))
+            & (Q(visibility=Post.Visibility.PUBLIC)
+               | (Q(visibility=Post.Visibility.FRIENDS) & Friendship.friends_filter(owner)))
+        )
+
+    @staticmethod
+    def recipients(post: Post) -> models.QuerySet[Author]:
+        """
+        Local authors whose home timeline should contain the post.
+        """
+        author = post.author
+        follows = Author.following.through.objects
+        readers = Q(Exists(follows.filter(from_author=OuterRef("pk"), to_author=author)))
+        match Post.Visibility(post.visibility):
+            case Post.Visibility.PUBLIC:
+                pass
+            case Post.Visibility.FRIENDS:
+                friendship = Friendship.objects.filter(author=OuterRef("pk"), friend=author)
+                if author.remote:
+                    readers &= Q(Exists(friendship)) | Q(Exists(follows.filter(from_author=author, to_author=OuterRef("pk"))))
+                else:
+                    readers &= Q(Exists(friendship))
+            case _:
+                readers = Q(pk__in=[])
+
+        return Author.objects.filter(Q(pk=author.pk) | readers, node=None)
+
+    @staticmethod
+    def fan_out(post: Post):
+        """
+        Push a new (or re-published) post into the timelines of everyone who may read it.
+        Effects: DB
+        """
+        with transaction.atomic():
+            TimelineEntry.objects.filter(post=post).delete()
+            owners = list(TimelineEntry.recipients(post).values_list("pk", flat=True))
+            TimelineEntry.objects.bulk_create(
+                [TimelineEntry(owner_id=owner, post=post, published=post.published) for owner in owners],
+                ignore_conflicts=True,
+            )
+            TimelineEntry.trim(owners)
+
+    @staticmethod
+    def refresh(owner: Author, author: Author | None = None):
+        """
+        Recompute the owner's timeline entries for posts by `author`, or their whole timeline if no
+        author is given. Used whenever a follow between the two changes.
+        Effects: DB
+        """
+        if owner.remote:
+            return
+
+        entries = TimelineEntry.objects.filter(owner=owner)
+        posts = Post.objects.filter(TimelineEntry.visible_to(owner))
+        if author is not None:
+            entries = entries.filter(post__author=author)
+            posts = posts.filter(author=author)
+
+        posts = posts.order_by("-published", "-uuid").values_list("pk", "published")[:settings.TIMELINE_MAX_ENTRIES]
+        with transaction.atomic():
+            entries.delete()
+            TimelineEntry.objects.bulk_create(
+                [TimelineEntry(owner=owner, post_id=post_id, published=published) for post_id, published in posts],
+                ignore_conflicts=True,
+            )
+            TimelineEntry.trim([owner.pk])
+
+    @staticmethod
+    def trim(owner_ids: list):
+        """
+        Drop the oldest entries of the given timelines beyond TIMELINE_MAX_ENTRIES.
+        Effects: DB
+        """
+        if not owner_ids:
+            return
+
+        overflow = TimelineEntry.objects.filter(owner_id__in=owner_ids).annotate(
+            rank=models.Window(
+                RowNumber(),
+                partition_by=F("owner"),
+                order_by=[F("published").desc(), F("post").desc()],
+            )
+        ).filter(rank__gt=settings.TIMELINE_MAX_ENTRIES).values_list("pk", flat=True)
+        TimelineEntry.objects.filter(pk__in=list(overflow)).delete()
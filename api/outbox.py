@@ -0,0 +1,227 @@
+"""
+Durable delivery of activities to the inboxes of remote authors.
+
+Views only `enqueue` an activity and answer right away; the outbox is drained by a background worker
+thread of the process that enqueued it, and by `manage.py drain_outbox --loop`, which picks up what
+other processes left behind. Items of the same node are delivered strictly in the order they were
+queued: a node's queue stops at the first item that has to be retried, while different nodes are
+delivered concurrently through `gather_calls`. Failed attempts are retried with exponential backoff
+until OUTBOX_MAX_ATTEMPTS, after which the item is marked as failed.
+
+Any number of processes may drain the outbox at once: a pass first claims a node's queue by leasing its
+oldest pending item with a conditional UPDATE, which only one process can win, and leases the rest of
+the batch along with it. The lease expires after OUTBOX_LEASE seconds, so the items of a process that
+died are delivered by another one.
+
+Delivery is at-least-once: an activity can be sent again if the process dies between the remote
+inbox accepting it and the outcome being saved.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from datetime import timedelta
+from functools import partial
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .federation import gather_calls
+from .models import Node, OutboxItem
+
+logger = logging.getLogger(__name__)
+
+# statuses that are worth retrying even though they are client errors
+RETRY_STATUSES = (408, 425, 429)
+
+
+def enqueue(node: Node, path: str, body: dict) -> OutboxItem:
+    """
+    Queue `body` for delivery to `path` on `node`, waking the worker once the transaction commits.
+    Effects: DB
+    """
+    item = OutboxItem.objects.create(node=node, path=path, body=body)
+    if settings.OUTBOX_WORKER:
+        transaction.on_commit(wake_worker)
+    return item
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_BASE * 2 ** (attempts - 1), settings.OUTBOX_RETRY_MAX))
+
+
+def _stops(status_code: int | None) -> bool:
+    """
+    Whether an outcome has to be retried, which stops the node's queue.
+    """
+    return status_code is None or status_code >= 500 or status_code in RETRY_STATUSES
+
+
+def _send(node: Node, items: list[OutboxItem], outcomes: list) -> list[tuple[OutboxItem, int | None, str]]:
+    """
+    POST the node's items in order, stopping after the first one that has to be retried.
+    Appends (item, status code or None, error) to `outcomes` for every item as soon as it was attempted,
+    so that the progress of a batch that missed the deadline is known, and returns them.
+    Effects: remote HTTP
+    """
+    for item in items:
+        try:
+            r = node.r_post(item.path, json=item.body, auth=(node.our_username, node.our_password))
+        except requests.RequestException as e:
+            outcomes.append((item, None, repr(e)))
+            break
+        outcomes.append((item, r.status_code, "" if r.ok else f"HTTP {r.status_code}: {r.text[:500]}"))
+        if _stops(r.status_code):
+            break
+    return outcomes
+
+
+def _record(item: OutboxItem, status_code: int | None, error: str, now):
+    item.attempts += 1
+    item.last_error = error
+    item.claimed_until = None
+    if status_code is not None and 200 <= status_code < 300:
+        item.status = OutboxItem.Status.DELIVERED
+        item.delivered_at = now
+    elif status_code is not None and status_code < 500 and status_code not in RETRY_STATUSES:
+        # the remote inbox rejected the activity, sending it again will not help
+        item.status = OutboxItem.Status.FAILED
+    elif item.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        item.status = OutboxItem.Status.FAILED
+    else:
+        item.next_attempt_at = now + retry_delay(item.attempts)
+
+
+def _claim(node: Node, now) -> list[OutboxItem]:
+    """
+    Lease up to OUTBOX_BATCH_SIZE of the node's pending items in order, if its oldest pending item is due
+    and not claimed by another process. Returns the leased items, possibly none.
+    Effects: DB
+    """
+    pending = OutboxItem.objects.filter(node=node, status=OutboxItem.Status.PENDING)
+    items = list(pending.order_by("id")[:settings.OUTBOX_BATCH_SIZE])
+    # a queue waiting on a retry blocks everything behind it, to keep the node's activities in order
+    if not items or items[0].next_attempt_at > now:
+        return []
+
+    lease = now + timedelta(seconds=settings.OUTBOX_LEASE)
+    unclaimed = Q(claimed_until__isnull=True) | Q(claimed_until__lte=now)
+    with transaction.atomic():
+        # the oldest pending item stands for the node's queue, whoever leases it delivers the batch
+        if not pending.filter(unclaimed, pk=items[0].pk, next_attempt_at__lte=now).update(claimed_until=lease):
+            return []
+        pending.filter(pk__in=[item.pk for item in items[1:]]).update(claimed_until=lease)
+    items = list(pending.filter(pk__in=[item.pk for item in items], claimed_until=lease).order_by("id"))
+    for item in items:
+        item.node = node
+    return items
+
+
+def deliver_due(nodes: list[Node] | None = None) -> dict[str, dict[str, int]]:
+    """
+    One pass over the outbox: for every node whose oldest pending item is due and not claimed by another
+    process, claim and attempt up to OUTBOX_BATCH_SIZE of its pending items in order. Returns per-node
+    counts of the outcomes.
+    Effects: DB, remote HTTP
+    """
+    now = timezone.now()
+    if nodes is None:
+        nodes = list(Node.objects.filter(enabled=True, outbox__status=OutboxItem.Status.PENDING).distinct())
+
+    batches = []
+    for node in nodes:
+        # nodes with an open circuit are left alone so that their items do not use up attempts
+        if not node.client.breaker.available():
+            continue
+        items = _claim(node, now)
+        if items:
+            batches.append((node, items, []))
+
+    results = gather_calls(
+        [(node.host, partial(_send, node, items, progress)) for node, items, progress in batches],
+        deadline=settings.OUTBOX_DRAIN_DEADLINE,
+    )
+
+    report = {}
+    attempted = []
+    for (node, items, progress), outcomes in zip(batches, results):
+        if outcomes is None:
+            # the batch failed or missed the deadline: keep the outcomes of the items it got through, and
+            # count a failed attempt for the one it was busy with (its request times out at the deadline)
+            outcomes = list(progress)
+            if len(outcomes) < len(items) and not any(_stops(status_code) for _, status_code, _ in outcomes):
+                outcomes.append((items[len(outcomes)], None, "delivery did not finish"))
+        counts = report.setdefault(node.host, {"delivered": 0, "failed": 0, "retrying": 0})
+        for item, status_code, error in outcomes:
+            _record(item, status_code, error, now)
+            attempted.append(item)
+            if item.status == OutboxItem.Status.DELIVERED:
+                counts["delivered"] += 1
+            elif item.status == OutboxItem.Status.FAILED:
+                counts["failed"] += 1
+                logger.warning(f"giving up on delivering outbox item {item.pk} to {node.host}: {error}")
+            else:
+                counts["retrying"] += 1
+
+    OutboxItem.objects.bulk_update(
+        attempted, ["status", "attempts", "next_attempt_at", "last_error", "delivered_at", "claimed_until"],
+        batch_size=500,
+    )
+    # release the items behind the one that stopped a batch
+    claimed = {item.pk for _, items, _ in batches for item in items}
+    OutboxItem.objects.filter(pk__in=claimed - {item.pk for item in attempted}).update(claimed_until=None)
+    return report
+
+
+def drain(max_passes: int = 100) -> dict[str, dict[str, int]]:
+    """
+    Deliver until nothing is due any more (or `max_passes` is reached), merging the pass reports.
+    Effects: DB, remote HTTP
+    """
+    total = {}
+    for _ in range(max_passes):
+        report = deliver_due()
+        if not report:
+            break
+        for host, counts in report.items():
+            merged = total.setdefault(host, {"delivered": 0, "failed": 0, "retrying": 0})
+            for key, value in counts.items():
+                merged[key] += value
+        if not any(counts["delivered"] + counts["failed"] for counts in report.values()):
+            break
+    return total
+
+
+_wake = threading.Event()
+_worker_lock = threading.Lock()
+_worker: threading.Thread | None = None
+
+
+def _work():
+    while True:
+        _wake.wait(timeout=settings.OUTBOX_POLL_INTERVAL)
+        _wake.clear()
+        try:
+            close_old_connections()
+            drain()
+        except Exception:
+            logger.exception("outbox delivery failed")
+        finally:
+            connection.close()
+
+
+def wake_worker():
+    """
+    Start the outbox worker thread of this process if needed and have it deliver right away.
+    """
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        with _worker_lock:
+            if _worker is None or not _worker.is_alive():
+                _worker = threading.Thread(target=_work, name="outbox", daemon=True)
+                _worker.start()
+    _wake.set()
@@ -0,0 +1,147 @@
+"""
+Pagination helpers for list endpoints.
+
+Besides the classic `page`/`size` pagination, listings support keyset (cursor) pagination: a page
+is addressed by the sort key of the last row that was served instead of an offset, so every
+page is an index range scan of the same cost and no COUNT(*) is needed.
+"""
+
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from datetime import datetime
+from uuid import UUID
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q, QuerySet
+from django.http import HttpResponseBadRequest, HttpResponseNotFound
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _field_name(order: str) -> str:
+    return order.lstrip("-")
+
+
+def _key_value(value) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    elif isinstance(value, UUID):
+        return value.hex
+    else:
+        return str(value)
+
+
+def encode_cursor(obj, ordering: tuple[str, ...]) -> str:
+    """
+    Opaque cursor pointing just past obj for the given ordering.
+    """
+    values = [_key_value(getattr(obj, _field_name(order))) for order in ordering]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, queryset: QuerySet, ordering: tuple[str, ...]) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor(cursor)
+
+    opts = queryset.model._meta
+    try:
+        return [opts.get_field(_field_name(order)).to_python(value) for order, value in zip(ordering, values)]
+    except ValidationError as e:
+        raise InvalidCursor(cursor) from e
+
+
+def keyset_filter(ordering: tuple[str, ...], values: list) -> Q:
+    """
+    Rows strictly after the key `values` in `ordering`, i.e. the lexicographic comparison
+    (a, b, ...) < (va, vb, ...) expanded into a disjunction.
+    """
+    condition = Q()
+    for i, order in enumerate(ordering):
+        lookup = "lt" if order.startswith("-") else "gt"
+        term = Q(**{_field_name(o): v for o, v in zip(ordering[:i], values[:i])})
+        term &= Q(**{f"{_field_name(order)}__{lookup}": values[i]})
+        condition |= term
+    return condition
+
+
+def keyset_page(queryset: QuerySet, ordering: tuple[str, ...], cursor: str | None, size: int) -> tuple[list, str | None]:
+    """
+    A page of at most `size` rows following `cursor` (None for the first page), together with the
+    cursor of the next page or None if this is the last one.
+    Effects: DB (one query)
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor is not None:
+        queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, queryset, ordering)))
+
+    items = list(queryset[:size + 1])
+    if len(items) > size:
+        return items[:size], encode_cursor(items[size - 1], ordering)
+    else:
+        return items, None
+
+
+def get_pagination_data(request):
+    page_number = request.GET.get("page")
+    size = request.GET.get("size")
+
+    if page_number is None or size is None:
+        return False, HttpResponseBadRequest("Page number and size must be provided")
+
+    try:
+        page_number = int(page_number)
+        if page_number < 1:
+            return False, HttpResponseBadRequest("Page number must be greater than 0")
+    except ValueError:
+        return False, HttpResponseBadRequest("Page number must be an integer")
+
+    try:
+        size = int(size)
+        if size < 1:
+            return False, HttpResponseBadRequest("Size must be greater than 0")
+    except ValueError:
+        return False, HttpResponseBadRequest("Size must be an integer")
+
+    return page_number, size
+
+
+def paginate(request, queryset, ordering: tuple[str, ...]):
+    """
+    Paginates a queryset with the `page`/`size` parameters, or with keyset pagination when the
+    request carries a `cursor` parameter (empty for the first page).
+    Returns (items, extra response fields), or (False, error response).
+    """
+    if "cursor" not in request.GET:
+        page_number, size = get_pagination_data(request)
+        if page_number is False:
+            return False, size
+
+        paginator = Paginator(queryset.order_by(*ordering), per_page=size)
+        if page_number > paginator.num_pages:
+            return False, HttpResponseNotFound("Page not found")
+        return list(paginator.get_page(page_number)), {}
+
+    try:
+        size = int(request.GET.get("size", ""))
+        if size < 1:
+            return False, HttpResponseBadRequest("Size must be greater than 0")
+    except ValueError:
+        return False, HttpResponseBadRequest("Size must be an integer")
+
+    try:
+        items, next_cursor = keyset_page(queryset, ordering, request.GET["cursor"] or None, size)
+    except InvalidCursor:
+        return False, HttpResponseBadRequest("Invalid cursor")
+    return items, {"size": size, "next": next_cursor}
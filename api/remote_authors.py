@@ -0,0 +1,151 @@
+"""
+Discovery of the authors hosted on other nodes.
+
+Every node is crawled page by page, all nodes at once, and the authors found are upserted in bulk,
+keyed on (node, extern_id) so that renamed authors are updated rather than duplicated.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .federation import gather_calls
+from .models import Author, Node
+from .remote_cache import invalidate_remote_profiles
+
+logger = logging.getLogger(__name__)
+
+LAST_SCAN_KEY = "remote-authors-scan:last"
+
+_scan_lock = threading.Lock()
+
+
+def crawl_node(node: Node, page_size: int) -> list[dict]:
+    """
+    Every author listed by a node, following its pagination until a short, empty or failed page.
+    Effects: remote HTTP
+    """
+    authors = []
+    for page in range(1, settings.REMOTE_SCAN_MAX_PAGES + 1):
+        r = node.r_get(f"authors/?page={page}&size={page_size}")
+        if not r.ok:
+            break
+        data = r.json()
+        items = data if isinstance(data, list) else data.get("items", [])
+        authors += items
+        if len(items) < page_size:
+            break
+    return authors
+
+
+def upsert_authors(node: Node, items: list[dict]) -> tuple[int, int]:
+    """
+    Create or rename the node's authors listed in `items`, returning (created, updated).
+    Effects: DB, cache
+    """
+    names = {}
+    for item in items:
+        if "id" in item:
+            names[item["id"].rstrip("/").split("/").pop()] = item.get("displayName")
+
+    existing = {}
+    extern_ids = list(names)
+    for i in range(0, len(extern_ids), 500):
+        rows = Author.objects.filter(node=node, extern_id__in=extern_ids[i:i + 500])
+        for author in rows.only("id", "extern_id", "remote_name", "modified"):
+            existing.setdefault(author.extern_id, author)
+
+    created = [
+        Author(node=node, extern_id=extern_id, remote_name=name)
+        for extern_id, name in names.items() if extern_id not in existing
+    ]
+    updated = []
+    now = timezone.now()
+    for extern_id, author in existing.items():
+        if author.remote_name != names[extern_id]:
+            author.remote_name = names[extern_id]
+            author.modified = now
+            updated.append(author)
+
+    with transaction.atomic():
+        Author.objects.bulk_create(created, batch_size=500)
+        Author.objects.bulk_update(updated, ["remote_name", "modified"], batch_size=500)
+
+    # the cached profiles of renamed authors have the old name
+    invalidate_remote_profiles(updated)
+    return len(created), len(updated)
+
+
+def scan_remote_authors(nodes: list[Node] | None = None, page_size: int = 100) -> list[dict]:
+    """
+    Crawl all (enabled) nodes concurrently and upsert their authors, reporting per-node counts and timings.
+    Effects: remote HTTP, DB
+    """
+    if nodes is None:
+        nodes = list(Node.objects.filter(enabled=True))
+
+    def timed_crawl(node):
+        start = time.monotonic()
+        return crawl_node(node, page_size), time.monotonic() - start
+
+    results = gather_calls(
+        [(node.host, partial(timed_crawl, node)) for node in nodes],
+        deadline=settings.REMOTE_SCAN_DEADLINE,
+    )
+
+    report = []
+    for node, result in zip(nodes, results):
+        if result is None:
+            report.append({"node": node.host, "ok": False})
+            continue
+        items, elapsed = result
+        start = time.monotonic()
+        created, updated = upsert_authors(node, items)
+        report.append({
+            "node": node.host,
+            "ok": True,
+            "authors": len(items),
+            "created": created,
+            "updated": updated,
+            "fetch_seconds": round(elapsed, 3),
+            "upsert_seconds": round(time.monotonic() - start, 3),
+        })
+
+    cache.set(LAST_SCAN_KEY, {"finished_at": time.time(), "nodes": report}, timeout=None)
+    return report
+
+
+def last_scan() -> dict | None:
+    return cache.get(LAST_SCAN_KEY)
+
+
+def start_background_scan() -> bool:
+    """
+    Start a scan in a background thread, unless one is running or the last one finished less than
+    REMOTE_SCAN_INTERVAL seconds ago. Returns whether a scan was started.
+    """
+    last = last_scan()
+    if last is not None and time.time() - last["finished_at"] < settings.REMOTE_SCAN_INTERVAL:
+        return False
+    if not _scan_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            scan_remote_authors()
+        except Exception:
+            logger.exception("remote author scan failed")
+        finally:
+            connection.close()
+            _scan_lock.release()
+
+    threading.Thread(target=run, name="remote-authors-scan", daemon=True).start()
+    return True
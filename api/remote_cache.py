@@ -0,0 +1,328 @@
+"""
+Caches for data fetched from other nodes.
+
+Entries are kept in Django's cache, which must be shared (see CACHES) for an invalidation in one process
+to reach the others. An entry is fresh for its TTL. After that it is revalidated
+with conditional requests (If-None-Match / If-Modified-Since). While the node cannot be reached,
+the stale copy is served instead.
+
+Post listings of remote authors are stale-while-revalidate: an expired listing is served as is while
+it is refreshed in the background, incrementally, newest first until a page with a known post.
+Comment and like listings of remote posts (`remote_json`) are stale-while-revalidate as well.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+from concurrent.futures import Future
+from functools import partial
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+
+from .federation import run_in_background
+from .models import Author, Node
+
+logger = logging.getLogger(__name__)
+
+
+class RemoteFetchError(Exception):
+    """
+    A remote resource could not be fetched and no cached copy exists.
+    """
+
+    def __init__(self, status: int, content: bytes | str):
+        super().__init__(status, content)
+        self.status = status
+        self.content = content
+
+
+def ensure_cache_table(using: str = "default", **kwargs):
+    """
+    Create the table of a database cache if it does not exist yet; other cache backends need none.
+    Effects: DB
+    """
+    call_command("createcachetable", database=using, verbosity=0)
+
+
+def _profile_key(author: Author) -> str:
+    return f"remote-profile:{author.pk}"
+
+
+def remote_profile(author: Author) -> dict:
+    """
+    The profile of a remote author as served by their node.
+    Effects: remote HTTP when the cached copy is missing or expired
+    """
+    key = _profile_key(author)
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None and now - entry["fetched_at"] < settings.REMOTE_PROFILE_TTL:
+        return entry["data"]
+
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        r = author.node.r_get(f"/authors/{author.extern_id}/", headers=headers)
+    except requests.RequestException as e:
+        if entry is not None:
+            return entry["data"]
+        raise RemoteFetchError(502, f"Unable to reach {author.node.host}: {e}")
+
+    if r.status_code == 304 and entry is not None:
+        entry["fetched_at"] = now
+    elif r.ok:
+        entry = {
+            "data": r.json(),
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "fetched_at": now,
+        }
+    elif entry is not None and r.status_code >= 500:
+        return entry["data"]
+    else:
+        raise RemoteFetchError(r.status_code, r.content)
+
+    cache.set(key, entry, timeout=settings.REMOTE_PROFILE_STALE_TTL)
+    return entry["data"]
+
+
+def invalidate_remote_profile(author: Author):
+    invalidate_remote_profiles([author])
+
+
+def invalidate_remote_profiles(authors):
+    cache.delete_many([_profile_key(author) for author in authors])
+
+
+def _posts_key(author: Author) -> str:
+    return f"remote-posts:{author.pk}"
+
+
+def _post_items(data) -> list[dict]:
+    # nodes answer with a bare list, {"items": [...]} or {"posts": [...]}
+    if isinstance(data, list):
+        return data
+    return data.get("items", data.get("posts", []))
+
+
+def _fetch_posts(author: Author, known: dict | None) -> tuple[list[dict], bool]:
+    """
+    The author's posts, newest first, capped at REMOTE_POSTS_MAX, and whether they are all of them.
+    When the `known` cache entry is given, pages are only fetched until one contains a known post, and
+    the older known posts are kept.
+    Effects: remote HTTP
+    """
+    size = settings.REMOTE_POSTS_PAGE_SIZE
+    known_ids = {post.get("id") for post in known["items"]} if known is not None else set()
+    fetched = []
+    complete = False
+    for page in range(1, math.ceil(settings.REMOTE_POSTS_MAX / size) + 1):
+        r = author.node.r_get(f"authors/{author.extern_id}/posts/?page={page}&size={size}")
+        if r.status_code == 404 and page > 1:
+            # some nodes (like this one) answer 404 past the last page
+            complete = True
+            break
+        if not r.ok:
+            raise RemoteFetchError(r.status_code, r.content)
+        items = _post_items(r.json())
+        fetched += items
+        if len(items) < size:
+            complete = True
+            break
+        if any(item.get("id") in known_ids for item in items):
+            break
+
+    if known is not None and not complete:
+        fetched_ids = {item.get("id") for item in fetched}
+        fetched += [post for post in known["items"] if post.get("id") not in fetched_ids]
+        # the older posts come from the known listing, which may have been cut already
+        complete = known["complete"]
+    return fetched[:settings.REMOTE_POSTS_MAX], complete and len(fetched) <= settings.REMOTE_POSTS_MAX
+
+
+def _store_posts(author: Author, items: list[dict], complete: bool) -> dict:
+    entry = {"items": items, "complete": complete, "fetched_at": time.time()}
+    cache.set(_posts_key(author), entry, timeout=settings.REMOTE_POSTS_STALE_TTL)
+    return entry
+
+
+def _refresh_posts(author: Author) -> dict:
+    entry = cache.get(_posts_key(author))
+    try:
+        items, complete = _fetch_posts(author, entry)
+    except requests.RequestException as e:
+        raise RemoteFetchError(502, f"Unable to reach {author.node.host}: {e}")
+    return _store_posts(author, items, complete)
+
+
+def refresh_remote_posts(author: Author) -> list[dict]:
+    """
+    Bring the cached post listing of a remote author up to date.
+    Effects: remote HTTP
+    """
+    return _refresh_posts(author)["items"]
+
+
+_refreshing: dict[str, Future] = {}
+_refreshing_lock = threading.Lock()
+
+
+def _refresh_quietly(author: Author):
+    try:
+        refresh_remote_posts(author)
+    except RemoteFetchError as e:
+        logger.info(f"could not refresh the posts of {author.pk}: {e.status}")
+        # keep serving the stale listing, and try again after another REMOTE_POSTS_TTL
+        entry = cache.get(_posts_key(author))
+        if entry is not None:
+            _store_posts(author, entry["items"], entry["complete"])
+
+
+def _revalidate(key: str, call) -> Future:
+    """
+    Run `call` in the background, unless a refresh of the same cache entry is already running.
+    """
+    with _refreshing_lock:
+        future = _refreshing.get(key)
+        if future is not None:
+            return future
+        future = _refreshing[key] = run_in_background(call)
+    future.add_done_callback(lambda _: _refreshing.pop(key, None))
+    return future
+
+
+def _posts_entry(author: Author) -> dict:
+    entry = cache.get(_posts_key(author))
+    if entry is None:
+        return _refresh_posts(author)
+    if time.time() - entry["fetched_at"] >= settings.REMOTE_POSTS_TTL:
+        _revalidate(_posts_key(author), partial(_refresh_quietly, author))
+    return entry
+
+
+def remote_posts(author: Author) -> list[dict]:
+    """
+    The posts of a remote author, newest first. Only the first call for an author waits for its node;
+    afterwards the cached listing is served and refreshed in the background once older than
+    REMOTE_POSTS_TTL.
+    Effects: remote HTTP when nothing is cached
+    """
+    return _posts_entry(author)["items"]
+
+
+def remote_post_count(author: Author) -> tuple[int, bool]:
+    """
+    The number of posts in the listing of a remote author, and whether it is exact: listings are cut
+    at REMOTE_POSTS_MAX posts, in which case it is a lower bound.
+    Effects: remote HTTP when nothing is cached
+    """
+    entry = _posts_entry(author)
+    return len(entry["items"]), entry["complete"]
+
+
+def invalidate_remote_posts(author: Author):
+    """
+    Mark the cached post listing as expired, so that it is served once more while being refreshed.
+    """
+    invalidate_remote_post_listings([author])
+
+
+def invalidate_remote_post_listings(authors):
+    """
+    `invalidate_remote_posts` for many authors, with one cache read and one write.
+    """
+    entries = cache.get_many([_posts_key(author) for author in authors])
+    for entry in entries.values():
+        entry["fetched_at"] = 0
+    if entries:
+        cache.set_many(entries, timeout=settings.REMOTE_POSTS_STALE_TTL)
+
+
+THREAD_RE = re.compile(r"posts/([^/?]+)")
+
+
+def _thread_version_key(post_id: str) -> str:
+    return f"remote-thread:{post_id}"
+
+
+def _json_key(node: Node, path: str, page, size) -> str:
+    # every cached page of a post's comments and likes includes the post's version, so that
+    # bumping it invalidates them all at once
+    match = THREAD_RE.search(path)
+    version = cache.get_or_set(_thread_version_key(match.group(1)), 0, timeout=None) if match else 0
+    digest = hashlib.sha1(f"{path}?page={page}&size={size}".encode()).hexdigest()
+    return f"remote-json:{node.pk}:{version}:{digest}"
+
+
+def _fetch_json(node: Node, path: str, page, size, key: str) -> dict:
+    url = path if page is None else f"{path}?page={page}&size={size}"
+    try:
+        r = node.r_get(url)
+    except requests.RequestException as e:
+        raise RemoteFetchError(502, f"Unable to reach {node.host}: {e}")
+    if not r.ok:
+        raise RemoteFetchError(r.status_code, r.content)
+    entry = {"data": r.json(), "fetched_at": time.time()}
+    cache.set(key, entry, timeout=settings.REMOTE_JSON_STALE_TTL)
+    return entry
+
+
+def _refresh_json_quietly(node: Node, path: str, page, size, key: str):
+    try:
+        _fetch_json(node, path, page, size, key)
+    except RemoteFetchError as e:
+        logger.info(f"could not refresh {node.host}{path}: {e.status}")
+        entry = cache.get(key)
+        if entry is not None:
+            entry["fetched_at"] = time.time()
+            cache.set(key, entry, timeout=settings.REMOTE_JSON_STALE_TTL)
+
+
+def remote_json(node: Node, path: str, page: int | None = None, size: int | None = None):
+    """
+    The JSON served by a node at `path` (with the given page and size), cached for REMOTE_JSON_TTL
+    seconds and then served stale while it is refreshed in the background.
+    Meant for comment and like listings of remote posts, see `invalidate_remote_thread`.
+    Effects: remote HTTP when nothing is cached
+    """
+    path = path.lstrip("/")
+    key = _json_key(node, path, page, size)
+    entry = cache.get(key)
+    if entry is None:
+        return _fetch_json(node, path, page, size, key)["data"]
+    if time.time() - entry["fetched_at"] >= settings.REMOTE_JSON_TTL:
+        _revalidate(key, partial(_refresh_json_quietly, node, path, page, size, key))
+    return entry["data"]
+
+
+def invalidate_remote_thread(url: str):
+    """
+    Drop the cached comments and likes of the post that `url` (a post, comment or like id) belongs to.
+    """
+    invalidate_remote_threads([url])
+
+
+def invalidate_remote_threads(urls):
+    """
+    `invalidate_remote_thread` for many URLs, bumping the version of each post once.
+    """
+    post_ids = {match.group(1) for match in (THREAD_RE.search(url or "") for url in urls) if match}
+    for post_id in post_ids:
+        key = _thread_version_key(post_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
@@ -0,0 +1,190 @@
+"""
+Full-text search over posts and comments.
+
+On SQLite, posts and comments are indexed in the FTS5 table `search_fts`, kept in sync by triggers on
+their tables. FTS rows are keyed through `search_key`, which gives every indexed object a stable integer
+rowid (the implicit rowids of tables with UUID keys may change on VACUUM). On Postgres, GIN expression
+indexes over the same `to_tsvector` expressions the queries use need no syncing at all. Both are created
+by migrations, which keep their own copy of these definitions; a change here needs a migration.
+
+The content of image and base64 posts is not text and is not indexed.
+
+Only the SEARCH_MAX_RESULTS most relevant matches are considered, and visibility is applied to them
+with the rules of the feed (see api.feed), so a page never needs more than three queries.
+"""
+
+from __future__ import annotations
+
+import re
+from uuid import UUID
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, connections, transaction
+from django.db.models import Case, CharField, F, Value, When
+
+from .feed import visible_posts
+from .models import Author, Comment, Post
+
+BINARY_TYPES = (Post.ContentType.PNG, Post.ContentType.JPEG, Post.ContentType.BASE64)
+
+WORD_RE = re.compile(r"\w+")
+
+# the text of image and base64 posts is their title and description only
+_POST_BODY = "coalesce({row}.description, '') || ' ' || CASE WHEN {row}.content_type IN ('p', 'j', 'b') THEN '' " \
+             "ELSE {row}.content END"
+
+SQLITE_SCHEMA = [
+    "CREATE TABLE search_key (rowid INTEGER PRIMARY KEY, kind TEXT NOT NULL, object_id CHAR(32) NOT NULL, "
+    "UNIQUE (object_id, kind))",
+    "CREATE VIRTUAL TABLE search_fts USING fts5(title, body, tokenize = 'porter unicode61 remove_diacritics 2')",
+    f"""CREATE TRIGGER search_post_insert AFTER INSERT ON api_post BEGIN
+        INSERT INTO search_key (kind, object_id) VALUES ('post', new.uuid);
+        INSERT INTO search_fts (rowid, title, body) VALUES (last_insert_rowid(), new.title, {_POST_BODY.format(row="new")});
+    END""",
+    f"""CREATE TRIGGER search_post_update AFTER UPDATE OF title, description, content, content_type ON api_post BEGIN
+        UPDATE search_fts SET title = new.title, body = {_POST_BODY.format(row="new")}
+        WHERE rowid = (SELECT rowid FROM search_key WHERE object_id = new.uuid AND kind = 'post');
+    END""",
+    """CREATE TRIGGER search_post_delete AFTER DELETE ON api_post BEGIN
+        DELETE FROM search_fts WHERE rowid = (SELECT rowid FROM search_key WHERE object_id = old.uuid AND kind = 'post');
+        DELETE FROM search_key WHERE object_id = old.uuid AND kind = 'post';
+    END""",
+    """CREATE TRIGGER search_comment_insert AFTER INSERT ON api_comment BEGIN
+        INSERT INTO search_key (kind, object_id) VALUES ('comment', new.uuid);
+        INSERT INTO search_fts (rowid, title, body) VALUES (last_insert_rowid(), '', new.comment);
+    END""",
+    """CREATE TRIGGER search_comment_update AFTER UPDATE OF comment ON api_comment BEGIN
+        UPDATE search_fts SET body = new.comment
+        WHERE rowid = (SELECT rowid FROM search_key WHERE object_id = new.uuid AND kind = 'comment');
+    END""",
+    """CREATE TRIGGER search_comment_delete AFTER DELETE ON api_comment BEGIN
+        DELETE FROM search_fts
+        WHERE rowid = (SELECT rowid FROM search_key WHERE object_id = old.uuid AND kind = 'comment');
+        DELETE FROM search_key WHERE object_id = old.uuid AND kind = 'comment';
+    END""",
+]
+
+SQLITE_TRIGGERS = {f"search_{kind}_{event}" for kind in ("post", "comment") for event in ("insert", "update", "delete")}
+
+SQLITE_DROP = [
+    *(f"DROP TRIGGER IF EXISTS {trigger}" for trigger in sorted(SQLITE_TRIGGERS)),
+    "DROP TABLE IF EXISTS search_fts",
+    "DROP TABLE IF EXISTS search_key",
+]
+
+SQLITE_POPULATE = [
+    "INSERT INTO search_key (kind, object_id) SELECT 'post', uuid FROM api_post",
+    f"""INSERT INTO search_fts (rowid, title, body)
+        SELECT k.rowid, p.title, {_POST_BODY.format(row="p")}
+        FROM api_post p JOIN search_key k ON k.object_id = p.uuid AND k.kind = 'post'""",
+    "INSERT INTO search_key (kind, object_id) SELECT 'comment', uuid FROM api_comment",
+    """INSERT INTO search_fts (rowid, title, body)
+        SELECT k.rowid, '', c.comment FROM api_comment c JOIN search_key k ON k.object_id = c.uuid AND k.kind = 'comment'""",
+    "INSERT INTO search_fts (search_fts) VALUES ('optimize')",
+]
+
+
+def post_vector() -> SearchVector:
+    body = Case(When(content_type__in=BINARY_TYPES, then=Value("")), default=F("content"), output_field=CharField())
+    return (SearchVector("title", weight="A", config=settings.SEARCH_CONFIG)
+            + SearchVector("description", body, weight="B", config=settings.SEARCH_CONFIG))
+
+
+def comment_vector() -> SearchVector:
+    return SearchVector("comment", config=settings.SEARCH_CONFIG)
+
+
+def rebuild_index(using: str = "default"):
+    """
+    Drop and recreate the search index from the current posts and comments.
+    Effects: DB
+    """
+    db = connections[using]
+    if db.vendor == "sqlite":
+        statements = SQLITE_DROP + SQLITE_SCHEMA + SQLITE_POPULATE
+    elif db.vendor == "postgresql":
+        statements = ["REINDEX INDEX post_search", "REINDEX INDEX comment_search"]
+    else:
+        return
+    with transaction.atomic(using=using), db.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def ensure_index(using: str = "default", **kwargs):
+    """
+    Recreate the SQLite search index if any of its triggers is missing: migrations that rebuild the
+    api_post or api_comment tables drop the triggers along with the old table.
+    Effects: DB
+    """
+    db = connections[using]
+    if db.vendor != "sqlite" or "search_fts" not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = {name for (name,) in cursor.fetchall()}
+    if not SQLITE_TRIGGERS <= triggers:
+        rebuild_index(using)
+
+
+def fts_query(text: str) -> str | None:
+    """
+    An FTS5 query matching every word of `text` (the last one as a prefix), or None without words.
+    User input is never passed as FTS5 syntax.
+    """
+    words = WORD_RE.findall(text)
+    if not words:
+        return None
+    return " ".join(f'"{word}"' for word in words) + "*"
+
+
+def _ranked_sqlite(text: str, limit: int) -> list[tuple[str, UUID]]:
+    query = fts_query(text)
+    if query is None:
+        return []
+    with connection.cursor() as cursor:
+        # title matches weigh twice as much as body matches; bm25 is lower for better matches
+        cursor.execute(
+            "SELECT k.kind, k.object_id FROM search_fts JOIN search_key k ON k.rowid = search_fts.rowid "
+            "WHERE search_fts MATCH %s ORDER BY bm25(search_fts, 2.0, 1.0) LIMIT %s",
+            [query, limit],
+        )
+        return [(kind, UUID(object_id)) for kind, object_id in cursor.fetchall()]
+
+
+def _ranked_postgres(text: str, limit: int) -> list[tuple[str, UUID]]:
+    query = SearchQuery(text, config=settings.SEARCH_CONFIG, search_type="websearch")
+    matches = []
+    for kind, model, vector in [("post", Post, post_vector()), ("comment", Comment, comment_vector())]:
+        rows = (model.objects.annotate(document=vector).filter(document=query)
+                .annotate(rank=SearchRank(F("document"), query)).order_by("-rank").values_list("pk", "rank")[:limit])
+        matches += [(rank, kind, pk) for pk, rank in rows]
+    matches.sort(key=lambda match: match[0], reverse=True)
+    return [(kind, pk) for _, kind, pk in matches[:limit]]
+
+
+def search(text: str, viewer: Author | None, page: int, size: int) -> list[Post | Comment]:
+    """
+    A page of the posts and comments matching `text` that the viewer may see, most relevant first.
+    Comments are visible when their post is.
+    Effects: DB (three queries)
+    """
+    if connection.vendor == "postgresql":
+        ranked = _ranked_postgres(text, settings.SEARCH_MAX_RESULTS)
+    else:
+        ranked = _ranked_sqlite(text, settings.SEARCH_MAX_RESULTS)
+
+    visible = visible_posts(viewer)
+    posts = visible.in_bulk([pk for kind, pk in ranked if kind == "post"])
+    comments = (Comment.objects.filter(uuid__in=[pk for kind, pk in ranked if kind == "comment"],
+                                       post__in=visible.values("uuid"))
+                .select_related("author__user", "author__node").in_bulk())
+
+    results = []
+    for kind, pk in ranked:
+        row = posts.get(pk) if kind == "post" else comments.get(pk)
+        if row is not None:
+            results.append(row)
+    offset = (page - 1) * size
+    return results[offset:offset + size]
@@ -1,10 +1,15 @@
 import urllib
+from functools import partial
 
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Manager
 from rest_framework import serializers
 
 from web_dev_noobs_be.settings import SRV_URL
+from .fast_serializers import author_to_dict
+from .federation import gather_calls
 from .models import Author, Post, Notification, Comment, Like, Node
+from .remote_cache import RemoteFetchError, remote_profile
 
 
 class AuthorSerializer(serializers.ModelSerializer):
@@ -40,13 +45,26 @@ class AuthorSerializer(serializers.ModelSerializer):
 
 def author_to_json(author: Author) -> dict | None:
     if author.remote:
-        r = author.node.r_get(f"/authors/{author.extern_id}/")
-        if r.ok:
-            return r.json()
-        else:
+        try:
+            return remote_profile(author)
+        except RemoteFetchError:
             return None
     else:
-        return AuthorSerializer(author).data
+        return author_to_dict(author)
+
+
+def authors_to_json(authors) -> list[dict]:
+    """
+    author_to_json for many authors, fetching remote profiles concurrently.
+    Remote authors whose node cannot be reached are left out.
+    """
+    authors = list(authors)
+    remote = [author for author in authors if author.remote]
+    fetched = gather_calls([(author.node.host, partial(author_to_json, author)) for author in remote])
+    profiles = dict(zip((author.pk for author in remote), fetched))
+
+    items = [profiles[author.pk] if author.remote else author_to_dict(author) for author in authors]
+    return [item for item in items if item is not None]
 
 
 class VisibilityField(serializers.Field):
@@ -65,6 +83,15 @@ class ContentTypeField(serializers.Field):
         return Post.ContentType(data).to_display()
 
 
+class PostContentField(serializers.CharField):
+    """
+    Post content; the images of image posts are read back from the image store as base64.
+    """
+
+    def get_attribute(self, instance):
+        return instance.wire_content()
+
+
 class PostSerializer(serializers.ModelSerializer):
     type = serializers.CharField(default="post", read_only=True)
 
@@ -76,11 +103,14 @@ class PostSerializer(serializers.ModelSerializer):
     title = serializers.CharField()
     description = serializers.CharField()
 
-    content = serializers.CharField()
+    content = PostContentField()
+    image = serializers.SerializerMethodField()
     contentType = ContentTypeField(source="content_type")
 
     comments = serializers.SerializerMethodField()
-    count = serializers.IntegerField(read_only=True)
+    count = serializers.IntegerField(source="comment_count", read_only=True)
+    likeCount = serializers.IntegerField(source="like_count", read_only=True)
+    commentCount = serializers.IntegerField(source="comment_count", read_only=True)
 
     visibility = VisibilityField()
     published = serializers.DateTimeField(read_only=True)
@@ -91,6 +121,10 @@ class PostSerializer(serializers.ModelSerializer):
     def get_comments(post):
         return f"{PostSerializer.get_id(post)}/comments"
 
+    @staticmethod
+    def get_image(post) -> str | None:
+        return post.image_url()
+
     @staticmethod
     def get_source(post):
         if post.source == "":
@@ -115,12 +149,12 @@ class PostSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_id(post) -> str:
-        return f"{SRV_URL}/api/authors/{post.author.id.hex}/posts/{post.uuid.hex}"
+        return f"{SRV_URL}/api/authors/{post.author_id.hex}/posts/{post.uuid.hex}"
 
     class Meta:
         model = Post
-        fields = ["type", "title", "id", "source", "origin", "description", "contentType", "content", "author", "count",
-            "comments", "published", "visibility", ]
+        fields = ["type", "title", "id", "source", "origin", "description", "contentType", "content", "image", "author",
+            "count", "likeCount", "commentCount", "comments", "published", "visibility", ]
 
 
 class NotificationSerializer(serializers.ModelSerializer):
@@ -134,20 +168,34 @@ class CommentSerializer(serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
     contentType = serializers.CharField(source="content_type")
     id = serializers.SerializerMethodField()
+    likeCount = serializers.IntegerField(source="like_count", read_only=True)
 
     @staticmethod
     def get_id(comment) -> str:
-        return f"{SRV_URL}/api/authors/{comment.author.id.hex}/posts/{comment.post.uuid.hex}/comments/{comment.uuid.hex}"
+        return f"{SRV_URL}/api/authors/{comment.author_id.hex}/posts/{comment.post_id.hex}/comments/{comment.uuid.hex}"
 
     class Meta:
         model = Comment
-        fields = ["type", "author", "comment", "contentType", "published", "id"]
+        fields = ["type", "author", "comment", "contentType", "published", "id", "likeCount"]
         read_only_fields = ["id", "published"]
 
     def create(self, validated_data):
         return Comment.objects.create(**validated_data)
 
 
+class LikeListSerializer(serializers.ListSerializer):
+    """
+    Resolves the object URLs of every like in one query per object type instead of one per like.
+    """
+
+    object_urls = None
+
+    def to_representation(self, data):
+        likes = list(data.all() if isinstance(data, Manager) else data)
+        self.object_urls = Like.object_urls(likes)
+        return super().to_representation(likes)
+
+
 class LikeSerializer(serializers.ModelSerializer):
     summary = serializers.SerializerMethodField()
     type = serializers.CharField(default="Like", read_only=True)
@@ -157,14 +205,17 @@ class LikeSerializer(serializers.ModelSerializer):
     @staticmethod
     def get_summary(like) -> str:
         return like.summary()
-    
-    @staticmethod
-    def get_object(like) -> str:
+
+    def get_object(self, like) -> str:
+        object_urls = getattr(self.parent, "object_urls", None)
+        if object_urls is not None:
+            return object_urls.get(like.pk)
         return like.object_url()
-    
+
     class Meta:
         model = Like
         fields = ["summary", "type", "author", "object"]
+        list_serializer_class = LikeListSerializer
 
     def create(self, validated_data):
         return Like.objects.create(**validated_data)
@@ -1,19 +1,61 @@
 import base64
+import importlib
+import io
 import json
+import os
 import random
+import re
+import shutil
 import string
+import tempfile
+import threading
+import time
+import unittest
 import urllib
+from datetime import datetime, timezone
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 from uuid import uuid4
 
+import requests
+from django.apps import apps as django_apps
 from django.contrib.auth.models import User
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 
-from web_dev_noobs_be.settings import BASE_DIR
-from .models import Author, Post, Notification, Like, Node
-from .serializers import AuthorSerializer, LikeSerializer
+from web_dev_noobs_be.settings import BASE_DIR, SRV_URL
+from .models import (Author, Comment, Friendship, InboxActivity, Post, Notification, Like, Node, OutboxItem,
+                     StoredImage, TimelineEntry)
+from . import federation, outbox, renderers
+from .image_store import (VARIANT_HEADROOM, Image, _base64_cache, evict_variants, image_base64, image_path,
+                          image_variant, store_image, variant_path)
+from .fast_serializers import author_to_dict, comment_to_dict, likes_to_dicts, post_to_dict
+from .feed import visible_posts
+from .remote_authors import scan_remote_authors
+from .remote_cache import (
+    _posts_key,
+    _profile_key,
+    _refreshing,
+    invalidate_remote_posts,
+    invalidate_remote_profile,
+    invalidate_remote_thread,
+    remote_json,
+    remote_post_count,
+    remote_posts,
+)
+from .serializers import AuthorSerializer, CommentSerializer, LikeSerializer, PostSerializer, author_to_json
+from .views import POST_ORDERING
+
+
+IMAGE_STORE = tempfile.TemporaryDirectory()
 
 
 def setup_authors(n: int) -> [Author]:
@@ -152,6 +194,7 @@ class UpdateAuthorTest(TestCase):
         self.assertNotEqual(author_data["github"], "https://github.com/gjohnson")
 
 
+@override_settings(IMAGE_STORE_DIR=IMAGE_STORE.name)
 class PostTestCase(TestCase):
     def setUp(self) -> None:
         self.k = 5
@@ -219,7 +262,7 @@ class PostTestCase(TestCase):
 
             gr = self.client.get(f"{post_id}/image")
             self.assertEqual(gr.status_code, status.HTTP_200_OK)
-            self.assertEqual(contents, gr.content)
+            self.assertEqual(contents, gr.getvalue())
             self.assertEqual(gr.headers["Content-Type"], "image/png")
 
     def test_friends_post(self):
@@ -351,6 +394,33 @@ class PostTestCase(TestCase):
             self.assertEquals(gpage.status_code, 404)
 
 
+    def test_cursor_pagination(self):
+        author = self.authors[0]
+        created = {json.loads(self.make_intro_post(0)[0].content)["id"] for _ in range(5)}
+
+        seen = []
+        url = f"/api/authors/{author.id.hex}/posts/?size=2&cursor="
+        while url is not None:
+            r = self.client.get(url)
+            self.assertEqual(r.status_code, 200)
+            data = json.loads(r.content)
+            self.assertLessEqual(len(data["items"]), 2)
+            seen += [item["id"] for item in data["items"]]
+            url = None if data["next"] is None else f"/api/authors/{author.id.hex}/posts/?size=2&cursor={data['next']}"
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(set(seen), created)
+
+        # page/size mode is unaffected
+        r = self.client.get(f"/api/authors/{author.id.hex}/posts/?size=2&page=3")
+        self.assertEqual(len(json.loads(r.content)["items"]), 1)
+        self.assertNotIn("next", json.loads(r.content))
+
+    def test_invalid_cursor(self):
+        r = self.client.get(f"/api/authors/{self.authors[0].id.hex}/posts/?size=2&cursor=not-a-cursor")
+        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
+
+
 # test the notion of friends
 class FriendsTestCase(TestCase):
     def setUp(self):
@@ -376,6 +446,29 @@ class FriendsTestCase(TestCase):
         self.assertFalse(self.author1.is_friend(self.author1.user))
         self.assertFalse(self.author2.is_friend(self.author2.user))
 
+    def test_unfollow_ends_friendship(self):
+        self.author1.follow(self.author2)
+        self.author2.follow(self.author1)
+        self.assertEqual(list(self.author1.get_friends()), [self.author2])
+
+        self.author1.unfollow(self.author2)
+        self.assertFalse(self.author1.is_friend(self.author2.user))
+        self.assertFalse(self.author2.is_friend(self.author1.user))
+        self.assertFalse(self.author2.get_friends().exists())
+
+        self.author1.follow(self.author2)
+        self.author1.remove_follower(self.author2)
+        self.assertFalse(self.author1.is_friend(self.author2.user))
+
+    def test_rebuild_friendships(self):
+        self.author1.following.add(self.author2)
+        self.author2.following.add(self.author1)
+        self.assertFalse(self.author1.is_friend(self.author2.user))
+
+        call_command("rebuild_friendships", stdout=io.StringIO())
+        self.assertTrue(self.author1.is_friend(self.author2.user))
+        self.assertEqual(Friendship.objects.count(), 2)
+
 
 def make_basic_header(username, password):
     return "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()
@@ -440,6 +533,256 @@ class InboxTestCase(TestCase):
         self.assertIn("Inbox Cleared", str(response.data))
 
 
+class BulkInboxTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.alice, self.bob = setup_authors(2)
+        node_user = User.objects.create_user("node", password="nodepwd")
+        self.node = Node.objects.create(host="https://www.example.com/srv/", user=node_user)
+        self.remote = Author.objects.create(node=self.node, extern_id="remote", remote_name="Remote",
+                                            is_approved=True)
+        self.post = Post.objects.create(title="post", content="content", author=self.alice,
+                                        visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+        self.headers = {"Authorization": make_basic_header("node", "nodepwd")}
+
+    def deliver(self, entries, headers=None):
+        return self.client.post("/api/inbox", {"items": entries}, format="json",
+                                headers=self.headers if headers is None else headers)
+
+    def like(self, recipient: Author, i: int = 0) -> dict:
+        post_url = f"{SRV_URL}/api/authors/{self.alice.id.hex}/posts/{self.post.uuid.hex}"
+        return {"recipient": f"{SRV_URL}/api/authors/{recipient.id}", "activity": {
+            "type": "Like", "summary": "Remote likes your post", "object": post_url,
+            "author": {"id": f"https://www.example.com/srv/authors/remote{i or ''}"},
+        }}
+
+    def comment(self, i: int) -> dict:
+        post_url = f"{SRV_URL}/api/authors/{self.alice.id.hex}/posts/{self.post.uuid.hex}"
+        return {"recipient": str(self.alice.id), "activity": {
+            "type": "comment", "comment": f"comment {i}", "contentType": "text/plain",
+            "id": f"{post_url}/comments/{uuid4().hex}", "author": {"id": "https://www.example.com/srv/authors/remote"},
+        }}
+
+    def test_only_nodes(self):
+        self.assertEqual(self.deliver([], headers={}).status_code, status.HTTP_403_FORBIDDEN)
+        alice = self.alice.user.username
+        response = self.deliver([], headers={"Authorization": make_basic_header(alice, alice + "pwd")})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.deliver([]).status_code, status.HTTP_200_OK)
+
+    @override_settings(INBOX_BATCH_MAX=2)
+    def test_batch_size(self):
+        response = self.deliver([self.like(self.alice)] * 3)
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        response = self.client.post("/api/inbox", {"items": "nope"}, format="json", headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_mixed_batch(self):
+        remote_post = {"type": "post", "title": "remote post", "description": "", "content": "hello",
+                       "contentType": "text/plain", "visibility": "PUBLIC", "id": f"{self.node.host}posts/abc",
+                       "author": {"id": f"{self.node.host}authors/remote"}}
+        response = self.deliver([
+            self.like(self.alice),
+            self.like(self.bob),
+            self.comment(0),
+            {"recipient": str(self.bob.id), "activity": remote_post},
+            {"recipient": str(self.alice.id), "activity": remote_post},
+            {"recipient": str(self.bob.id), "activity": {"type": "Follow", "actor": {"id": "someone"}}},
+            {"recipient": str(uuid4()), "activity": {"type": "follow"}},
+            {"recipient": str(self.bob.id), "activity": {"type": "poke"}},
+            {"recipient": str(self.bob.id), "activity": {"type": "like", "author": {"id": "nobody"}}},
+            {"recipient": str(self.bob.id), "activity": {"type": "like"}},
+            {"activity": {}},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["status"] for item in response.json()["items"]],
+                         [200, 200, 200, 200, 409, 200, 404, 406, 404, 400, 400])
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+        self.assertEqual(Notification.objects.filter(recipient=self.alice).count(), 2)
+        self.assertEqual(Notification.objects.filter(recipient=self.bob).count(), 3)
+        self.assertTrue(Post.objects.filter(extern_id="abc", author=self.remote).exists())
+
+        # delivering the same like again does not count it twice
+        self.deliver([self.like(self.alice)])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+    def test_bulk_queries(self):
+        def queries(n: int) -> int:
+            entries = [self.comment(i) for i in range(n)] + [self.like(self.alice, i) for i in range(n)]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.deliver(entries)
+            self.assertEqual({item["status"] for item in response.json()["items"]}, {200})
+            return len(ctx.captured_queries)
+
+        for i in range(1, 21):
+            Author.objects.create(node=self.node, extern_id=f"remote{i}", remote_name=f"Remote {i}")
+        self.assertEqual(queries(2), queries(20))
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (20, 22))
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache",
+                                           "LOCATION": "api_cache"}})
+    def test_bulk_queries_db_cache(self):
+        # the invalidations of the remote caches are queries as well then
+        call_command("createcachetable", verbosity=0)
+        self.test_bulk_queries()
+
+    def test_replays(self):
+        comment, like = self.comment(0), self.like(self.alice)
+        like["activity"]["id"] = f"https://www.example.com/srv/likes/{uuid4().hex}"
+        inbox = reverse("author_inbox", kwargs={"author_id": self.alice.id})
+        for _ in range(2):
+            response = self.client.post(inbox, comment["activity"], format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("Activity already received", str(response.data))
+
+        response = self.deliver([comment, like, like])
+        self.assertEqual([item.get("replay", False) for item in response.json()["items"]], [True, False, True])
+        response = self.deliver([like])
+        self.assertEqual(response.json()["items"], [{"status": 200, "replay": True}])
+
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+        self.assertEqual(Notification.objects.filter(recipient=self.alice).count(), 2)
+        self.assertEqual(InboxActivity.objects.filter(recipient=self.alice, node=self.node).count(), 2)
+
+    @override_settings(INBOX_DEDUP_RETENTION=60)
+    def test_replay_retention(self):
+        like = self.like(self.alice)
+        like["activity"]["id"] = f"https://www.example.com/srv/likes/{uuid4().hex}"
+        self.deliver([like])
+        InboxActivity.objects.update(received_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+        self.assertNotIn("replay", self.deliver([like]).json()["items"][0])
+        self.assertEqual(Notification.objects.filter(recipient=self.alice).count(), 2)
+        self.assertEqual(InboxActivity.objects.count(), 1)
+
+        InboxActivity.objects.update(received_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+        call_command("purge_inbox_activities", stdout=io.StringIO())
+        self.assertFalse(InboxActivity.objects.exists())
+
+    def test_refollow_after_removal(self):
+        # follows and likes without an id are never replays, nothing tells them apart from new ones
+        inbox = reverse("author_inbox", kwargs={"author_id": self.alice.id})
+        follow = {"type": "follow", "actor": {"id": f"{SRV_URL}/api/authors/{self.bob.id}"},
+                  "object": {"id": f"{SRV_URL}/api/authors/{self.alice.id}"}}
+        self.client.post(inbox, follow, format="json")
+        self.bob.follow(self.alice)
+        self.alice.remove_follower(self.bob)
+        response = self.client.post(inbox, follow, format="json")
+        self.assertNotIn("Activity already received", str(response.data))
+        self.assertEqual(Notification.objects.filter(recipient=self.alice, type="follow").count(), 2)
+
+        like = self.like(self.alice)
+        self.deliver([like])
+        self.assertNotIn("replay", self.deliver([like]).json()["items"][0])
+        self.assertEqual(Like.objects.filter(author=self.remote).count(), 1)
+        self.assertFalse(InboxActivity.objects.exists())
+
+
+@override_settings(IMAGE_STORE_DIR=IMAGE_STORE.name, IMAGE_VARIANT_DIR=f"{IMAGE_STORE.name}/variants")
+class NotificationReferencesTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author, self.other = setup_authors(2)
+        node = Node.objects.create(host="https://www.example.com/srv/", user=User.objects.create_user("node"))
+        self.remote = Author.objects.create(node=node, extern_id="remote", remote_name="Remote", is_approved=True)
+        self.post = Post.objects.create(title="post", content="content", author=self.author,
+                                        visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+        self.inbox = f"/api/authors/{self.author.id}/inbox"
+        username = self.author.user.username
+        self.headers = {"Authorization": make_basic_header(username, username + "pwd")}
+
+    def items(self) -> list[dict]:
+        response = self.client.get(self.inbox, {"page": 1, "size": 50}, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["items"]
+
+    def test_references_hydrated(self):
+        with open(BASE_DIR / "public/logo192.png", "rb") as f:
+            encoded = base64.b64encode(f.read()).decode()
+        remote_author = {"id": "https://www.example.com/srv/authors/remote"}
+        remote_post = {"type": "post", "title": "image", "description": "", "content": encoded,
+                       "contentType": "image/png;base64", "visibility": "PUBLIC",
+                       "id": "https://www.example.com/srv/posts/abc", "author": remote_author}
+        post_url = f"{SRV_URL}/api/authors/{self.author.id.hex}/posts/{self.post.uuid.hex}"
+        remote_like = {"type": "Like", "summary": "Remote likes your post", "author": remote_author,
+                       "object": post_url}
+        self.client.post(self.inbox, remote_post, format="json")
+        self.client.post(self.inbox, remote_like, format="json")
+        self.client.post(self.inbox, {"type": "follow", "actor": remote_author}, format="json")
+        comment = Comment.objects.create(post=self.post, author=self.other, comment="comment")
+        Notification.reference(self.author, "comment", comment).save()
+
+        # remote activities are stored as delivered, only objects of local authors are referenced
+        self.assertEqual(Notification.objects.filter(data__isnull=True).count(), 1)
+        self.assertTrue(Post.objects.filter(extern_id="abc").exists())
+        self.assertTrue(Like.objects.filter(author=self.remote).exists())
+        comment = Comment.objects.select_related("author__user", "author__node").get(pk=comment.pk)
+        items = self.items()
+        self.assertEqual(items[0], comment_to_dict(comment))
+        self.assertEqual(items[1]["type"], "follow")
+        self.assertEqual(items[2]["author"], remote_author)
+        self.assertEqual(items[2]["object"], post_url)
+        self.assertEqual(items[3]["id"], remote_post["id"])
+        self.assertEqual(items[3]["author"], remote_author)
+        self.assertEqual(items[3]["content"], encoded)
+
+        # notifications about deleted objects are left out
+        comment.delete()
+        self.assertEqual(len(self.items()), 3)
+
+    def test_compaction(self):
+        migration = importlib.import_module("api.migrations.0014_notification_references")
+        comment = Comment.objects.create(post=self.post, author=self.other, comment="comment")
+        like = Like.objects.create(author=self.other, object_type="post", object_id=str(self.post.uuid))
+        old = {
+            "post": PostSerializer(self.post).data,
+            "comment": CommentSerializer(comment).data,
+            "Like": LikeSerializer(like).data,
+            "follow": {"type": "follow", "actor": {"id": "someone"}},
+        }
+        old = {kind: json.loads(JSONRenderer().render(data)) for kind, data in old.items()}
+        notifications = {kind: Notification.objects.create(recipient=self.author, type=kind, data=data)
+                         for kind, data in old.items()}
+        unknown = Notification.objects.create(recipient=self.author, type="comment",
+                                              data={"type": "comment", "id": f"{SRV_URL}/comments/{uuid4().hex}"})
+        # the mirror of a remote post, whose payload has the id of the original
+        mirror = Post.objects.create(title="remote", content="content", author=self.remote, extern_id=uuid4().hex,
+                                     visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+        remote = Notification.objects.create(recipient=self.author, type="post", data={
+            "type": "post", "id": f"https://www.example.com/srv/authors/remote/posts/{mirror.extern_id}"})
+        remote_like = Like.objects.create(author=self.remote, object_type="post", object_id=str(self.post.uuid))
+        remote_liked = Notification.objects.create(recipient=self.author, type="Like", data={
+            "type": "Like", "author": {"id": "https://www.example.com/srv/authors/remote"},
+            "object": f"{SRV_URL}/api/authors/{self.author.id.hex}/posts/{self.post.uuid.hex}"})
+
+        migration.compact_notifications(django_apps, None)
+        references = Notification.objects.filter(data__isnull=True)
+        self.assertEqual(set(references.values_list("object_type", "object_id", "actor")), {
+            ("post", self.post.uuid, self.author.id),
+            ("comment", comment.uuid, self.other.id),
+            ("like", like.id, self.other.id),
+        })
+        self.assertTrue(Notification.objects.filter(type="follow", data__isnull=False).exists())
+        for notification in (unknown, remote, remote_liked):
+            notification.refresh_from_db()
+            self.assertIsNotNone(notification.data)
+
+        # the reverse restores the payloads, except for the image URL added later
+        remote_like.delete()
+        self.post.refresh_from_db()
+        old["post"] = PostSerializer(self.post).data
+        old["post"].pop("image")
+        migration.expand_notifications(django_apps, None)
+        self.assertFalse(Notification.objects.filter(data__isnull=True).exists())
+        for kind, data in old.items():
+            notifications[kind].refresh_from_db()
+            self.assertEqual(notifications[kind].data, data, kind)
+
+
 class GetAuthorLikesTestCase(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -457,6 +800,247 @@ class GetAuthorLikesTestCase(TestCase):
         expected_item = LikeSerializer(self.like).data
         self.assertEqual(response.data['items'][0], expected_item)
 
+    def like_posts(self, n: int) -> list[Post]:
+        posts = [Post.objects.create(title=f"post {i}", content="content", author=self.authors[0],
+                                     visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+                 for i in range(n)]
+        for post in posts:
+            Like.objects.create(object_id=str(post.uuid), author=self.authors[0], object_type="post")
+        return posts
+
+    @override_settings(LIKED_PAGE_SIZE=4)
+    def test_paginated(self):
+        self.like_posts(9)
+        response = self.client.get(self.url, headers={"Authorization": self.basic_header})
+        self.assertEqual(len(response.data["items"]), 4)
+
+        seen = []
+        cursor = ""
+        while cursor is not None:
+            response = self.client.get(self.url, {"cursor": cursor, "size": 3},
+                                       headers={"Authorization": self.basic_header})
+            seen += [item["object"] for item in response.data["items"]]
+            cursor = response.data["next"]
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len(set(seen) - {None}), 9)
+
+        response = self.client.get(self.url, {"page": 4, "size": 3}, headers={"Authorization": self.basic_header})
+        self.assertEqual((response.data["page"], len(response.data["items"])), (4, 1))
+        response = self.client.get(self.url, {"page": 5, "size": 3}, headers={"Authorization": self.basic_header})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_objects_resolved_in_bulk(self):
+        self.like_posts(20)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {"page": 1, "size": 50}, headers={"Authorization": self.basic_header})
+        self.assertEqual(len(response.data["items"]), 21)
+        self.assertLess(len(queries), 10)
+
+
+@override_settings(IMAGE_STORE_DIR=IMAGE_STORE.name, IMAGE_VARIANT_DIR=f"{IMAGE_STORE.name}/variants",
+                   IMAGE_VARIANT_WIDTHS=[50, 100, 1280])
+class ImageStoreTestCase(TestCase):
+    def setUp(self):
+        with open(BASE_DIR / "public/logo192.png", "rb") as f:
+            self.contents = f.read()
+        self.encoded = base64.b64encode(self.contents).decode()
+        shutil.rmtree(f"{IMAGE_STORE.name}/variants", ignore_errors=True)
+        self.author = setup_authors(1)[0]
+        self.posts = [
+            Post.objects.create(title="image", content=self.encoded, author=self.author,
+                                visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PNG)
+            for _ in range(2)
+        ]
+        self.url = f"/api/authors/{self.author.id}/posts/{self.posts[0].uuid}/image"
+
+    def test_stored_once(self):
+        first, second = (Post.objects.get(pk=post.pk) for post in self.posts)
+        self.assertEqual(first.content, "")
+        self.assertEqual(first.image_hash, second.image_hash)
+        self.assertEqual(image_path(first.image_hash).read_bytes(), self.contents)
+
+    def test_wire_format(self):
+        post = Post.objects.select_related("author__user", "author__node").get(pk=self.posts[0].pk)
+        self.assertEqual(PostSerializer(post).data["content"], self.encoded)
+        self.assertEqual(post_to_dict(post)["content"], self.encoded)
+
+    def test_local_files_lost(self):
+        # e.g. on another dyno: the files are written again from the database
+        digest = self.posts[0].image_hash
+        self.assertEqual(bytes(StoredImage.objects.get(digest=digest).data), self.contents)
+        image_path(digest).unlink()
+        response = self.client.get(self.url)
+        self.assertEqual(response.getvalue(), self.contents)
+        self.assertTrue(image_path(digest).exists())
+
+        # an image lost altogether does not break listings
+        lost = Post.objects.create(title="lost", content=base64.b64encode(self.contents + b"lost").decode(),
+                                   author=self.author, visibility=Post.Visibility.PUBLIC,
+                                   content_type=Post.ContentType.PNG)
+        StoredImage.objects.filter(digest=lost.image_hash).delete()
+        image_path(lost.image_hash).unlink()
+        response = self.client.get(f"/api/authors/{self.author.id}/posts/", {"page": 1, "size": 10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(post_to_dict(Post.objects.get(pk=lost.pk))["content"], "")
+        response = self.client.get(f"/api/authors/{self.author.id}/posts/{lost.uuid}/image")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_base64_cache_bounded(self):
+        other = store_image(self.contents + b"other")
+        with override_settings(IMAGE_BASE64_CACHE_BYTES=len(self.encoded) + 8):
+            self.assertEqual(image_base64(self.posts[0].image_hash), self.encoded)
+            image_base64(other)
+            self.assertLessEqual(sum(map(len, _base64_cache.values())), len(self.encoded) + 8)
+            self.assertIn(other, _base64_cache)
+            self.assertNotIn(self.posts[0].image_hash, _base64_cache)
+
+    def test_not_an_image(self):
+        post = self.posts[0]
+        post.content_type = Post.ContentType.PLAIN
+        post.content = "text"
+        post.save()
+        self.assertEqual(Post.objects.get(pk=post.pk).image_hash, "")
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertEqual(etag, f'"{self.posts[0].image_hash}"')
+        self.assertNotIn("immutable", response["Cache-Control"])
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # the image URL given to clients is the immutable one
+        post = Post.objects.select_related("author__user", "author__node").get(pk=self.posts[0].pk)
+        image_url = post_to_dict(post)["image"]
+        self.assertEqual(image_url, PostSerializer(post).data["image"])
+        response = self.client.get(image_url.removeprefix(SRV_URL))
+        self.assertIn("immutable", response["Cache-Control"])
+        response = self.client.get(image_url.removeprefix(SRV_URL) + "&w=100")
+        self.assertIn("immutable", response["Cache-Control"])
+
+    def test_ranges(self):
+        size = len(self.contents)
+        response = self.client.get(self.url, headers={"Range": "bytes=10-19"})
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response.getvalue(), self.contents[10:20])
+        self.assertEqual(response["Content-Range"], f"bytes 10-19/{size}")
+
+        response = self.client.get(self.url, headers={"Range": "bytes=-5"})
+        self.assertEqual(response.getvalue(), self.contents[-5:])
+
+        response = self.client.get(self.url, headers={"Range": f"bytes={size}-"})
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        # a range against another version of the image gets the whole image
+        response = self.client.get(self.url, headers={"Range": "bytes=10-19", "If-Range": '"other"'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.getvalue(), self.contents)
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_variants(self):
+        digest = self.posts[0].image_hash
+        response = self.client.get(self.url, {"w": 80})
+        self.assertEqual(response["ETag"], f'"{digest}-100"')
+        with Image.open(io.BytesIO(response.getvalue())) as image:
+            self.assertEqual(image.size, (100, 100))
+        self.assertTrue(variant_path(digest, 100).exists())
+
+        # not wider than the original: served as is
+        response = self.client.get(self.url, {"w": 500})
+        self.assertEqual(response.getvalue(), self.contents)
+
+        self.assertEqual(self.client.get(self.url, {"w": "wide"}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_variant_eviction(self):
+        digest = self.posts[0].image_hash
+        small, large = image_variant(digest, 50), image_variant(digest, 100)
+        os.utime(small, (0, 0))
+        # eviction leaves the headroom free
+        with override_settings(IMAGE_VARIANT_MAX_BYTES=int(large.stat().st_size / (1 - VARIANT_HEADROOM)) + 1):
+            evict_variants()
+        self.assertFalse(small.exists())
+        self.assertTrue(large.exists())
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_variant_eviction_incremental(self):
+        # the directory is only scanned again once the variants written since may exceed the limit
+        digest = self.posts[0].image_hash
+        evict_variants()
+        with mock.patch("api.image_store.evict_variants", wraps=evict_variants) as evict:
+            image_variant(digest, 50)
+            image_variant(digest, 100)
+            self.assertEqual(evict.call_count, 0)
+            with override_settings(IMAGE_VARIANT_MAX_BYTES=1):
+                image_variant(digest, 1280)
+            self.assertEqual(evict.call_count, 1)
+
+    @unittest.skipIf(Image is None, "Pillow is not installed")
+    def test_generate_command(self):
+        call_command("generate_image_variants", stdout=io.StringIO())
+        for width in (50, 100, 1280):
+            self.assertTrue(variant_path(self.posts[0].image_hash, width).exists())
+
+
+class ConditionalGetTestCase(TestCase):
+    def setUp(self):
+        self.author, self.friend = setup_authors(2)
+        self.post = Post.objects.create(title="post", content="post", author=self.author,
+                                        visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+        self.post_url = f"/api/authors/{self.author.id}/posts/{self.post.uuid}"
+
+    def assertRevalidates(self, url: str, **params):
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        again = self.client.get(url, params, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(again.content, b"")
+        return first
+
+    def test_post(self):
+        first = self.assertRevalidates(self.post_url)
+        self.assertIn("Last-Modified", first)
+        response = self.client.get(self.post_url, headers={"If-Modified-Since": first["Last-Modified"]})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.post.title = "edited"
+        self.post.save()
+        response = self.client.get(self.post_url, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["title"], "edited")
+
+    def test_author_change_invalidates_post(self):
+        first = self.assertRevalidates(self.post_url)
+        self.author.github = "https://github.com/someone-else"
+        self.author.save()
+        response = self.client.get(self.post_url, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_friends_post_is_not_leaked(self):
+        self.post.visibility = Post.Visibility.FRIENDS
+        self.post.save()
+        response = self.client.get(self.post_url, headers={"If-None-Match": "*"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_author(self):
+        self.assertRevalidates(f"/api/authors/{self.author.id}/")
+
+    def test_lists(self):
+        first = self.assertRevalidates("/api/authors/", page=1, size=10)
+        setup_authors(1)
+        response = self.client.get("/api/authors/", {"page": 1, "size": 10}, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertRevalidates(f"/api/authors/{self.author.id}/posts/", page=1, size=10)
+
+        comments_url = f"{self.post_url}/comments"
+        first = self.assertRevalidates(comments_url, page=1, size=10)
+        Comment.objects.create(post=self.post, author=self.friend, comment="hi")
+        response = self.client.get(comments_url, {"page": 1, "size": 10}, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("Last-Modified", response)
+
 
 class LikePostViewTestCase(TestCase):
     def setUp(self):
@@ -479,6 +1063,68 @@ class LikePostViewTestCase(TestCase):
         self.assertEqual(response_data["items"], expected_data)
 
 
+class CountersTestCase(TestCase):
+    def setUp(self):
+        self.author, self.other = setup_authors(2)
+        node = Node.objects.create(host="https://www.example.com/srv/", user=User.objects.create_user("node"))
+        self.remote = Author.objects.create(extern_id="remote", node=node, remote_name="Remote", is_approved=True)
+        self.post = Post.objects.create(title="title", content="content", author=self.author,
+                                        visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+
+    def assertCounts(self, likes: int, comments: int):
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (likes, comments))
+
+    def test_maintained_on_insert_and_delete(self):
+        comment = Comment.objects.create(post=self.post, author=self.other, comment="comment")
+        Like.objects.create(author=self.other, object_type="post", object_id=self.post.uuid.hex)
+        Like.objects.create(author=self.author, object_type="post", object_id=str(self.post.uuid))
+        Like.objects.create(author=self.author, object_type="comment", object_id=str(comment.uuid))
+        Like.objects.create(author=self.author, object_type="post", object_id="not a uuid")
+        self.assertCounts(likes=2, comments=1)
+        comment.refresh_from_db()
+        self.assertEqual(comment.like_count, 1)
+
+        comment.comment = "edited"
+        comment.save()
+        self.assertCounts(likes=2, comments=1)
+
+        # deleting an author cascades to their likes and comments
+        self.other.delete()
+        self.assertCounts(likes=1, comments=0)
+
+    def test_inbox_ingestion(self):
+        inbox = f"/api/authors/{self.author.id}/inbox"
+        remote_author = {"id": "https://www.example.com/srv/authors/remote"}
+        post_url = f"{SRV_URL}/api/authors/{self.author.id.hex}/posts/{self.post.uuid.hex}"
+        client = APIClient()
+        client.post(inbox, {"type": "comment", "author": remote_author, "comment": "hi", "contentType": "text/plain",
+                            "id": f"{post_url}/comments/{uuid4().hex}"}, format="json")
+        for _ in range(2):
+            client.post(inbox, {"type": "Like", "summary": "Remote likes your post", "author": remote_author,
+                                "object": post_url}, format="json")
+        self.assertCounts(likes=1, comments=1)
+
+    def test_serialized(self):
+        Comment.objects.create(post=self.post, author=self.other, comment="comment")
+        Like.objects.create(author=self.other, object_type="post", object_id=str(self.post.uuid))
+        self.post.refresh_from_db()
+        data = PostSerializer(self.post).data
+        self.assertEqual((data["likeCount"], data["commentCount"], data["count"]), (1, 1, 1))
+        self.assertEqual(post_to_dict(self.post)["likeCount"], 1)
+
+    def test_reconcile(self):
+        Comment.objects.create(post=self.post, author=self.other, comment="comment")
+        Like.objects.create(author=self.other, object_type="post", object_id=str(self.post.uuid))
+        Post.objects.update(like_count=7, comment_count=0)
+        self.assertCounts(likes=7, comments=0)
+
+        out = io.StringIO()
+        call_command("reconcile_counters", stdout=out)
+        self.assertIn("Fixed 1 comment counters and 1 like counters", out.getvalue())
+        self.assertCounts(likes=1, comments=1)
+
+
 class ForeignFollowerTestCase(TestCase):
     def setUp(self) -> None:
 
@@ -529,3 +1175,676 @@ class ForeignFollowerTestCase(TestCase):
     #                        headers={"Authorization": self.bh})
     #     gr = self.client.get(f"/api/authors/{self.author.id}/followers/{urllib.parse.quote(self.external)}")
     #     self.assertEqual(gr.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class FastSerializerParityTestCase(TestCase):
+    """
+    The plain-dict serializers must render byte-identical JSON to the DRF serializers.
+    """
+
+    def setUp(self):
+        self.author = setup_authors(1)[0]
+        node = Node.objects.create(host="https://www.example.com/srv/", user=User.objects.create_user("node"))
+        self.remote = Author.objects.create(extern_id="remote", node=node, remote_name="Remote", is_approved=True)
+
+    def assertSameJson(self, fast, slow):
+        self.assertEqual(json.dumps(fast), json.dumps(slow))
+
+    def test_authors(self):
+        for author in [self.author, self.remote]:
+            self.assertSameJson(author_to_dict(author), AuthorSerializer(author).data)
+
+    def test_posts(self):
+        for author in [self.author, self.remote]:
+            for content_type in Post.ContentType:
+                for visibility in Post.Visibility:
+                    post = Post.objects.create(title="title", description=None, content="content", author=author,
+                                               content_type=content_type, visibility=visibility,
+                                               origin="https://www.example.com/origin")
+                    post.refresh_from_db()
+                    self.assertSameJson(post_to_dict(post), PostSerializer(post).data)
+
+    @override_settings(IMAGE_STORE_DIR=IMAGE_STORE.name)
+    def test_image_posts(self):
+        post = Post.objects.create(title="image", description="", content=base64.b64encode(b"image").decode(),
+                                   author=self.author, content_type=Post.ContentType.PNG,
+                                   visibility=Post.Visibility.PUBLIC)
+        post.refresh_from_db()
+        self.assertIsNotNone(post_to_dict(post)["image"])
+        self.assertSameJson(post_to_dict(post), PostSerializer(post).data)
+
+    def test_comments_and_likes(self):
+        post = Post.objects.create(title="title", description="", content="content", author=self.author,
+                                   content_type=Post.ContentType.MARKDOWN, visibility=Post.Visibility.PUBLIC)
+        comment = Comment.objects.create(post=post, author=self.remote, comment="comment")
+        comment.refresh_from_db()
+        self.assertSameJson(comment_to_dict(comment), CommentSerializer(comment).data)
+
+        Like.objects.create(author=self.remote, object_type="post", object_id=str(post.uuid))
+        Like.objects.create(author=self.author, object_type="comment", object_id=str(comment.uuid))
+        Like.objects.create(author=self.author, object_type="post", object_id=str(uuid4()))
+        likes = Like.objects.all()
+        self.assertSameJson(likes_to_dicts(likes), LikeSerializer(likes, many=True).data)
+        self.assertSameJson(likes_to_dicts(likes), [LikeSerializer(like).data for like in likes])
+
+
+class RenderersTestCase(TestCase):
+    data = {
+        "id": uuid4(),
+        "published": datetime(2024, 3, 1, 12, 30, 5, 1234, tzinfo=timezone.utc),
+        "items": [{"title": "héllo", "count": 1, "visible": True, "description": None}],
+    }
+
+    def test_matches_drf(self):
+        expected = JSONRenderer().render(self.data)
+        self.assertEqual(renderers.dumps(self.data), expected)
+        with mock.patch.object(renderers, "orjson", None):
+            self.assertEqual(renderers.dumps(self.data), expected)
+
+    def test_parser_round_trip(self):
+        parsed = renderers.FastJSONParser().parse(io.BytesIO(renderers.dumps(self.data)))
+        self.assertEqual(parsed["id"], str(self.data["id"]))
+        self.assertEqual(parsed["published"], "2024-03-01T12:30:05.001234Z")
+
+    def test_json_response(self):
+        r = renderers.JsonResponse(self.data)
+        self.assertEqual(r["Content-Type"], "application/json")
+        self.assertEqual(json.loads(r.content)["items"], self.data["items"])
+        with self.assertRaises(TypeError):
+            renderers.JsonResponse([1, 2, 3])
+
+
+class PeerHandler(BaseHTTPRequestHandler):
+    """
+    A minimal keep-alive peer node for exercising outbound federation requests.
+    """
+
+    protocol_version = "HTTP/1.1"
+    etag = '"v1"'
+    down = False
+    hits = []
+    author_count = 0
+    posts = []
+    post_status = 201
+    post_ids = []
+
+    def peer_host(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def send_body(self, status_code: int, body: bytes):
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        PeerHandler.hits.append((self.path, self.headers.get("If-None-Match")))
+        if "slow" in self.path:
+            time.sleep(0.5)
+        if self.path.startswith("/authors/?"):
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            page, size = int(query["page"][0]), int(query["size"][0])
+            items = [{"type": "author", "id": f"{self.peer_host()}authors/{i}", "displayName": f"remote {i}"}
+                     for i in range(self.author_count)][(page - 1) * size:page * size]
+            self.send_body(200, json.dumps({"type": "authors", "items": items}).encode())
+        elif self.down:
+            self.send_body(503, b"")
+        elif "/posts/?" in self.path:
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            page, size = int(query["page"][0]), int(query["size"][0])
+            items = [{"type": "post", "id": post_id} for post_id in self.post_ids][(page - 1) * size:page * size]
+            self.send_body(200, json.dumps({"type": "posts", "items": items}).encode())
+        elif self.headers.get("If-None-Match") == self.etag:
+            self.send_body(304, b"")
+        else:
+            self.send_body(200, json.dumps({"type": "author", "path": self.path}).encode())
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.down:
+            self.send_body(503, b"")
+        else:
+            PeerHandler.posts.append((self.path, body))
+            if "slow" in self.path:
+                time.sleep(0.5)
+            self.send_body(self.post_status, b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class PeerServerTestCase(TestCase):
+    handler = PeerHandler
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), cls.handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.peer_host = f"http://127.0.0.1:{cls.server.server_address[1]}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        federation.reset_clients()
+        cache.clear()
+        PeerHandler.hits = []
+        PeerHandler.posts = []
+        PeerHandler.down = False
+        PeerHandler.post_status = 201
+        self.node = Node.objects.create(host=self.peer_host, user=User.objects.create_user("peer"),
+                                        our_username="us", our_password="pwd")
+
+    def tearDown(self):
+        federation.reset_clients()
+
+
+class FederationClientTestCase(PeerServerTestCase):
+    def test_keep_alive(self):
+        for i in range(3):
+            r = self.node.r_get(f"authors/{i}/")
+            self.assertEqual(r.json()["path"], f"/authors/{i}/")
+
+        stats = self.node.client.stats()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["errors"], 0)
+        self.assertEqual(stats["pools"][0]["connections"], 1)
+        self.assertIn(stats, federation.pool_stats())
+
+    @override_settings(FEDERATION_READ_TIMEOUT=0.1, FEDERATION_RETRIES=0)
+    def test_timeout(self):
+        start = time.monotonic()
+        with self.assertRaises(requests.RequestException):
+            self.node.r_get("slow")
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(self.node.client.stats()["errors"], 1)
+
+
+@override_settings(FEDERATION_RETRIES=0, FEDERATION_BREAKER_MIN_CALLS=3, FEDERATION_BREAKER_COOLDOWN=60)
+class CircuitBreakerTestCase(PeerServerTestCase):
+    def fail(self, n: int):
+        PeerHandler.down = True
+        for _ in range(n):
+            self.assertEqual(self.node.r_get("authors/x/").status_code, 503)
+        PeerHandler.down = False
+
+    def test_opens_after_failures(self):
+        self.fail(3)
+        self.assertEqual(self.node.client.breaker.snapshot()["state"], "open")
+
+        hits = len(PeerHandler.hits)
+        with self.assertRaises(federation.CircuitOpenError):
+            self.node.r_get("authors/x/")
+        self.assertEqual(len(PeerHandler.hits), hits)
+
+    def test_half_open_trial(self):
+        self.fail(3)
+        with override_settings(FEDERATION_BREAKER_COOLDOWN=0):
+            self.assertTrue(self.node.client.breaker.available())
+            self.assertTrue(self.node.r_get("authors/x/").ok)
+        self.assertEqual(self.node.client.breaker.snapshot()["state"], "closed")
+
+    def test_view_fails_fast(self):
+        remote = Author.objects.create(node=self.node, extern_id="remote", remote_name="remote")
+        self.fail(3)
+        response = self.client.get(f"/api/authors/{remote.id}/followers")
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+    @override_settings(FEDERATION_NODE_INFLIGHT=1, FEDERATION_BULKHEAD_WAIT=0.05)
+    def test_bulkhead(self):
+        federation.reset_clients()
+        slow = threading.Thread(target=self.node.r_get, args=("slow",))
+        slow.start()
+        time.sleep(0.1)
+        with self.assertRaises(federation.BulkheadFullError):
+            self.node.r_get("authors/x/")
+        slow.join()
+        self.assertTrue(self.node.r_get("authors/x/").ok)
+
+
+class ConcurrentFederationTestCase(PeerServerTestCase):
+    def test_followers_fetched_concurrently(self):
+        author = setup_authors(1)[0]
+        for i in range(6):
+            Author.objects.create(extern_id=f"slow{i}", node=self.node, is_approved=True).follow(author)
+
+        start = time.monotonic()
+        r = self.client.get(f"/api/ext/authors/{author.id}/followers")
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(sorted(item["path"] for item in r.data["items"]),
+                         [f"/authors/slow{i}/" for i in range(6)])
+        self.assertLess(elapsed, 1.5)
+
+    def test_deadline(self):
+        results = federation.gather_calls([
+            (self.node.host, partial(self.node.r_get, "authors/slow/")),
+            (self.node.host, partial(self.node.r_get, "authors/fast/")),
+        ], deadline=0.25)
+        self.assertIsNone(results[0])
+        self.assertEqual(results[1].json()["path"], "/authors/fast/")
+
+    def test_deadline_bounds_requests(self):
+        # a call that missed the deadline does not keep its thread busy with further requests
+        finished = threading.Event()
+
+        def slow_calls():
+            try:
+                for _ in range(3):
+                    self.node.r_get("authors/slow/")
+            finally:
+                finished.set()
+
+        start = time.monotonic()
+        self.assertEqual(federation.gather_calls([(self.node.host, slow_calls)], deadline=0.2), [None])
+        self.assertTrue(finished.wait(0.5))
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(sum(1 for path, _ in PeerHandler.hits if "slow" in path), 1)
+        self.assertIsNone(federation.remaining_time())
+
+
+class RemoteProfileCacheTestCase(PeerServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.remote = Author.objects.create(extern_id="cached", node=self.node, is_approved=True)
+
+    def test_fresh_entries_are_reused(self):
+        for _ in range(3):
+            self.assertEqual(author_to_json(self.remote)["path"], "/authors/cached/")
+        self.assertEqual(len(PeerHandler.hits), 1)
+
+        invalidate_remote_profile(self.remote)
+        author_to_json(self.remote)
+        self.assertEqual(len(PeerHandler.hits), 2)
+
+    @override_settings(REMOTE_PROFILE_TTL=0, FEDERATION_RETRIES=0)
+    def test_revalidation_and_stale(self):
+        first = author_to_json(self.remote)
+        self.assertEqual(author_to_json(self.remote), first)
+        self.assertEqual(PeerHandler.hits[-1], ("/authors/cached/", PeerHandler.etag))
+
+        PeerHandler.down = True
+        self.assertEqual(author_to_json(self.remote), first)
+        r = self.client.get(f"/api/authors/{self.remote.id}/")
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(json.loads(r.content), first)
+
+        invalidate_remote_profile(self.remote)
+        self.assertIsNone(author_to_json(self.remote))
+
+
+@override_settings(REMOTE_POSTS_PAGE_SIZE=3)
+class RemotePostsCacheTestCase(PeerServerTestCase):
+    def setUp(self):
+        super().setUp()
+        PeerHandler.post_ids = [f"p{i}" for i in range(7, 0, -1)]
+        self.remote = Author.objects.create(node=self.node, extern_id="remote", remote_name="remote")
+
+    def post_hits(self) -> int:
+        return sum(1 for path, _ in PeerHandler.hits if "/posts/?" in path)
+
+    def refreshed_listing(self) -> list[str]:
+        # serves the stale listing, then waits for the background refresh
+        stale = [post["id"] for post in remote_posts(self.remote)]
+        future = _refreshing.get(_posts_key(self.remote))
+        if future is not None:
+            future.result()
+        return stale
+
+    def test_local_pagination(self):
+        url = f"/api/authors/{self.remote.id}/posts/"
+        response = self.client.get(url, {"page": 2, "size": 2})
+        self.assertEqual([post["id"] for post in response.json()["items"]], ["p5", "p4"])
+        self.assertEqual(self.post_hits(), 3)
+
+        response = self.client.get(url, {"page": 4, "size": 2})
+        self.assertEqual([post["id"] for post in response.json()["items"]], ["p1"])
+        self.assertEqual(len(self.client.get(url).json()["items"]), 7)
+        self.assertEqual(self.post_hits(), 3)
+
+    def test_incremental_refresh(self):
+        remote_posts(self.remote)
+        PeerHandler.post_ids = ["p9", "p8"] + PeerHandler.post_ids
+        PeerHandler.hits = []
+
+        invalidate_remote_posts(self.remote)
+        self.assertEqual(self.refreshed_listing(), [f"p{i}" for i in range(7, 0, -1)])
+        self.assertEqual(self.post_hits(), 1)
+        self.assertEqual([post["id"] for post in remote_posts(self.remote)], [f"p{i}" for i in range(9, 0, -1)])
+
+    def test_stale_while_down(self):
+        remote_posts(self.remote)
+        PeerHandler.down = True
+        invalidate_remote_posts(self.remote)
+        self.refreshed_listing()
+        self.assertEqual(len(remote_posts(self.remote)), 7)
+        self.assertNotIn(_posts_key(self.remote), _refreshing)
+
+    def test_post_count(self):
+        client = APIClient()
+        client.force_authenticate(setup_authors(1)[0].user)
+        response = client.get(f"/api/ext/authors/{self.remote.id}/post_count")
+        self.assertEqual(response.json(), {"count": 7, "exact": True})
+
+    @override_settings(REMOTE_POSTS_MAX=5)
+    def test_post_count_lower_bound(self):
+        client = APIClient()
+        client.force_authenticate(setup_authors(1)[0].user)
+        response = client.get(f"/api/ext/authors/{self.remote.id}/post_count")
+        self.assertEqual(response.json(), {"count": 5, "exact": False})
+
+        # a refresh that stops at a known post keeps the older, cut part of the listing
+        PeerHandler.post_ids = ["p8"] + PeerHandler.post_ids
+        invalidate_remote_posts(self.remote)
+        self.refreshed_listing()
+        self.assertEqual(remote_post_count(self.remote), (5, False))
+
+
+class RemoteJsonCacheTestCase(PeerServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.remote = Author.objects.create(node=self.node, extern_id="remote", remote_name="remote")
+        self.post = Post.objects.create(title="remote", content="remote", author=self.remote, extern_id=uuid4().hex,
+                                        visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+        self.path = f"authors/remote/posts/{self.post.extern_id}/comments"
+
+    def hits(self) -> int:
+        return sum(1 for path, _ in PeerHandler.hits if path.startswith(f"/{self.path}"))
+
+    def test_comments_cached_per_page(self):
+        url = f"/api/authors/{self.remote.id}/posts/{self.post.uuid}/comments"
+        for _ in range(3):
+            response = self.client.get(url, {"page": 1, "size": 5})
+            self.assertEqual(response.json()["path"], f"/{self.path}?page=1&size=5")
+        self.assertEqual(self.hits(), 1)
+
+        self.client.get(url, {"page": 2, "size": 5})
+        self.assertEqual(self.hits(), 2)
+
+    def wait_for_refreshes(self):
+        for future in list(_refreshing.values()):
+            future.result()
+
+    @override_settings(REMOTE_JSON_TTL=0)
+    def test_stale_while_revalidate(self):
+        remote_json(self.node, self.path, 1, 5)
+        PeerHandler.down = True
+        for _ in range(2):
+            self.assertEqual(remote_json(self.node, self.path, 1, 5)["type"], "author")
+            self.wait_for_refreshes()
+
+    def test_invalidated_by_inbox(self):
+        remote_json(self.node, self.path, 1, 5)
+        invalidate_remote_thread(f"{self.peer_host}authors/someone/posts/other")
+        remote_json(self.node, self.path, 1, 5)
+        self.assertEqual(self.hits(), 1)
+
+        local = setup_authors(1)[0]
+        response = self.client.post(f"/api/authors/{local.id}/inbox", {
+            "type": "Like",
+            "summary": "remote likes your post",
+            "author": {"id": f"{self.peer_host}authors/remote"},
+            "object": f"{self.peer_host}authors/remote/posts/{self.post.extern_id}",
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        remote_json(self.node, self.path, 1, 5)
+        self.assertEqual(self.hits(), 2)
+
+
+class RemoteAuthorsScanTestCase(PeerServerTestCase):
+    def setUp(self):
+        super().setUp()
+        PeerHandler.author_count = 5
+
+    def tearDown(self):
+        PeerHandler.author_count = 0
+        super().tearDown()
+
+    def test_scan_pages_and_upserts(self):
+        renamed = Author.objects.create(node=self.node, extern_id="3", remote_name="old name")
+        unchanged = Author.objects.create(node=self.node, extern_id="4", remote_name="remote 4")
+        cache.set_many({_profile_key(renamed): {}, _profile_key(unchanged): {}})
+
+        report = scan_remote_authors(page_size=2)
+        # only the cached profile with the old name is dropped
+        self.assertEqual(list(cache.get_many([_profile_key(renamed), _profile_key(unchanged)])),
+                         [_profile_key(unchanged)])
+        self.assertEqual(report[0]["authors"], 5)
+        self.assertEqual(report[0]["created"], 3)
+        self.assertEqual(report[0]["updated"], 1)
+        self.assertEqual(sum(1 for path, _ in PeerHandler.hits if path.startswith("/authors/?")), 3)
+
+        self.assertEqual(Author.objects.filter(node=self.node).count(), 5)
+        renamed.refresh_from_db()
+        self.assertEqual(renamed.remote_name, "remote 3")
+
+        report = scan_remote_authors(page_size=2)
+        self.assertEqual((report[0]["created"], report[0]["updated"]), (0, 0))
+        self.assertEqual(Author.objects.filter(node=self.node).count(), 5)
+
+
+@override_settings(OUTBOX_RETRY_BASE=60)
+class OutboxTestCase(PeerServerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.local = setup_authors(1)[0]
+        self.remote = Author.objects.create(node=self.node, extern_id="remote", remote_name="remote")
+
+    def queue(self, n: int) -> list[OutboxItem]:
+        return [outbox.enqueue(self.node, "authors/remote/inbox", {"type": "comment", "n": i}) for i in range(n)]
+
+    def test_like_is_queued(self):
+        post = Post.objects.create(title="remote", content="remote", author=self.remote, extern_id="p1",
+                                   visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+        url = reverse("post-likes", kwargs={"author_id": self.remote.id, "post_id": post.uuid})
+
+        response = APIClient().post(url, {"id": str(self.local.id)}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(PeerHandler.posts, [])
+
+        item = OutboxItem.objects.get()
+        self.assertEqual(item.path, "authors/remote/inbox")
+        self.assertEqual(item.body["object"], f"{self.peer_host}authors/remote/posts/p1")
+
+        outbox.drain()
+        self.assertEqual([body["type"] for _, body in PeerHandler.posts], ["Like"])
+        self.assertEqual(OutboxItem.objects.get().status, OutboxItem.Status.DELIVERED)
+
+    def test_delivered_in_order(self):
+        self.queue(5)
+        report = outbox.drain()
+        self.assertEqual(report[self.peer_host]["delivered"], 5)
+        self.assertEqual([body["n"] for _, body in PeerHandler.posts], list(range(5)))
+        self.assertEqual(PeerHandler.posts[0][0], "/authors/remote/inbox")
+
+    def test_retry_blocks_node(self):
+        items = self.queue(3)
+        PeerHandler.down = True
+        report = outbox.deliver_due()
+        self.assertEqual(report[self.peer_host], {"delivered": 0, "failed": 0, "retrying": 1})
+
+        head = OutboxItem.objects.get(pk=items[0].pk)
+        self.assertEqual(head.attempts, 1)
+        self.assertGreater(head.next_attempt_at, items[0].next_attempt_at)
+        self.assertEqual(OutboxItem.objects.filter(attempts=0).count(), 2)
+
+        # nothing is due until the head item's backoff expires
+        PeerHandler.down = False
+        self.assertEqual(outbox.deliver_due(), {})
+        self.assertEqual(PeerHandler.posts, [])
+
+        OutboxItem.objects.filter(pk=head.pk).update(next_attempt_at=items[0].next_attempt_at)
+        outbox.drain()
+        self.assertEqual([body["n"] for _, body in PeerHandler.posts], [0, 1, 2])
+        self.assertFalse(OutboxItem.objects.exclude(status=OutboxItem.Status.DELIVERED).exists())
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=1)
+    def test_gives_up(self):
+        self.queue(1)
+        PeerHandler.down = True
+        outbox.deliver_due()
+        self.assertEqual(OutboxItem.objects.get().status, OutboxItem.Status.FAILED)
+
+    def test_rejected_is_not_retried(self):
+        self.queue(2)
+        PeerHandler.post_status = 400
+        report = outbox.drain()
+        self.assertEqual(report[self.peer_host]["failed"], 2)
+        self.assertEqual(len(PeerHandler.posts), 2)
+
+    def test_claimed_queue_is_skipped(self):
+        items = self.queue(3)
+        # another process claimed the node's queue
+        claimed = outbox._claim(self.node, datetime.now(timezone.utc))
+        self.assertEqual([item.pk for item in claimed], [item.pk for item in items])
+        self.assertEqual(outbox._claim(self.node, datetime.now(timezone.utc)), [])
+        self.assertEqual(outbox.deliver_due(), {})
+        self.assertEqual(PeerHandler.posts, [])
+
+        # its lease expires, e.g. because it died
+        OutboxItem.objects.update(claimed_until=datetime(2020, 1, 1, tzinfo=timezone.utc))
+        outbox.drain()
+        self.assertEqual([body["n"] for _, body in PeerHandler.posts], [0, 1, 2])
+        self.assertFalse(OutboxItem.objects.filter(claimed_until__isnull=False).exists())
+
+    @override_settings(OUTBOX_DRAIN_DEADLINE=0.2, FEDERATION_SLOW_CALL=10)
+    def test_deadline_keeps_progress(self):
+        first, slow, last = self.queue(3)
+        OutboxItem.objects.filter(pk=slow.pk).update(path="authors/slow/inbox")
+        report = outbox.deliver_due()
+        self.assertEqual(report[self.peer_host], {"delivered": 1, "failed": 0, "retrying": 1})
+
+        items = OutboxItem.objects.in_bulk()
+        self.assertEqual(items[first.pk].status, OutboxItem.Status.DELIVERED)
+        self.assertEqual((items[slow.pk].status, items[slow.pk].attempts), (OutboxItem.Status.PENDING, 1))
+        self.assertEqual((items[last.pk].status, items[last.pk].attempts), (OutboxItem.Status.PENDING, 0))
+        self.assertFalse(OutboxItem.objects.filter(claimed_until__isnull=False).exists())
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    The hot lookups must be index searches, not full table scans (or sorts of whole tables).
+    """
+
+    FULL_SCAN = {
+        "sqlite": re.compile(r"\bSCAN (?!CONSTANT ROW)|USE TEMP B-TREE FOR ORDER BY"),
+        "postgresql": re.compile(r"Seq Scan"),
+    }
+
+    def setUp(self):
+        if connection.vendor not in self.FULL_SCAN:
+            self.skipTest(f"no query plan checks for {connection.vendor}")
+        if connection.vendor == "postgresql":
+            # tiny test tables are cheaper to scan, so make the planner show whether it could use an index
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+        self.author = setup_authors(1)[0]
+        self.node = Node.objects.create(host="https://www.example.com/srv/", user=User.objects.create_user("node"))
+
+    def assertIndexed(self, queryset):
+        plan = queryset.explain()
+        self.assertIsNone(self.FULL_SCAN[connection.vendor].search(plan), plan)
+
+    def test_feeds(self):
+        self.assertIndexed(visible_posts(None).order_by(*POST_ORDERING)[:10])
+        self.assertIndexed(Post.objects.filter(author=self.author, visibility=Post.Visibility.PUBLIC, extern_id=None)
+                           .select_related("author__user", "author__node").order_by(*POST_ORDERING)[:10])
+        self.assertIndexed(Comment.objects.filter(post=uuid4()).select_related("author__user", "author__node")
+                           .order_by("-published", "-uuid")[:10])
+
+    def test_inbox(self):
+        self.assertIndexed(Notification.objects.filter(recipient=self.author).order_by("-created_at", "-uuid")[:10])
+
+    def test_likes(self):
+        self.assertIndexed(Like.objects.filter(object_id=str(uuid4()), object_type="post")
+                           .select_related("author__user", "author__node"))
+        self.assertIndexed(Like.objects.filter(author=self.author).order_by("-published", "-id")[:10])
+
+    def test_federation(self):
+        self.assertIndexed(Author.objects.filter(extern_id="remote"))
+        self.assertIndexed(Author.objects.filter(node=self.node, extern_id="remote"))
+        self.assertIndexed(Post.objects.filter(extern_id=uuid4().hex))
+        self.assertIndexed(Node.objects.filter(host="https://www.example.com/srv/"))
+
+    def test_remote_author_unique_per_node(self):
+        Author.objects.create(node=self.node, extern_id="remote")
+        with self.assertRaises(IntegrityError):
+            Author.objects.create(node=self.node, extern_id="remote")
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    List endpoints must issue a fixed number of queries, however many items they return.
+    Subclasses provide `budgets`, a mapping of URL templates to their maximum number of queries.
+    """
+
+    budgets: dict[str, int] = {}
+
+    def setUp(self):
+        self.author = setup_authors(1)[0]
+        username = self.author.user.username
+        self.headers = {"Authorization": make_basic_header(username, username + "pwd")}
+        self.post = Post.objects.create(title="post", description="", content="content", author=self.author,
+                                        visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+        self.comment = Comment.objects.create(post=self.post, author=self.author, comment="comment")
+
+    def grow(self, n: int):
+        for reader in setup_authors(n):
+            reader.follow(self.author)
+            self.author.follow(reader)
+            reply = Post.objects.create(title="reply", description="", content="content", author=reader,
+                                        visibility=Post.Visibility.FRIENDS, content_type=Post.ContentType.PLAIN)
+            TimelineEntry.fan_out(reply)
+            comment = Comment.objects.create(post=self.post, author=reader, comment="comment")
+            like = Like.objects.create(author=reader, object_type="post", object_id=str(self.post.uuid))
+            Like.objects.create(author=reader, object_type="comment", object_id=str(self.comment.uuid))
+            Like.objects.create(author=self.author, object_type="post", object_id=str(reply.uuid))
+            Notification.objects.create(recipient=self.author, type="follow", data={"type": "follow"})
+            Notification.reference(self.author, "comment", comment).save()
+            Notification.reference(self.author, "Like", like).save()
+
+    def count_queries(self, url: str) -> int:
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(url, headers=self.headers)
+        self.assertEqual(r.status_code, 200, url)
+        return len(ctx.captured_queries)
+
+    def test_query_budgets(self):
+        urls = {
+            template.format(author=self.author.id.hex, post=self.post.uuid.hex, comment=self.comment.uuid.hex,
+                            srv=urllib.parse.quote(SRV_URL, safe="")): budget
+            for template, budget in self.budgets.items()
+        }
+
+        self.grow(2)
+        small = {url: self.count_queries(url) for url in urls}
+        self.grow(8)
+        for url, budget in urls.items():
+            with self.subTest(url=url):
+                large = self.count_queries(url)
+                self.assertEqual(small[url], large)
+                self.assertLessEqual(large, budget)
+
+
+class ApiQueryBudgetTestCase(QueryBudgetTestCase):
+    budgets = {
+        "/api/authors/?page=1&size=50": 3,
+        "/api/authors/{author}/posts/?page=1&size=50": 6,
+        "/api/authors/{author}/followers": 3,
+        "/api/authors/{author}/posts/{post}/comments?page=1&size=50": 5,
+        "/api/authors/{author}/posts/{post}/likes": 4,
+        "/api/authors/{author}/posts/{post}/comments/{comment}/likes": 7,
+        "/api/authors/{author}/liked": 4,
+        "/api/authors/{author}/inbox?page=1&size=50": 7,
+        "/api/posts/?size=50": 3,
+    }
@@ -39,4 +39,6 @@ urlpatterns = [
     # Main reason is to offer a compromise between /api/ and /api/ext/
     # so that other nodes may be able to use these endpoints.
     path("posts/", ext.GlobalPostsView.as_view()),
+    # activities for many inboxes at once, for peer nodes
+    path("inbox", views.BulkInboxView.as_view(), name="bulk_inbox"),
 ]
@@ -7,11 +7,10 @@ import uuid
 
 from web_dev_noobs_be.settings import SRV_URL
 import pytz
-import requests
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
-from django.core.paginator import Paginator
+from django.db import transaction
 from django.http import (
-    JsonResponse,
     HttpResponseBadRequest,
     HttpResponseNotFound,
     HttpResponse,
@@ -32,7 +31,23 @@ from rest_framework.response import Response
 from rest_framework.status import HTTP_403_FORBIDDEN, HTTP_200_OK, HTTP_400_BAD_REQUEST
 from rest_framework.views import APIView
 
-from .models import Notification, Author, Post, Comment, Like, Node
+from .conditional import not_modified, object_validators, page_validators, with_validators
+from .fast_serializers import author_to_dict, comment_to_dict, likes_to_dicts, notifications_to_dicts, post_to_dict
+from .image_store import serve_image, variant_width
+from .inbox import ingest
+from .models import Notification, Author, Post, Comment, Like, Node, TimelineEntry, InboxActivity
+from .outbox import enqueue
+from .pagination import get_pagination_data, keyset_page, paginate
+from .remote_cache import (
+    RemoteFetchError,
+    invalidate_remote_posts,
+    invalidate_remote_profile,
+    invalidate_remote_thread,
+    remote_json,
+    remote_posts,
+    remote_profile,
+)
+from .renderers import JsonResponse
 from .serializers import (
     AuthorSerializer,
     NotificationSerializer,
@@ -42,28 +57,7 @@ from .serializers import (
 )
 
 
-def get_pagination_data(request):
-    page_number = request.GET.get("page")
-    size = request.GET.get("size")
-
-    if page_number is None or size is None:
-        return False, HttpResponseBadRequest("Page number and size must be provided")
-
-    try:
-        page_number = int(page_number)
-        if page_number < 1:
-            return False, HttpResponseBadRequest("Page number must be greater than 0")
-    except ValueError:
-        return False, HttpResponseBadRequest("Page number must be an integer")
-
-    try:
-        size = int(size)
-        if size < 1:
-            return False, HttpResponseBadRequest("Size must be greater than 0")
-    except ValueError:
-        return False, HttpResponseBadRequest("Size must be an integer")
-
-    return page_number, size
+POST_ORDERING = ("-published", "-uuid")
 
 
 class PostView(APIView):
@@ -78,19 +72,20 @@ class PostView(APIView):
     def get(request, author_id, post_id):
         author = Author.objects.get(id=author_id)
 
-        post = get_object_or_404(Post, pk=UUID(post_id))
+        post = get_object_or_404(Post.objects.select_related("author__user", "author__node"), pk=UUID(post_id))
 
         if Post.Visibility(post.visibility) == Post.Visibility.FRIENDS:
-            if (
+            if not (
                 post.author.is_friend(request.user)
                 or post.author.user == request.user
             ):
-                return Response(PostSerializer(post).data, status=HTTP_200_OK)
-            else:
                 return Response(status=HTTP_403_FORBIDDEN)
-        else:
-            # if unlisted or public return the post
-            return Response(PostSerializer(post).data)
+
+        validators = object_validators(request, post, post.author)
+        response = not_modified(request, validators)
+        if response is not None:
+            return response
+        return with_validators(Response(PostSerializer(post).data, status=HTTP_200_OK), validators)
 
     @staticmethod
     @extend_schema(
@@ -120,9 +115,12 @@ class PostView(APIView):
         post = Post.objects.get(pk=UUID(post_id))
 
         if request.user == post.author.user:
+            visibility = post.visibility
             serializer = PostSerializer(post, data=request.data, partial=True)
             if serializer.is_valid():
-                serializer.save()
+                post = serializer.save()
+                if post.visibility != visibility:
+                    TimelineEntry.fan_out(post)
                 return Response(status=HTTP_200_OK)
             else:
                 return Response(status=HTTP_400_BAD_REQUEST)
@@ -165,6 +163,7 @@ class MainPostsView(APIView):
             serializer = PostSerializer(data=data)
             if serializer.is_valid():
                 post = serializer.save(author=author)
+                TimelineEntry.fan_out(post)
                 return Response(PostSerializer(post).data, status=HTTP_200_OK)
             else:
                 return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
@@ -190,10 +189,6 @@ class MainPostsView(APIView):
     )
 
     def get(request, author_id):
-        page_number, size = get_pagination_data(request)
-        if page_number is False:
-            return size  # if page_number is False then size is actually a Response object
-
         try:
             author_id = UUID(author_id)
         except ValueError:
@@ -202,59 +197,42 @@ class MainPostsView(APIView):
         author = get_object_or_404(Author, id=author_id)
 
         if author.remote:
-            r = author.node.r_get("authors/" + author.extern_id + f"/posts/?page=1&size=500")
-            if not r.ok:
-                return Response(r.content, status=r.status_code)
+            if "page" in request.GET or "size" in request.GET:
+                page_number, size = get_pagination_data(request)
+                if page_number is False:
+                    return size  # if page_number is False then size is actually a Response object
             else:
-                posts_data = r.json()
-                if isinstance(posts_data, list):
-                    return Response({"type": "posts", "items": posts_data}, status=r.status_code)
-                if 'items' in posts_data:
-                    return Response(posts_data, status=r.status_code)
-                else:
-                    items = posts_data["posts"]
-                    formatted_response = {"type": "posts", "items": items}
-                    return Response(formatted_response, status=r.status_code)
-
-        else:
-            if not request.user.is_authenticated or not Author.objects.filter(user=request.user).exists():
-                paginator = Paginator(Post.objects.filter(author=author, visibility=Post.Visibility.PUBLIC, extern_id = None).order_by("-published"), per_page = size)
-            else :
-                try:
-                        requesting_author = Author.objects.get(user=request.user)
-                except Author.DoesNotExist:
-                    return HttpResponseNotFound("Requesting author not found")
-                if (request.user != author.user):
-                    is_friends = requesting_author.is_friend(author)
-                    if (is_friends):
-                        paginator = Paginator(Post.objects.filter(author=author, visibility__in=[Post.Visibility.PUBLIC, Post.Visibility.FRIENDS]).order_by("-published"), per_page=size)
-                    else:
-                        if author.remote:
-                            if requesting_author.is_following(author):
-                                paginator = Paginator(Post.objects.filter(author=author, visibility=Post.Visibility.PUBLIC).order_by("-published"), per_page = size)
-                        else:
-                            paginator = Paginator(Post.objects.filter(author=author, visibility=Post.Visibility.PUBLIC).order_by("-published"), per_page = size)
-                else:
-
-                    paginator = Paginator(Post.objects.filter(author=author).order_by("-published"), per_page=size)
+                page_number, size = 1, settings.REMOTE_POSTS_MAX
 
-
-            if page_number <= paginator.num_pages:
-                page = paginator.get_page(page_number)  # this is 1-indexed so this is fine
-                return JsonResponse(
-                    {"type": "posts", "items": [PostSerializer(post).data for post in page]}
-                )
+            try:
+                items = remote_posts(author)
+            except RemoteFetchError as e:
+                return Response(e.content, status=e.status)
+            offset = (page_number - 1) * size
+            return JsonResponse({"type": "posts", "items": items[offset:offset + size]})
+
+        if not request.user.is_authenticated or not Author.objects.filter(user=request.user).exists():
+            posts_query = Post.objects.filter(author=author, visibility=Post.Visibility.PUBLIC, extern_id=None)
+        elif request.user != author.user:
+            requesting_author = Author.objects.get(user=request.user)
+            if requesting_author.is_friend(author):
+                posts_query = Post.objects.filter(author=author, visibility__in=[Post.Visibility.PUBLIC, Post.Visibility.FRIENDS])
             else:
                 posts_query = Post.objects.filter(author=author, visibility=Post.Visibility.PUBLIC)
-
-        paginator = Paginator(posts_query.order_by("-published"), per_page=size)
-        if page_number <= paginator.num_pages:
-            page = paginator.get_page(page_number)
-            return JsonResponse(
-                {"type": "posts", "items": [PostSerializer(post).data for post in page]}
-            )
         else:
-            return HttpResponseNotFound("Page not found")
+            posts_query = Post.objects.filter(author=author)
+
+        posts, extra = paginate(request, posts_query.select_related("author__user", "author__node"), POST_ORDERING)
+        if posts is False:
+            return extra  # if posts is False then extra is actually a Response object
+
+        validators = page_validators(request, posts, related=("author",))
+        response = not_modified(request, validators)
+        if response is not None:
+            return response
+        return with_validators(JsonResponse(
+            {"type": "posts", "items": [post_to_dict(post) for post in posts], **extra}
+        ), validators)
 
 
 @extend_schema(
@@ -274,6 +252,13 @@ class MainPostsView(APIView):
             required=False,
             type=int,
         ),
+        OpenApiParameter(
+            name="cursor",
+            description="Opaque cursor from the `next` field of a previous page, empty for the first page. "
+            "Replaces `page` with keyset pagination.",
+            required=False,
+            type=str,
+        ),
     ],
     responses={
         200: inline_serializer(
@@ -290,28 +275,26 @@ class MainPostsView(APIView):
 
 @api_view(["GET"])
 def get_all_authors_paginated(request):
-    page_number, size = get_pagination_data(request)
-
-    if page_number is False:
-        return size  # if page_number is False then size is actually a Response object
-
     local = request.GET.get("local", None) is not None
 
     qs = Author.objects.all() if local else Author.objects.filter(node=None)
-    qs = qs.order_by("id")
-
-    paginator = Paginator(qs, per_page=size)
-
-    if page_number <= paginator.num_pages:
-        page = paginator.get_page(page_number)  # this is 1-indexed so this is fine
-        return JsonResponse(
-            {
-                "type": "authors",
-                "items": [AuthorSerializer(author).data for author in page],
-            }
-        )
-    else:
-        return HttpResponseNotFound("Page not found")
+    qs = qs.select_related("user", "node")
+
+    authors, extra = paginate(request, qs, ("id",))
+    if authors is False:
+        return extra  # if authors is False then extra is actually a Response object
+
+    validators = page_validators(request, authors)
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+    return with_validators(JsonResponse(
+        {
+            "type": "authors",
+            "items": [author_to_dict(author) for author in authors],
+            **extra,
+        }
+    ), validators)
 
 
 class SingleAuthorView(APIView):
@@ -322,15 +305,18 @@ class SingleAuthorView(APIView):
         responses={200: AuthorSerializer},
     )
     def get(request, author_id):
-        author = Author.objects.get(id=author_id)
+        author = Author.objects.select_related("user", "node").get(id=author_id)
         if author.remote:
-            r = author.node.r_get("authors/" + author.extern_id + "/")
-            if not r.ok:
-                return Response(r.content, status=r.status_code)
-            else:
-                return JsonResponse(r.json(), status=r.status_code)
+            try:
+                return JsonResponse(remote_profile(author))
+            except RemoteFetchError as e:
+                return Response(e.content, status=e.status)
         else:
-            return JsonResponse(AuthorSerializer(author).data)
+            validators = object_validators(request, author)
+            response = not_modified(request, validators)
+            if response is not None:
+                return response
+            return with_validators(JsonResponse(AuthorSerializer(author).data), validators)
 
     @staticmethod
     def put(request, author_id):
@@ -374,14 +360,14 @@ class FollowersView(APIView):
         author = Author.objects.get(id=author_id)
 
         if author.remote:
-            r = requests.get(author.node.make_url("authors/" + author.extern_id + "/followers"), auth=(author.node.our_username, author.node.our_password))
+            r = author.node.r_get("authors/" + author.extern_id + "/followers")
             if not r.ok:
                 return Response(r.content, status=r.status_code)
             else:
                 return JsonResponse(r.json(), status=r.status_code)
         else:
 
-            fds = [AuthorSerializer(follower).data for follower in author.followers.all()]
+            fds = [author_to_dict(follower) for follower in author.followers.select_related("user", "node")]
             return JsonResponse(
                 {
                     "type": "followers",
@@ -488,10 +474,21 @@ class InboxView(APIView):
         return []
 
     @staticmethod
-    def create_notification(recipient, content_type, content):
-        Notification.objects.create(
-            recipient=recipient, type=content_type, data=content
-        )
+    def create_notification(recipient, content_type, content, target=None):
+        Notification.of(recipient, content_type, content, target).save()
+
+    @staticmethod
+    def local_object(item, author):
+        """
+        The post, comment or like of a local author an activity is about, if it exists.
+        """
+        try:
+            if item["type"] == "like":
+                return Like.objects.filter(object_id=item["object"].split('/').pop(), author=author).first()
+            model = Post if item["type"] == "post" else Comment
+            return model.objects.filter(pk=UUID(item["id"].split('/').pop()), author=author).first()
+        except (KeyError, AttributeError, ValueError):
+            return None
 
     @staticmethod
     def create_comment(item, author):
@@ -502,11 +499,10 @@ class InboxView(APIView):
         post = Post.objects.get(uuid=post_id)
         comment_id = object_parts[-1]
         Comment.objects.get_or_create(
-            comment = item["comment"],
-            content_type = item["contentType"],
             author = author,
             post = post,
-            extern_id = comment_id
+            extern_id = comment_id,
+            defaults = {"comment": item["comment"], "content_type": item["contentType"]},
         )
 
 
@@ -531,7 +527,8 @@ class InboxView(APIView):
         content_type_code = Post.ContentType.from_display(item["contentType"]).value
         visibility = item["visibility"].upper()
         visibility_code = Post.Visibility[visibility].value
-        existing_post = Post.objects.filter(extern_id=post_id).first()
+        # extern ids are only unique per node
+        existing_post = Post.objects.filter(extern_id=post_id, author__node=author.node).first()
 
         if existing_post:
             return existing_post, False
@@ -545,6 +542,7 @@ class InboxView(APIView):
                 author=author,
                 extern_id=post_id
             )
+            TimelineEntry.fan_out(post)
             return post, True
 
 
@@ -568,6 +566,9 @@ class InboxView(APIView):
             201: OpenApiResponse(
                 response="Content Type Notification created successfully and sent to the author"
             ),
+            202: OpenApiResponse(
+                response="Queued for delivery to the inbox of a remote author"
+            ),
             406: OpenApiResponse(
                 response="The type can only be post, comment, like, or follow"
             ),
@@ -591,21 +592,12 @@ class InboxView(APIView):
                     return Response("Follow request already sent", status=status.HTTP_409_CONFLICT)
                 else:
                     sending_author.follow(author)
-                    
-
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.debug(f"""
-            POSTING TO {author.remote_name + "(remote)"}:
-            {request.data}
-            ===========================================
-            @ {author.node.make_url(url)}
-            ===========================================
-            """)
-            headers = {"Content-Type": "application/json", }
-            print (url)
-            r = author.node.r_post(url, json=data, headers=headers, auth=(author.node.our_username, author.node.our_password))
-            return HttpResponse(status=r.status_code, content=r.content, content_type=r.headers["Content-Type"])
+
+            enqueue(author.node, url, data)
+            return Response(
+                {"message": f"{r_type} queued for delivery to {author.remote_name}"},
+                status=status.HTTP_202_ACCEPTED,
+            )
         else:
 
             
@@ -629,24 +621,40 @@ class InboxView(APIView):
                         return Response(
                             f"Author not found with either id or extern_id matching: {posting_author_id}",
                             status=status.HTTP_404_NOT_FOUND)
-                if posting_author.remote:
+
+            with transaction.atomic():
+                # peers retry deliveries that timed out, a replay must not be handled twice
+                node = posting_author.node if r_type != "follow" else None
+                if not InboxActivity.record(author, node, data):
+                    return Response("Activity already received", status=status.HTTP_200_OK)
+
+                # notifications refer to the objects of local authors, the payloads of remote ones are stored:
+                # their local mirrors do not have the ids and origins of the originals
+                target = None
+                if r_type != "follow" and posting_author.remote:
+                    invalidate_remote_profile(posting_author)
                     if data["type"] == "post":
+                        invalidate_remote_posts(posting_author)
                         post, created= self.create_post(data, posting_author)
                         if not created:
+                            transaction.set_rollback(True)
                             return Response("Post already exists", status=status.HTTP_409_CONFLICT)
                         elif post is None:
+                            transaction.set_rollback(True)
                             return Response("Post was not created", status=status.HTTP_404_NOT_FOUND)
 
                     elif data["type"] == "comment":
+                        invalidate_remote_thread(data.get("id"))
                         self.create_comment(data, posting_author)
                     elif data["type"] == "like":
+                        invalidate_remote_thread(data.get("object"))
                         self.create_like(data, posting_author)
+                elif r_type != "follow":
+                    target = self.local_object(data, posting_author)
 
-
-
-            self.create_notification(
-                    recipient=author, content_type=r_type, content=data
-                )
+                self.create_notification(
+                        recipient=author, content_type=r_type, content=data, target=target
+                    )
 
             return Response(
                 f"{r_type} Notification created successfully and sent to {author.user.username}",
@@ -670,33 +678,20 @@ class InboxView(APIView):
     )
     def get(self, request, author_id):
         author = get_object_or_404(Author, id=author_id)
-        page_number, size = get_pagination_data(request)
-
-        if page_number is False:
-            return size
 
-        notifications_query = Notification.objects.filter(recipient=author).order_by(
-            "-created_at"
+        notifications, extra = paginate(
+            request, Notification.objects.filter(recipient=author), ("-created_at", "-uuid")
         )
-        paginator = Paginator(notifications_query, per_page=size)
-
-        if page_number <= paginator.num_pages:
-            page = paginator.get_page(page_number)
-            # this is 1-indexed so this is fine
-            items = []
-
-            for notification in page:
-                serializer = NotificationSerializer(notification)
-                notification_data = serializer.data
-                items.append(notification_data["data"])
-            data = {
-                "type": "inbox",
-                "author": AuthorSerializer(author).get_id(author),
-                "items": items
-            }
-            return Response(data, status=status.HTTP_200_OK)
-        else:
-            return HttpResponseNotFound("Page not found")
+        if notifications is False:
+            return extra
+
+        data = {
+            "type": "inbox",
+            "author": AuthorSerializer(author).get_id(author),
+            "items": notifications_to_dicts(notifications),
+            **extra,
+        }
+        return Response(data, status=status.HTTP_200_OK)
 
     @extend_schema(
         responses={
@@ -717,6 +712,54 @@ class InboxView(APIView):
         )
 
 
+class BulkInboxView(APIView):
+    authentication_classes = [BasicAuthentication]
+
+    @extend_schema(
+        request={
+            "application/json": {
+                "type": "object",
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "recipient": {"type": "string"},
+                                "activity": {"type": "object"},
+                            },
+                            "required": ["recipient", "activity"],
+                        },
+                    },
+                },
+                "required": ["items"],
+            },
+        },
+        responses={
+            200: OpenApiResponse(response="The status (and error) of every activity, in order"),
+            400: OpenApiResponse(response="The body is not a list of activities"),
+            403: OpenApiResponse(response="Not authenticated as a node"),
+            413: OpenApiResponse(response="More than INBOX_BATCH_MAX activities"),
+        },
+        summary="Deliver many activities at once",
+        description="For peer nodes: delivers activities (post, comment, like or follow) to the inboxes of local "
+                    "authors, as POSTs to each inbox would, in a single transaction. Every activity gets its own "
+                    "status, so a rejected activity does not fail the others.",
+    )
+    def post(self, request):
+        if not (request.user.is_staff or Node.objects.filter(user_id=request.user.pk).exists()):
+            return Response("Only nodes can deliver activities in bulk", status=status.HTTP_403_FORBIDDEN)
+
+        entries = request.data.get("items") if isinstance(request.data, dict) else request.data
+        if not isinstance(entries, list):
+            return Response("Expected a list of activities in items", status=status.HTTP_400_BAD_REQUEST)
+        if len(entries) > settings.INBOX_BATCH_MAX:
+            return Response(f"At most {settings.INBOX_BATCH_MAX} activities can be delivered at once",
+                            status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        return Response({"type": "inbox", "items": ingest(entries)}, status=status.HTTP_200_OK)
+
+
 class CommentList(APIView):
     @extend_schema(
         responses={200: CommentSerializer(many=True)},
@@ -730,44 +773,39 @@ class CommentList(APIView):
         author = Author.objects.get(id =author_id)
         post = get_object_or_404(Post, uuid=post_id, author__id=author_id)
         if author.remote:
-            r = requests.get(author.node.make_url(f"authors/{author.extern_id}/posts/{post.extern_id}/comments?page={page_number}&size={size}"), auth=(author.node.our_username, author.node.our_password))
-            if not r.ok:
-                return Response(r.content, status=r.status_code)
-            else:
-                return JsonResponse(r.json(), status=r.status_code)
+            try:
+                data = remote_json(author.node, f"authors/{author.extern_id}/posts/{post.extern_id}/comments",
+                                   page_number, size)
+            except RemoteFetchError as e:
+                return Response(e.content, status=e.status)
+            return JsonResponse(data, safe=False)
         else:
-            comments_query = Comment.objects.filter(post=post).order_by("-published")
-            if page_number is False:
-                return size
-
-            paginator = Paginator(comments_query, per_page=size)
-
-            if page_number <= paginator.num_pages:
-                page = paginator.get_page(page_number)
-                # this is 1-indexed so this is fine
-                comments = []
-                for comment in page:
-                    serializer = CommentSerializer(comment)
-                    comment_data = serializer.data
-                    comments.append(comment_data)
-
-                data = {
-                    "type": "comments",
-                    "page": page_number,
-                    "size": size,
-                    "post": PostSerializer(post).get_id(post),
-                    "id" : PostSerializer(post).get_id(post) + "comments",
-                    "comments": comments
-                }
+            comments_query = Comment.objects.filter(post=post).select_related("author__user", "author__node")
+            page, extra = paginate(request, comments_query, ("-published", "-uuid"))
+            if page is False:
+                return extra
 
-                return Response(data, status=status.HTTP_200_OK)
-            else:
-                return HttpResponseNotFound("404 not found")
+            validators = page_validators(request, page, related=("author",))
+            response = not_modified(request, validators)
+            if response is not None:
+                return response
+
+            comments = [comment_to_dict(comment) for comment in page]
+
+            data = {
+                "type": "comments",
+                **(extra if "cursor" in request.GET else {"page": page_number, "size": size}),
+                "post": PostSerializer(post).get_id(post),
+                "id" : PostSerializer(post).get_id(post) + "comments",
+                "comments": comments
+            }
+
+            return with_validators(Response(data, status=status.HTTP_200_OK), validators)
 
 
     @extend_schema(
         request=CommentSerializer,
-        responses={201: CommentSerializer, 400: None},
+        responses={201: CommentSerializer, 202: None, 400: None},
         description="This endpoint is used to add a new comment on specific post",
         summary="Create a new comment",
     )
@@ -794,14 +832,11 @@ class CommentList(APIView):
                     "published": datetime.now().isoformat() + "Z",
                     "id": author.node.make_url(f"authors/{author.extern_id}/posts/{post.extern_id}/comments/{comment.uuid}")
                 }
-                print (body)
 
-                r = requests.post(author.node.make_url(f"authors/{author.extern_id}/inbox"),json=body, auth=(author.node.our_username,author.node.our_password))
-                if not r.ok:
-                    return Response(r.content, status=r.status_code)
-                return Response({"message": "Comment successfully posted to remote author."}, status=status.HTTP_201_CREATED)
+                enqueue(author.node, f"authors/{author.extern_id}/inbox", body)
+                return Response({"message": "Comment queued for delivery to remote author."}, status=status.HTTP_202_ACCEPTED)
             else:
-                Notification.objects.create(recipient=author,data=serializer.data,type="comment")
+                Notification.reference(author, "comment", comment).save()
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
         else:
 
@@ -819,26 +854,24 @@ class  LikePostView(APIView):
         author = Author.objects.get(id=UUID(author_id))
         post = Post.objects.get(uuid =UUID(post_id))
         if author.remote:
-            r = requests.get(author.node.make_url(f"authors/{author.extern_id}/posts/{post.extern_id}/likes"), auth=(author.node.our_username, author.node.our_password))
-            if not r.ok:
-                return Response(r.content, status=r.status_code)
+            try:
+                like_data = remote_json(author.node, f"authors/{author.extern_id}/posts/{post.extern_id}/likes")
+            except RemoteFetchError as e:
+                return Response(e.content, status=e.status)
+            if isinstance(like_data, list):
+                return JsonResponse({"type": "Like", "items": like_data})
             else:
-                like_data = r.json()
-                if isinstance(like_data, list):
-                    formatted_response = {"type": "Like", "items": like_data}
-                    return Response(formatted_response, status=r.status_code) 
-                else:
-                    return JsonResponse(r.json(), status=r.status_code)
+                return JsonResponse(like_data)
         else:
-            likes = Like.objects.filter(object_id=post_id, object_type="post")
-            serializer = LikeSerializer(likes, many=True)
+            likes = Like.objects.filter(object_id=post_id, object_type="post").select_related("author__user", "author__node")
             return JsonResponse({"type" : "Like" ,
-                                "items": serializer.data})
+                                "items": likes_to_dicts(likes)})
 
     @extend_schema(
         request=None,  # Assuming no request body for POST
         responses={
             201: None,  # No content for successful like addition
+            202: None,  # Like queued for delivery to a remote author
             409: OpenApiResponse(response="Already Liked"),
         },
         description="This endpoint is used to add a like to a specific post.",
@@ -858,19 +891,15 @@ class  LikePostView(APIView):
                 "author": author_serializer,
                 "object": inbox_author.node.make_url(f"authors/{inbox_author.extern_id}/posts/{post.extern_id}"),
             }
-            r = requests.post(inbox_author.node.make_url(f"authors/{inbox_author.extern_id}/inbox"),json=body,auth=(inbox_author.node.our_username,inbox_author.node.our_password))
-            if not r.ok:
-                return Response(r.content, status=r.status_code)
-            else:
-                return Response(status=r.status_code)
-            
+            enqueue(inbox_author.node, f"authors/{inbox_author.extern_id}/inbox", body)
+            return Response({"message": "Like queued for delivery"}, status=status.HTTP_202_ACCEPTED)
+
         else:
             like, created = Like.objects.get_or_create(
                 object_id=post_id, author=author, object_type="post"
             )
             if created:
-                serializer = LikeSerializer(like)
-                Notification.objects.create(recipient=inbox_author,data=serializer.data,type="Like")
+                Notification.reference(inbox_author, "Like", like).save()
                 return Response({"message": "Liked"}, status=status.HTTP_201_CREATED)
             else:
                 return Response({"error": "Already liked"}, status=status.HTTP_409_CONFLICT)
@@ -911,37 +940,36 @@ class LikeCommentView(APIView):
         if Comment.objects.filter(uuid = comment_id).exists():
             comment = Comment.objects.get(uuid=comment_id)
             if comment.author.remote:
-                print("i was here i am remote")
-                r = requests.get(comment.author.node.make_url(f"authors/{author.id}/posts/{post.uuid}/comments/{comment.extern_id}/likes"), auth=(comment.author.node.our_username,comment.author.node.our_password))
-                if not r.ok:
-                    return Response(r.content, status=r.status_code)
+                try:
+                    likes_data = remote_json(comment.author.node,
+                                             f"authors/{author.id}/posts/{post.uuid}/comments/{comment.extern_id}/likes")
+                except RemoteFetchError as e:
+                    return Response(e.content, status=e.status)
+                if isinstance(likes_data, list):
+                    return JsonResponse({"type": "Like", "items": likes_data})
                 else:
-                    likes_data = r.json()
-                    if isinstance(likes_data, list):
-                        return Response({"type": "Like", "items": likes_data}, status=r.status_code)
-                    else:
-                        return Response(likes_data,status=r.status_code)
+                    return JsonResponse(likes_data)
             else:
                 print("i was here")
-                likes = Like.objects.filter(object_id=comment_id, object_type="comment")
-                serializer = LikeSerializer(likes, many=True)
+                likes = Like.objects.filter(object_id=comment_id, object_type="comment").select_related(
+                    "author__user", "author__node")
                 return JsonResponse({"type" : "Like" ,
-                                    "items": serializer.data})
+                                    "items": likes_to_dicts(likes)})
                
         else:
-            r = requests.get(author.node.make_url(f"authors/{author.extern_id}/posts/{post.extern_id}/comments/{comment_id}/likes"), auth=(author.node.our_username, author.node.our_password))
-            if not r.ok:
-                return Response(r.content, status=r.status_code)
+            try:
+                likes_data = remote_json(author.node,
+                                         f"authors/{author.extern_id}/posts/{post.extern_id}/comments/{comment_id}/likes")
+            except RemoteFetchError as e:
+                return Response(e.content, status=e.status)
+            if isinstance(likes_data, list):
+                return JsonResponse({"type": "Like", "items": likes_data})
             else:
-                likes_data = r.json()
-                if isinstance(likes_data, list):
-                    return Response({"type": "Like", "items": likes_data}, status=r.status_code)
-                else:
-                    return Response(likes_data,status=r.status_code)
+                return JsonResponse(likes_data)
 
     @extend_schema(
         request=None,
-        responses={201: None, 409: OpenApiResponse(response="Already Liked")},
+        responses={201: None, 202: None, 409: OpenApiResponse(response="Already Liked")},
         description="This endpoint is used to add a like to a specific comment. Returns 409 if already liked.",
         summary="Post like to comment",
     )
@@ -991,20 +1019,15 @@ class LikeCommentView(APIView):
                     "object": commenting_author.node.make_url(f"authors/{commenting_author.extern_id}/posts/{post.extern_id}/comments/{comment_id}"),
                 }
 
-            print (body)
-            r = requests.post(commenting_author.node.make_url(f"authors/{commenting_author.extern_id}/inbox"),json=body,auth=(commenting_author.node.our_username,commenting_author.node.our_password))
-            if not r.ok:
-                return Response(r.content, status=r.status_code)
-            else:
-                return Response(r.json(), status=r.status_code)
+            enqueue(commenting_author.node, f"authors/{commenting_author.extern_id}/inbox", body)
+            return Response({"message": "Like queued for delivery"}, status=status.HTTP_202_ACCEPTED)
         else:
             print("should not be here")
             like, created = Like.objects.get_or_create(
                 object_id=comment_id, author=logged_author, object_type="comment"
             )
             if created:
-                serializer = LikeSerializer(like)
-                Notification.objects.create(recipient=commenting_author,data=serializer.data,type="Like")
+                Notification.reference(commenting_author, "Like", like).save()
                 return Response({"message": "Liked"}, status=status.HTTP_201_CREATED)
             else:
                 return Response({"error": "Already liked"}, status=status.HTTP_409_CONFLICT)
@@ -1015,14 +1038,28 @@ class LikeCommentView(APIView):
 class GetAuthorLikedAPIView(APIView):
     authentication_classes = [BasicAuthentication]
 
+    ordering = ("-published", "-id")
+
     @extend_schema(
+        parameters=[
+            OpenApiParameter(name="page", description="Page number of the paginated list", required=False, type=int),
+            OpenApiParameter(name="size", description="Number of items per page", required=False, type=int),
+            OpenApiParameter(
+                name="cursor",
+                description="Opaque cursor from the `next` field of a previous page, empty for the first page. "
+                "Replaces `page` with keyset pagination.",
+                required=False,
+                type=str,
+            ),
+        ],
         responses={
             200: OpenApiResponse(
-                description="A list of items liked by the author",
+                description="A list of items liked by the author, newest first",
                 response="Liked Items",
             )
         },
-        description="This endpoint is used to retrieve items liked by a specific author.",
+        description="This endpoint is used to retrieve items liked by a specific author. Without `page`, `size` "
+        "or `cursor`, the first page is returned together with the cursor of the next one.",
         summary="Retrieves author likes",
     )
     def get(self, request, author_id):
@@ -1031,16 +1068,22 @@ class GetAuthorLikedAPIView(APIView):
         except Author.DoesNotExist:
             return Response({"error": "Author not found"}, status=404)
 
-        likes_by_author = Like.objects.filter(author=author)
-        liked_posts_comments = []
-
-        for like in likes_by_author:
-            item = LikeSerializer(like)
-            liked_posts_comments.append(item.data)
+        likes_by_author = Like.objects.filter(author=author).select_related("author__user", "author__node")
+        if {"page", "size", "cursor"} & request.GET.keys():
+            likes, extra = paginate(request, likes_by_author, self.ordering)
+            if likes is False:
+                return extra
+            if "cursor" not in request.GET:
+                extra = {"page": int(request.GET["page"]), "size": int(request.GET["size"])}
+        else:
+            size = settings.LIKED_PAGE_SIZE
+            likes, next_cursor = keyset_page(likes_by_author, self.ordering, None, size)
+            extra = {"size": size, "next": next_cursor}
 
         response = {
             "type": "Liked",
-            "items": liked_posts_comments
+            **extra,
+            "items": likes_to_dicts(likes),
         }
 
         return Response(response, status=status.HTTP_200_OK)
@@ -1048,12 +1091,22 @@ class GetAuthorLikedAPIView(APIView):
 
 @api_view(["GET"])
 def image_post_view(request, author_id, post_id):
-    post = get_object_or_404(Post, pk=UUID(post_id))
+    post = get_object_or_404(Post.objects.defer("content"), pk=UUID(post_id))
     if not post.is_image():
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-    return HttpResponse(
-        base64.b64decode(post.content),
-        status=status.HTTP_200_OK,
-        content_type=post.get_content_type_display().rstrip(";base64"),
-    )
+    content_type = post.get_content_type_display().removesuffix(";base64")
+    if not post.image_hash:
+        # content that could not be decoded when it was saved
+        return HttpResponse(base64.b64decode(post.content), status=status.HTTP_200_OK, content_type=content_type)
+
+    width = None
+    if "w" in request.GET:
+        try:
+            width = variant_width(int(request.GET["w"]))
+        except ValueError:
+            return HttpResponseBadRequest("Width must be an integer")
+
+    # `?v=<image hash>` URLs can never change, so only they are cached as immutable
+    return serve_image(request, post.image_hash, content_type,
+                       immutable=request.GET.get("v") == post.image_hash, width=width)
@@ -1,3 +1,257 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import unittest
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from api.feed import feed_page
+from api.models import Author, Comment, Node, Post, TimelineEntry
+from api.search import ensure_index
+from api.tests import QueryBudgetTestCase, setup_authors, make_basic_header
+
+
+def make_post(author: Author, visibility: Post.Visibility, title: str = "post") -> Post:
+    return Post.objects.create(title=title, description="", content="content", author=author,
+                               visibility=visibility, content_type=Post.ContentType.PLAIN)
+
+
+class GlobalPostsTestCase(TestCase):
+    def setUp(self):
+        self.viewer, self.friend, self.follower, self.stranger = setup_authors(4)
+        self.viewer.follow(self.friend)
+        self.friend.follow(self.viewer)
+        self.follower.follow(self.viewer)
+
+        node_admin = User.objects.create_user("node", password="admin")
+        node = Node.objects.create(host="https://www.example.com/srv/", user=node_admin)
+        self.remote = Author.objects.create(extern_id="remote", node=node, is_approved=True)
+        self.remote.follow(self.viewer)
+
+        self.visible = {
+            make_post(self.stranger, Post.Visibility.PUBLIC).uuid.hex,
+            make_post(self.friend, Post.Visibility.FRIENDS).uuid.hex,
+            make_post(self.remote, Post.Visibility.FRIENDS).uuid.hex,
+            make_post(self.viewer, Post.Visibility.UNLISTED).uuid.hex,
+            make_post(self.viewer, Post.Visibility.FRIENDS).uuid.hex,
+        }
+        self.hidden = {
+            make_post(self.follower, Post.Visibility.FRIENDS).uuid.hex,
+            make_post(self.stranger, Post.Visibility.FRIENDS).uuid.hex,
+            make_post(self.friend, Post.Visibility.UNLISTED).uuid.hex,
+        }
+
+    def get_ids(self, url, author=None):
+        headers = {}
+        if author is not None:
+            username = author.user.username
+            headers["Authorization"] = make_basic_header(username, username + "pwd")
+        r = self.client.get(url, headers=headers)
+        self.assertEqual(r.status_code, 200)
+        return [item["id"].split("/")[-1] for item in json.loads(r.content)["items"]]
+
+    def test_visibility(self):
+        ids = self.get_ids("/api/ext/posts/?size=100", self.viewer)
+        self.assertEqual(set(ids), self.visible)
+
+    def test_anonymous(self):
+        ids = self.get_ids("/api/ext/posts/?size=100")
+        self.assertEqual(len(ids), 1)
+
+    def test_pagination(self):
+        ids = self.get_ids("/api/ext/posts/?size=2&page=1", self.viewer)
+        ids += self.get_ids("/api/ext/posts/?size=2&page=2", self.viewer)
+        ids += self.get_ids("/api/ext/posts/?size=2&page=3", self.viewer)
+        self.assertEqual(len(ids), 5)
+        self.assertEqual(set(ids), self.visible)
+
+    def test_not_modified(self):
+        r = self.client.get("/api/ext/posts/?size=100")
+        r = self.client.get("/api/ext/posts/?size=100", headers={"If-None-Match": r["ETag"]})
+        self.assertEqual(r.status_code, 304)
+
+        make_post(self.stranger, Post.Visibility.PUBLIC)
+        r = self.client.get("/api/ext/posts/?size=100", headers={"If-None-Match": r["ETag"]})
+        self.assertEqual(r.status_code, 200)
+
+    def test_search_visibility(self):
+        ids = self.get_ids("/api/ext/search?q=content&size=100", self.viewer)
+        self.assertEqual(set(ids), self.visible)
+        self.assertEqual(len(self.get_ids("/api/ext/search?q=content&size=100")), 1)
+
+    def test_post_count(self):
+        # the posts of the feed, where authors with several friends still have each of their posts counted once
+        for other in setup_authors(3):
+            for author in (self.stranger, self.friend):
+                author.follow(other)
+                other.follow(author)
+        username = self.viewer.user.username
+        r = self.client.get("/api/ext/post_count", headers={"Authorization": make_basic_header(username, username + "pwd")})
+        self.assertEqual(r.json(), {"count": len(self.visible)})
+
+    def test_single_feed_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            feed_page(self.viewer, 1, 40)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+
+class TimelineTestCase(TestCase):
+    def setUp(self):
+        self.reader, self.writer = setup_authors(2)
+        username = self.reader.user.username
+        self.headers = {"Authorization": make_basic_header(username, username + "pwd")}
+        self.url = f"/api/ext/authors/{self.reader.id}/timeline"
+
+    def timeline(self):
+        return set(TimelineEntry.objects.filter(owner=self.reader).values_list("post_id", flat=True))
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        public = make_post(self.writer, Post.Visibility.PUBLIC)
+        make_post(self.writer, Post.Visibility.FRIENDS)
+        make_post(self.writer, Post.Visibility.UNLISTED)
+        self.assertEqual(self.timeline(), set())
+
+        self.reader.follow(self.writer)
+        self.assertEqual(self.timeline(), {public.uuid})
+
+        self.reader.unfollow(self.writer)
+        self.assertEqual(self.timeline(), set())
+
+    def test_friends_posts(self):
+        friends_only = make_post(self.writer, Post.Visibility.FRIENDS)
+        self.reader.follow(self.writer)
+        self.assertEqual(self.timeline(), set())
+
+        self.writer.follow(self.reader)
+        self.assertEqual(self.timeline(), {friends_only.uuid})
+
+    def test_fan_out_on_post(self):
+        self.reader.follow(self.writer)
+        username = self.writer.user.username
+        r = self.client.post(f"/api/authors/{self.writer.id.hex}/posts/",
+                             data={"title": "t", "description": "d", "content": "c", "contentType": "text/plain",
+                                   "visibility": "PUBLIC"},
+                             headers={"Authorization": make_basic_header(username, username + "pwd")})
+        self.assertEqual(r.status_code, 200)
+
+        r = self.client.get(f"{self.url}?page=1&size=10", headers=self.headers)
+        self.assertEqual(r.status_code, 200)
+        items = json.loads(r.content)["items"]
+        self.assertEqual(len(items), 1)
+        self.assertEqual(items[0]["title"], "t")
+
+    def test_only_owner(self):
+        r = self.client.get(f"{self.url}?page=1&size=10")
+        self.assertEqual(r.status_code, 403)
+
+    @override_settings(TIMELINE_MAX_ENTRIES=2)
+    def test_cap(self):
+        self.reader.follow(self.writer)
+        posts = [make_post(self.writer, Post.Visibility.PUBLIC) for _ in range(3)]
+        for post in posts:
+            TimelineEntry.fan_out(post)
+        self.assertEqual(len(self.timeline()), 2)
+        self.assertNotIn(posts[0].uuid, self.timeline())
+
+    def test_migration_backfill(self):
+        migration = importlib.import_module("api.migrations.0006_timelineentry")
+        own = make_post(self.reader, Post.Visibility.UNLISTED)
+        public = make_post(self.writer, Post.Visibility.PUBLIC)
+        friends_only = make_post(self.writer, Post.Visibility.FRIENDS)
+        self.reader.follow(self.writer)
+        self.writer.follow(self.reader)
+        TimelineEntry.objects.all().delete()
+
+        migration.populate_timelines(django_apps, None)
+        self.assertEqual(self.timeline(), {own.uuid, public.uuid, friends_only.uuid})
+        expected = set(TimelineEntry.objects.values_list("owner_id", "post_id"))
+        call_command("rebuild_timelines", stdout=io.StringIO())
+        self.assertEqual(set(TimelineEntry.objects.values_list("owner_id", "post_id")), expected)
+
+
+class SearchTestCase(TestCase):
+    def setUp(self):
+        self.author = setup_authors(1)[0]
+        self.post = Post.objects.create(title="Sourdough starter", description="feeding schedules",
+                                        content="Flour and water, twice a day.", author=self.author,
+                                        visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.MARKDOWN)
+        self.other = Post.objects.create(title="Bread", description="", content="A sourdough loaf",
+                                         author=self.author, visibility=Post.Visibility.PUBLIC,
+                                         content_type=Post.ContentType.PLAIN)
+
+    def search(self, q: str) -> list[str]:
+        r = self.client.get("/api/ext/search", {"q": q})
+        self.assertEqual(r.status_code, 200)
+        return [item["id"].split("/")[-1] for item in json.loads(r.content)["items"]]
+
+    def test_ranked(self):
+        # a title match ranks above a body match
+        self.assertEqual(self.search("sourdough"), [self.post.uuid.hex, self.other.uuid.hex])
+        self.assertEqual(self.search("FEEDING flour"), [self.post.uuid.hex])
+        self.assertEqual(self.search("sourd"), [self.post.uuid.hex, self.other.uuid.hex])
+        self.assertEqual(self.search("rye"), [])
+
+    def test_comments(self):
+        comment = Comment.objects.create(post=self.post, author=self.author, comment="Try rye flour")
+        self.assertEqual(self.search("rye"), [comment.uuid.hex])
+
+        comment.comment = "Try spelt"
+        comment.save()
+        self.assertEqual(self.search("rye"), [])
+        self.assertEqual(self.search("spelt"), [comment.uuid.hex])
+
+        self.post.visibility = Post.Visibility.FRIENDS
+        self.post.save()
+        self.assertEqual(self.search("spelt"), [])
+
+    def test_kept_in_sync(self):
+        self.other.title = "Rye"
+        self.other.save()
+        self.assertEqual(self.search("rye"), [self.other.uuid.hex])
+        self.other.delete()
+        self.assertEqual(self.search("rye"), [])
+
+    def test_binary_content_not_indexed(self):
+        post = Post.objects.create(title="Loaf", description="", content="cnllIGxvYWY=", author=self.author,
+                                   visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.BASE64)
+        self.assertEqual(self.search("cnllIGxvYWY"), [])
+        self.assertEqual(self.search("loaf"), [post.uuid.hex, self.other.uuid.hex])
+
+    def test_query_syntax_is_not_interpreted(self):
+        for q in ['"sourdough', "sourdough OR", "title:bread", "NEAR(", "*"]:
+            r = self.client.get("/api/ext/search", {"q": q})
+            self.assertEqual(r.status_code, 200, q)
+        r = self.client.get("/api/ext/search")
+        self.assertEqual(r.status_code, 400)
+
+    @unittest.skipUnless(connection.vendor == "sqlite", "the FTS5 index only exists on SQLite")
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER search_post_insert")
+            cursor.execute("DELETE FROM search_fts")
+        ensure_index()
+        Post.objects.create(title="Rye", description="", content="", author=self.author,
+                            visibility=Post.Visibility.PUBLIC, content_type=Post.ContentType.PLAIN)
+        self.assertEqual(len(self.search("rye")), 1)
+
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM search_fts")
+        call_command("rebuild_search_index", stdout=io.StringIO())
+        self.assertEqual(len(self.search("sourdough")), 2)
+
+
+class ExtQueryBudgetTestCase(QueryBudgetTestCase):
+    budgets = {
+        "/api/ext/posts/?size=50": 3,
+        "/api/ext/search?q=comment&size=50": 5,
+        "/api/ext/authors/{author}/followers": 3,
+        "/api/ext/authors/{author}/following": 3,
+        "/api/ext/authors/{author}/friends": 3,
+        "/api/ext/authors/{author}/timeline?page=1&size=50": 5,
+        "/api/ext/comments/{srv}%2Fapi%2Fauthors%2F{author}%2Fposts%2F{post}": 3,
+    }
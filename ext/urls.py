@@ -9,8 +9,11 @@ urlpatterns = [
     path("requests/<path:foreign_id>", views.RequestsView.as_view()),
     path("remote_authors_scan", views.RemoteAuthorsScan.as_view(), name="remote-authors-scan"),
     path("posts/", views.GlobalPostsView.as_view()),
+    path("search", views.SearchView.as_view(), name="search"),
     path("authors/<author_id>/followers", views.AuthorFollowersView.as_view(), name='author-followers'),
     path("authors/<author_id>/following", views.AuthorFollowingView.as_view(), name='author-following'),
     path("authors/<author_id>/friends", views.AuthorFriendsView.as_view(), name='author-friends'),
+    path("authors/<author_id>/timeline", views.TimelineView.as_view(), name='author-timeline'),
     path("comments/<path:foreign_id>", views.comments, name="comments"),
+    path("federation/stats", views.federation_stats, name="federation-stats"),
 ]
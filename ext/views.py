@@ -3,29 +3,45 @@ from datetime import datetime
 from uuid import UUID
 
 import pytz
-import requests
-from django.core.paginator import Paginator
-from django.http import HttpResponseNotFound, JsonResponse
+from django.http import HttpResponseBadRequest, HttpResponseNotFound
 from django.shortcuts import get_object_or_404
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 from rest_framework import status
 from rest_framework.authentication import BasicAuthentication
-from rest_framework.decorators import api_view, authentication_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from api.models import Post, Author, Notification, Node, Comment
-from api.serializers import PostSerializer, author_to_json, CommentSerializer, AuthorSerializer
+from api.conditional import not_modified, page_validators, with_validators
+from api.fast_serializers import author_to_dict, comment_to_dict, post_to_dict
+from api.federation import client_for, pool_stats
+from api.feed import feed_page, visible_posts
+from api.models import Post, Author, Notification, Comment, TimelineEntry
+from api.pagination import paginate
+from api.renderers import JsonResponse
+from api.remote_authors import last_scan, start_background_scan
+from api.remote_cache import RemoteFetchError, remote_json, remote_post_count
+from api.search import search
+from api.serializers import authors_to_json
 from web_dev_noobs_be.settings import SRV_URL
 
 
-# TODO remote
 @api_view(["GET"])
 @authentication_classes([BasicAuthentication])
 def author_post_count(request, author_id):
     if not request.user.is_authenticated:
         return Response(status=status.HTTP_401_UNAUTHORIZED)
 
+    author = Author.objects.filter(id=UUID(author_id)).select_related("node").first()
+    if author is not None and author.remote:
+        try:
+            count, exact = remote_post_count(author)
+        except RemoteFetchError as e:
+            return Response(e.content, status=e.status)
+        # only the newest REMOTE_POSTS_MAX posts of a remote author are kept, beyond that the count is a lower bound
+        return Response({"count": count, "exact": exact}, status=status.HTTP_200_OK)
+
     count = Post.objects.filter(author__id=UUID(author_id)).count()
     return Response({"count": count}, status=status.HTTP_200_OK)
 
@@ -38,16 +54,17 @@ def post_count(request):
     if request.user.author is None:
         return Response(status=status.HTTP_403_FORBIDDEN)
 
-    followers_posts = Post.objects.filter(visibility=Post.Visibility.FRIENDS, author__followers=request.user.author)
-    public_count = Post.objects.filter(visibility=Post.Visibility.PUBLIC).count()
-    count = public_count
-
-    for p in followers_posts:
-        if p.author.is_friend(request.user):
-            count += 1
+    # the posts of the global feed
+    count = visible_posts(request.user.author).count()
 
     return Response({"count": count}, status=status.HTTP_200_OK)
 
+@api_view(["GET"])
+@authentication_classes([BasicAuthentication])
+@permission_classes([IsAdminUser])
+def federation_stats(request):
+    return Response({"clients": pool_stats()}, status=status.HTTP_200_OK)
+
 @api_view(["GET"])
 @authentication_classes([BasicAuthentication])
 def comments(request, foreign_id):
@@ -69,15 +86,16 @@ def comments(request, foreign_id):
     size = 100
     if host == SRV_URL + "/api/":
         post = get_object_or_404(Post, uuid=UUID(post_id))
-        comments_query = Comment.objects.filter(post=post).order_by("-published")
-        c_data = []
-        for c in comments_query:
-            c_data.append(CommentSerializer(c).data)
+        comments_query = Comment.objects.filter(post=post).select_related("author__user", "author__node")
+        c_data = [comment_to_dict(c) for c in comments_query.order_by("-published")]
         return JsonResponse({"comments": c_data}, status=status.HTTP_200_OK)
     else:
-        author = get_object_or_404(Author, node__host=host, extern_id=author_id)
-        r = author.node.r_get(f"/{id_postfix}/comments?size={size}&page={page}")
-        return JsonResponse(r.json(), status=status.HTTP_200_OK)
+        author = get_object_or_404(Author.objects.select_related("node"), node__host=host, extern_id=author_id)
+        try:
+            data = remote_json(author.node, f"{id_postfix}/comments", page, size)
+        except RemoteFetchError as e:
+            return Response(e.content, status=e.status)
+        return JsonResponse(data, status=status.HTTP_200_OK, safe=False)
 
 
 class GetGithubActivity(APIView):
@@ -85,7 +103,7 @@ class GetGithubActivity(APIView):
 
     @staticmethod
     def create_post(description, content, author):
-        Post.objects.create(
+        post = Post.objects.create(
             title="Github Event",
             description=description,
             content=content,
@@ -93,6 +111,7 @@ class GetGithubActivity(APIView):
             visibility=Post.Visibility.PUBLIC,
             content_type=Post.ContentType.PLAIN
         )
+        TimelineEntry.fan_out(post)
 
     @staticmethod
     def get_content(e):
@@ -141,7 +160,7 @@ class GetGithubActivity(APIView):
 
         url = "https://api.github.com/users/" + github_username + "/events/public"
 
-        response = requests.get(url)
+        response = client_for().get(url)
 
         if response.status_code == 200:
             all_events = response.json()
@@ -175,23 +194,16 @@ class RequestsView(APIView):
 
 class RemoteAuthorsScan(APIView):
     @staticmethod
+    @extend_schema(
+        summary="Scan remote nodes for authors",
+        description="Starts a background crawl of every node's author list, unless one ran recently. "
+                    "Returns the report of the last finished scan.",
+        responses={202: OpenApiResponse(description="Scan started or skipped")},
+    )
     def get(request):
-        all_nodes = Node.objects.all()
-        for node in all_nodes:
-            r = node.r_get("authors/?page=1&size=200")
-            if not r.ok:
-                continue
-            data = r.json()
-            authors = data.get('items', [])
-            print(authors)
-            for author in authors:
-                author_id = author['id'].split('/').pop()
-                _, created = Author.objects.get_or_create(
-                    extern_id=author_id,
-                    node=node,
-                    remote_name=author.get("displayName"),
-                )
-        return Response({"message": "Authors fetched successfully"}, status=status.HTTP_200_OK)
+        started = start_background_scan()
+        return Response({"message": "Authors scan started" if started else "Authors scan skipped",
+                         "last_scan": last_scan()}, status=status.HTTP_202_ACCEPTED)
 
 
 class GlobalPostsView(APIView):
@@ -199,48 +211,70 @@ class GlobalPostsView(APIView):
 
     @staticmethod
     def get(request):
-        # fetching all posts initially
-        posts_query = Post.objects.all().order_by("-published")
-        page_size = request.query_params.get('size', 40)
-        page_number = request.query_params.get('page', 1)
+        try:
+            page_size = int(request.query_params.get('size', 40))
+            page_number = int(request.query_params.get('page', 1))
+        except ValueError:
+            return HttpResponseNotFound("Pagination error")
+        if page_size < 1 or page_number < 1:
+            return HttpResponseNotFound("Pagination error")
 
+        # anonymous users and users without an author only see public posts
+        requesting_author = None
         if request.user.is_authenticated:
-            try:
-                requesting_author = Author.objects.get(user=request.user)
-                # filtering posts based on visibility and friends
-                filtered_posts = []
-                for post in posts_query:
-                    if post.visibility == Post.Visibility.PUBLIC:
-                        filtered_posts.append(post)
-                    elif post.visibility == Post.Visibility.FRIENDS and requesting_author.is_friend(post.author):
-                        filtered_posts.append(post)
-                    elif post.author == requesting_author:
-                        # showing all posts if author is viewing their own posts
-                        filtered_posts.append(post)
-                posts_query = filtered_posts
-            except Author.DoesNotExist:
-                # if requesting author not found shows only public posts
-                posts_query = posts_query.filter(visibility=Post.Visibility.PUBLIC)
-        else:
-            # show only public posts if user not authenticated
-            posts_query = posts_query.filter(visibility=Post.Visibility.PUBLIC)
+            requesting_author = Author.objects.filter(user=request.user).first()
+
+        posts = feed_page(requesting_author, page_number, page_size)
+        validators = page_validators(request, posts, related=("author",))
+        response = not_modified(request, validators)
+        if response is not None:
+            return response
+        return with_validators(JsonResponse({"type": "posts", "items": [post_to_dict(post) for post in posts]}),
+                               validators)
 
-        paginator = Paginator(posts_query, page_size)
+
+class SearchView(APIView):
+    authentication_classes = [BasicAuthentication]
+
+    @staticmethod
+    @extend_schema(
+        summary="Search posts and comments",
+        description="Posts and comments matching the words of `q`, most relevant first, paginated with `page` "
+                    "(default 1) and `size` (default 20). Only what the requesting author may see in the feed is "
+                    "returned; comments are visible when their post is.",
+        responses={
+            200: OpenApiResponse(description="A page of posts and comments"),
+            400: OpenApiResponse(description="Missing query or invalid pagination"),
+        },
+    )
+    def get(request):
+        text = request.query_params.get("q", "").strip()
+        if not text:
+            return HttpResponseBadRequest("A query must be provided with q")
         try:
-            page_obj = paginator.page(page_number)
+            page_size = int(request.query_params.get("size", 20))
+            page_number = int(request.query_params.get("page", 1))
         except ValueError:
-            return HttpResponseNotFound("Pagination error")
+            return HttpResponseBadRequest("Page number and size must be integers")
+        if page_size < 1 or page_number < 1:
+            return HttpResponseBadRequest("Page number and size must be greater than 0")
 
-        serialized_posts = PostSerializer(page_obj.object_list, many=True)
-        return JsonResponse({"type": "posts", "items": serialized_posts.data})
+        requesting_author = None
+        if request.user.is_authenticated:
+            requesting_author = Author.objects.filter(user=request.user).first()
+
+        results = search(text, requesting_author, page_number, page_size)
+        items = [post_to_dict(row) if isinstance(row, Post) else comment_to_dict(row) for row in results]
+        return JsonResponse({"type": "search", "query": text, "page": page_number, "size": page_size,
+                             "items": items})
 
 
 class AuthorFollowersView(APIView):
     @staticmethod
     def get(request, author_id):
         author = get_object_or_404(Author, id=UUID(author_id))
-        followers = author.followers.all()
-        serialized_followers = [author_to_json(follower) for follower in followers if follower is not None]
+        followers = author.followers.select_related("user", "node")
+        serialized_followers = authors_to_json(followers)
         response_data = {"type": "followers", "items": serialized_followers}
         return Response(response_data)
 
@@ -249,8 +283,8 @@ class AuthorFollowingView(APIView):
     @staticmethod
     def get(request, author_id):
         author = get_object_or_404(Author, id=UUID(author_id))
-        following = author.following.all()
-        serialized_following = [author_to_json(followed) for followed in following if followed is not None]
+        following = author.following.select_related("user", "node")
+        serialized_following = authors_to_json(following)
         response_data = {"type": "following", "items": serialized_following}
         return Response(response_data)
 
@@ -259,7 +293,34 @@ class AuthorFriendsView(APIView):
     @staticmethod
     def get(request, author_id):
         author = get_object_or_404(Author, id=UUID(author_id))
-        friends = author.get_friends()
-        serialized_friends = [AuthorSerializer(friend).data for friend in friends if friend is not None]
+        friends = author.get_friends().select_related("user", "node")
+        serialized_friends = [author_to_dict(friend) for friend in friends if friend is not None]
         response_data = {"type": "friends", "items": serialized_friends}
         return Response(response_data,status=status.HTTP_200_OK)
+
+
+class TimelineView(APIView):
+    authentication_classes = [BasicAuthentication]
+
+    @staticmethod
+    @extend_schema(
+        summary="Retrieve an author's home timeline",
+        description="Posts of the authors followed by AUTHOR_ID (and their own), newest first. Supports `page`/`size` "
+                    "and `cursor`/`size` pagination. Only available to the author themselves.",
+        responses={
+            200: OpenApiResponse(description="A page of posts"),
+            403: OpenApiResponse(description="Not authenticated as the author"),
+        },
+    )
+    def get(request, author_id):
+        author = get_object_or_404(Author, id=UUID(author_id))
+        if author.remote or request.user != author.user:
+            return Response(status=status.HTTP_403_FORBIDDEN)
+
+        entries = TimelineEntry.objects.filter(owner=author).select_related("post__author__user", "post__author__node")
+        entries, extra = paginate(request, entries, ("-published", "-post_id"))
+        if entries is False:
+            return extra
+
+        serialized_posts = [post_to_dict(entry.post) for entry in entries]
+        return JsonResponse({"type": "posts", "items": serialized_posts, **extra})
@@ -158,6 +158,18 @@ REST_FRAMEWORK = {
         "rest_framework.authentication.BasicAuthentication",
     ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",  # Add any other global settings for DRF here
+    # orjson-backed when installed, stdlib json otherwise
+    "DEFAULT_RENDERER_CLASSES": (
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "api.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
+    # unreachable nodes answer 502/503/504 instead of 500
+    "EXCEPTION_HANDLER": "api.exceptions.exception_handler",
 }
 
 # Internationalization
@@ -195,5 +207,103 @@ PORT = 8000 if PORT is None else int(PORT)
 
 SRV_URL = "http://" + URL_BASE + ":" + str(PORT) if os.getenv("SRV_URL", None) is None else str(os.getenv("SRV_URL"))
 
+# outbound requests to other nodes (see api.federation)
+FEDERATION_CONNECT_TIMEOUT = float(os.getenv("FEDERATION_CONNECT_TIMEOUT", 3.05))
+FEDERATION_READ_TIMEOUT = float(os.getenv("FEDERATION_READ_TIMEOUT", 10))
+FEDERATION_RETRIES = int(os.getenv("FEDERATION_RETRIES", 2))
+FEDERATION_BACKOFF = float(os.getenv("FEDERATION_BACKOFF", 0.25))
+FEDERATION_POOL_SIZE = int(os.getenv("FEDERATION_POOL_SIZE", 10))
+FEDERATION_MAX_WORKERS = int(os.getenv("FEDERATION_MAX_WORKERS", 32))
+FEDERATION_NODE_CONCURRENCY = int(os.getenv("FEDERATION_NODE_CONCURRENCY", 8))
+FEDERATION_FANOUT_DEADLINE = float(os.getenv("FEDERATION_FANOUT_DEADLINE", 15))
+
+# per-node circuit breaker: the circuit opens when at least FEDERATION_BREAKER_THRESHOLD of the last
+# FEDERATION_BREAKER_WINDOW calls failed (errors, 5xx or slower than FEDERATION_SLOW_CALL seconds),
+# and lets a trial call through after FEDERATION_BREAKER_COOLDOWN seconds
+FEDERATION_BREAKER_WINDOW = int(os.getenv("FEDERATION_BREAKER_WINDOW", 20))
+FEDERATION_BREAKER_MIN_CALLS = int(os.getenv("FEDERATION_BREAKER_MIN_CALLS", 5))
+FEDERATION_BREAKER_THRESHOLD = float(os.getenv("FEDERATION_BREAKER_THRESHOLD", 0.5))
+FEDERATION_BREAKER_COOLDOWN = float(os.getenv("FEDERATION_BREAKER_COOLDOWN", 30))
+FEDERATION_SLOW_CALL = float(os.getenv("FEDERATION_SLOW_CALL", 5))
+# bulkhead: requests in flight to a single node, and how long to wait for a free slot
+FEDERATION_NODE_INFLIGHT = int(os.getenv("FEDERATION_NODE_INFLIGHT", 10))
+FEDERATION_BULKHEAD_WAIT = float(os.getenv("FEDERATION_BULKHEAD_WAIT", 0.5))
+
+# the cache of data fetched from other nodes (see api.remote_cache). The default is a per-process in-memory
+# cache; with several processes, point CACHE_BACKEND and CACHE_LOCATION at a shared cache so that they share
+# entries and invalidations, e.g. django.core.cache.backends.redis.RedisCache and redis://host:6379
+# (or a memcached backend). The table of a database cache is created after migrations (see api.apps).
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+if CACHES["default"]["BACKEND"].split(".")[-2] in ("locmem", "db"):
+    # other backends pass their OPTIONS on to their client and evict entries by themselves
+    CACHES["default"]["OPTIONS"] = {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", 10000))}
+
+# remote author profiles are revalidated after REMOTE_PROFILE_TTL seconds, and served stale while
+# their node is unreachable for up to REMOTE_PROFILE_STALE_TTL seconds
+REMOTE_PROFILE_TTL = int(os.getenv("REMOTE_PROFILE_TTL", 300))
+REMOTE_PROFILE_STALE_TTL = int(os.getenv("REMOTE_PROFILE_STALE_TTL", 24 * 60 * 60))
+
+# post listings of remote authors are refreshed in the background after REMOTE_POSTS_TTL seconds and
+# dropped after REMOTE_POSTS_STALE_TTL; at most REMOTE_POSTS_MAX posts are kept per author
+REMOTE_POSTS_TTL = int(os.getenv("REMOTE_POSTS_TTL", 60))
+REMOTE_POSTS_STALE_TTL = int(os.getenv("REMOTE_POSTS_STALE_TTL", 24 * 60 * 60))
+REMOTE_POSTS_PAGE_SIZE = int(os.getenv("REMOTE_POSTS_PAGE_SIZE", 50))
+REMOTE_POSTS_MAX = int(os.getenv("REMOTE_POSTS_MAX", 500))
+
+# comment and like listings of remote posts are refreshed in the background after REMOTE_JSON_TTL
+# seconds and dropped after REMOTE_JSON_STALE_TTL
+REMOTE_JSON_TTL = int(os.getenv("REMOTE_JSON_TTL", 30))
+REMOTE_JSON_STALE_TTL = int(os.getenv("REMOTE_JSON_STALE_TTL", 10 * 60))
+
+# remote author discovery (see api.remote_authors)
+REMOTE_SCAN_INTERVAL = int(os.getenv("REMOTE_SCAN_INTERVAL", 10 * 60))
+REMOTE_SCAN_DEADLINE = float(os.getenv("REMOTE_SCAN_DEADLINE", 120))
+REMOTE_SCAN_MAX_PAGES = int(os.getenv("REMOTE_SCAN_MAX_PAGES", 200))
+
+# outbound inbox deliveries (see api.outbox); retries back off exponentially from OUTBOX_RETRY_BASE
+# up to OUTBOX_RETRY_MAX seconds. The worker thread of a process only starts once it enqueues something,
+# so run `manage.py drain_outbox --loop` as well (the `worker` process of the Procfile); set
+# OUTBOX_WORKER=0 to only deliver that way. A pass claims a node's items for OUTBOX_LEASE seconds, which
+# must exceed OUTBOX_DRAIN_DEADLINE.
+OUTBOX_WORKER = os.getenv("OUTBOX_WORKER", "1") != "0"
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", 30))
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", 60 * 60))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 30))
+OUTBOX_DRAIN_DEADLINE = float(os.getenv("OUTBOX_DRAIN_DEADLINE", 60))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", 120))
+
+# content-addressed storage of the images of image posts (see api.image_store)
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", str(BASE_DIR / "media" / "images"))
+# resized variants served for `?w=`, an LRU cache of at most IMAGE_VARIANT_MAX_BYTES
+IMAGE_VARIANT_DIR = os.getenv("IMAGE_VARIANT_DIR", str(BASE_DIR / "media" / "variants"))
+IMAGE_VARIANT_WIDTHS = [int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "160,320,640,1280").split(",")]
+IMAGE_VARIANT_MAX_BYTES = int(os.getenv("IMAGE_VARIANT_MAX_BYTES", 512 * 1024 * 1024))
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", 85))
+# memory each process may use to cache the base64 encodings of recently serialized images
+IMAGE_BASE64_CACHE_BYTES = int(os.getenv("IMAGE_BASE64_CACHE_BYTES", 16 * 1024 * 1024))
+
+# likes returned by /authors/{id}/liked when the request does not ask for a page
+LIKED_PAGE_SIZE = int(os.getenv("LIKED_PAGE_SIZE", 100))
+
+# largest number of activities accepted by the bulk inbox (see api.inbox)
+INBOX_BATCH_MAX = int(os.getenv("INBOX_BATCH_MAX", 1000))
+# seconds during which a redelivered inbox activity is recognized as a replay (see InboxActivity)
+INBOX_DEDUP_RETENTION = int(os.getenv("INBOX_DEDUP_RETENTION", 7 * 24 * 60 * 60))
+
+# full-text search (see api.search): the most relevant SEARCH_MAX_RESULTS matches are considered, and
+# SEARCH_CONFIG is the Postgres text search configuration
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", 1000))
+SEARCH_CONFIG = os.getenv("SEARCH_CONFIG", "english")
+
+# maximum number of posts kept in each author's home timeline
+TIMELINE_MAX_ENTRIES = int(os.getenv("TIMELINE_MAX_ENTRIES", 1000))
+
 if USE_PROD:
     django_on_heroku.settings(locals(), logging=False)